@@ -0,0 +1,268 @@
+"""Pipelined generation of many videos for one user.
+
+Videos move through two bounded thread pools: a fetch stage (transcript and
+title, mostly network waits on YouTube) and an LLM stage. A video enters the
+LLM stage as soon as its fetch finishes, so fetching video N+1 overlaps the
+LLM call for video N. Whenever videos finish they are written with one bulk
+insert and one bulk update, so a crash only loses the videos in flight.
+Token usage is charged as each video finishes, so a batch stops generating
+once the user runs out of quota.
+"""
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .metrics import track_stage
+from .models import BlogContent, BlogPost
+from .policy import DEPTH_STANDARD
+from .rendering import render_html, store_renditions
+from .services import BlogGenerator
+from .usage import (
+    QuotaExceeded,
+    Usage,
+    charge,
+    check_quota,
+    log_generations,
+    record_generation,
+)
+from .youtube import canonical_url, extract_video_id
+
+logger = logging.getLogger(__name__)
+
+STATUS_CREATED = 'created'
+STATUS_UPDATED = 'updated'
+STATUS_EXISTING = 'existing'
+STATUS_FAILED = 'failed'
+
+# Fields a regeneration overwrites
+POST_FIELDS = [
+    'youtube_url',
+    'youtube_title',
+    'blog_title',
+    'author_name',
+    'updated_at',
+]
+
+
+def _closing_connection(func):
+    """Run func in a pool thread and release that thread's DB connection"""
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connection.close()
+    return wrapper
+
+
+def run_batch(user, urls: List[str], regen: bool = False,
+              titles: Dict[str, str] = None,
+              progress: Optional[Callable[[Dict], None]] = None,
+              depth: str = DEPTH_STANDARD) -> List[Dict]:
+    """Generate blog posts for urls and return one result per url.
+
+    titles optionally maps video ids to already known titles, which skips
+    the yt-dlp lookup for them. progress, if given, is called with each
+    video's result as soon as it is final, and stored if generated.
+    """
+    titles = titles or {}
+    results = [{'url': url} for url in urls]
+
+    # Group the input by video so repeated URLs are generated once
+    videos = {}
+    for result in results:
+        try:
+            video_id = extract_video_id(result['url'])
+        except ValueError:
+            result.update(status=STATUS_FAILED, error="Invalid YouTube URL")
+            if progress:
+                progress(result)
+            continue
+        result['video_id'] = video_id
+        videos.setdefault(video_id, []).append(result)
+
+    existing = {
+        post.video_id: post
+        for post in BlogPost.objects.filter(
+            user=user,
+            video_id__in=list(videos),
+        ).order_by()
+    }
+
+    def finish(video_id, **fields):
+        for result in videos[video_id]:
+            result.update(fields)
+            if progress:
+                progress(result)
+
+    todo = []
+    for video_id in videos:
+        if video_id in existing and not regen:
+            finish(
+                video_id,
+                status=STATUS_EXISTING,
+                blog_id=existing[video_id].pk,
+            )
+        else:
+            todo.append(video_id)
+
+    generator = BlogGenerator()
+
+    @_closing_connection
+    def fetch(video_id):
+        segments = generator.get_transcript_segments(video_id)
+        title = titles.get(video_id)
+        if not title:
+            title = generator.get_video_info(canonical_url(video_id))['title']
+        return segments, title
+
+    @_closing_connection
+    def compose(video_id, segments, title):
+        check_quota(user)
+        usage = Usage()
+        try:
+            reference = generator.prepare_reference(video_id, segments, usage)
+            blog_data = generator.generate_blog(reference, title, usage, depth)
+        except Exception:
+            # Bill the calls made before the failure
+            record_generation(user, video_id, None, usage)
+            raise
+        charge(user, usage)
+        return title, blog_data, usage
+
+    generated = {}
+    fetch_pool = ThreadPoolExecutor(
+        max_workers=settings.BATCH_FETCH_CONCURRENCY,
+        thread_name_prefix='batch-fetch',
+    )
+    llm_pool = ThreadPoolExecutor(
+        max_workers=settings.BATCH_LLM_CONCURRENCY,
+        thread_name_prefix='batch-llm',
+    )
+    try:
+        pending = {
+            fetch_pool.submit(fetch, video_id): ('fetch', video_id)
+            for video_id in todo
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, video_id = pending.pop(future)
+                try:
+                    value = future.result()
+                except QuotaExceeded:
+                    finish(
+                        video_id,
+                        status=STATUS_FAILED,
+                        error="Monthly token quota exceeded",
+                    )
+                    continue
+                except ValueError:
+                    logger.exception("Batch generation of %s failed", video_id)
+                    finish(
+                        video_id,
+                        status=STATUS_FAILED,
+                        error="Error generating blog post",
+                    )
+                    continue
+                except Exception:
+                    logger.exception(
+                        "Batch generation of %s crashed", video_id
+                    )
+                    finish(
+                        video_id,
+                        status=STATUS_FAILED,
+                        error="An unexpected error occurred",
+                    )
+                    continue
+
+                if stage == 'fetch':
+                    segments, title = value
+                    next_future = llm_pool.submit(
+                        compose, video_id, segments, title
+                    )
+                    pending[next_future] = ('llm', video_id)
+                else:
+                    generated[video_id] = value
+
+            # Store what finished in this round while the pools keep going
+            if generated:
+                _store(user, generated, existing, finish)
+                generated = {}
+    finally:
+        fetch_pool.shutdown(wait=True, cancel_futures=True)
+        llm_pool.shutdown(wait=True, cancel_futures=True)
+
+    return results
+
+
+def _store(user, generated: Dict, existing: Dict, finish: Callable):
+    """Write a round of generated posts with one bulk insert and update"""
+    now = timezone.now()
+    author_name = f"{user.first_name} {user.last_name}".strip() or user.email
+    created, updated = [], []
+
+    for video_id, (title, blog_data, _) in generated.items():
+        post = existing.get(video_id) or BlogPost(user=user, video_id=video_id)
+        post.youtube_url = canonical_url(video_id)
+        post.youtube_title = title
+        post.blog_title = blog_data['title']
+        post.author_name = author_name
+        post.updated_at = now
+        post.body = BlogContent(
+            post=post,
+            content=blog_data['content'],
+            html=render_html(blog_data['content']),
+        )
+        (updated if post.pk else created).append(post)
+
+    try:
+        with track_stage("db_write"), transaction.atomic():
+            BlogPost.objects.bulk_create(created)
+            BlogPost.objects.bulk_update(updated, POST_FIELDS)
+            BlogContent.objects.bulk_create(
+                [post.body for post in created + updated],
+                update_conflicts=True,
+                unique_fields=['post'],
+                update_fields=['content', 'html'],
+            )
+    except IntegrityError:
+        # Another request stored a post for one of the videos meanwhile
+        created, updated = _store_each(user, created + updated)
+    store_renditions(created + updated)
+
+    log_generations(user, [
+        (post.video_id, post, generated[post.video_id][2])
+        for post in created + updated
+    ])
+
+    for post in created:
+        finish(post.video_id, status=STATUS_CREATED, blog_id=post.pk)
+    for post in updated:
+        finish(post.video_id, status=STATUS_UPDATED, blog_id=post.pk)
+
+
+def _store_each(user, posts: List[BlogPost]):
+    """Write posts one at a time, overwriting any stored concurrently"""
+    created, updated = [], []
+    with track_stage("db_write"):
+        for post in posts:
+            saved, was_created = BlogPost.objects.update_or_create(
+                user=user,
+                video_id=post.video_id,
+                defaults={
+                    field: getattr(post, field) for field in POST_FIELDS
+                },
+            )
+            saved.body, _ = BlogContent.objects.update_or_create(
+                post=saved,
+                defaults={
+                    'content': post.body.content,
+                    'html': post.body.html,
+                },
+            )
+            (created if was_created else updated).append(saved)
+    return created, updated
@@ -0,0 +1,72 @@
+"""Small timing helpers shared by the benchmark management commands."""
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already collected samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds for samples given in seconds"""
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def time_calls(func: Callable[[], object], iterations: int) -> List[float]:
+    """Call func repeatedly and return each call's duration in seconds"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def format_summary(label: str, summary: Dict[str, float]) -> str:
+    if not summary.get('count'):
+        return f"{label}: no samples"
+    return (
+        f"{label}: n={summary['count']} mean={summary['mean_ms']}ms "
+        f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms "
+        f"p99={summary['p99_ms']}ms max={summary['max_ms']}ms"
+    )
+
+
+@contextmanager
+def throwaway_database():
+    """Run a block against a fresh test database in a temporary directory.
+
+    Yields the directory, which benchmarks may use for other scratch files.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        setup_test_environment()
+        test_name = str(Path(workdir) / 'bench.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_name
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            yield workdir
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
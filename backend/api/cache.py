@@ -0,0 +1,180 @@
+"""Transcript and video info caches shared by every request and worker.
+
+Lookups go through a small in-process LRU first and fall back to the
+``CachedTranscript`` table, which is shared by every worker process. Both
+layers expire entries after ``TRANSCRIPT_CACHE_TTL`` seconds and are bounded
+in size, evicting the least recently used transcripts first.
+
+Video titles are kept in the ``video_info`` cache for ``VIDEO_INFO_CACHE_TTL``
+seconds, so a prefetch in one worker saves the yt-dlp lookup in another. A
+cache that cannot be read or written counts as a miss: the video is looked
+up again rather than the request failing.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .metrics import REGISTRY, Gauge
+from .models import CachedTranscript
+
+logger = logging.getLogger(__name__)
+
+class TranscriptCache:
+    def __init__(self, max_entries: int, max_rows: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = timedelta(seconds=ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._counters = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+        }
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, video_id: str, language: str) -> Optional[List[Dict]]:
+        """Return cached transcript segments, or None on a miss"""
+        key = (video_id, language)
+        now = timezone.now()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                fetched_at, segments = entry
+                if now - fetched_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return segments
+                del self._entries[key]
+
+        cached = CachedTranscript.objects.filter(
+            video_id=video_id,
+            language=language,
+            fetched_at__gt=now - self.ttl,
+        ).only('pk', 'segments', 'fetched_at').first()
+        if cached is None:
+            self._count('misses')
+            return None
+
+        CachedTranscript.objects.filter(pk=cached.pk).update(last_used_at=now)
+        self._remember(key, cached.fetched_at, cached.segments)
+        self._count('db_hits')
+        return cached.segments
+
+    def set(self, video_id: str, language: str, segments: List[Dict]):
+        """Store transcript segments in both cache layers"""
+        now = timezone.now()
+        CachedTranscript.objects.update_or_create(
+            video_id=video_id,
+            language=language,
+            defaults={
+                'segments': segments,
+                'fetched_at': now,
+                'last_used_at': now,
+            }
+        )
+        self._remember((video_id, language), now, segments)
+
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % settings.TRANSCRIPT_CACHE_TRIM_INTERVAL == 0
+        if trim:
+            self.trim()
+
+    def _remember(self, key, fetched_at, segments):
+        with self._lock:
+            self._entries[key] = (fetched_at, segments)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def trim(self):
+        """Drop expired rows and the least recently used rows over the limit"""
+        expired, _ = CachedTranscript.objects.filter(
+            fetched_at__lte=timezone.now() - self.ttl
+        ).delete()
+        stale_ids = list(
+            CachedTranscript.objects.order_by('-last_used_at')
+            .values_list('pk', flat=True)[self.max_rows:]
+        )
+        if stale_ids:
+            CachedTranscript.objects.filter(pk__in=stale_ids).delete()
+        self._count('evictions', expired + len(stale_ids))
+
+    def clear(self):
+        """Empty the in-process layer, leaving the shared table alone"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process, used to size the cache"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        hits = stats['memory_hits'] + stats['db_hits']
+        stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+
+transcript_cache = TranscriptCache(
+    max_entries=settings.TRANSCRIPT_CACHE_MAX_ENTRIES,
+    max_rows=settings.TRANSCRIPT_CACHE_MAX_ROWS,
+    ttl=settings.TRANSCRIPT_CACHE_TTL,
+)
+
+
+class VideoInfoCache:
+    key_format = 'video_info_%s'
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        return caches['video_info']
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        try:
+            return self.cache.get(self.key_format % video_id)
+        except DatabaseError:
+            logger.exception("Reading video info of %s failed", video_id)
+            return None
+
+    def set(self, video_id: str, info: Dict):
+        try:
+            self.cache.set(self.key_format % video_id, info, self.ttl)
+        except DatabaseError:
+            logger.exception("Caching video info of %s failed", video_id)
+
+
+video_info_cache = VideoInfoCache(ttl=settings.VIDEO_INFO_CACHE_TTL)
+
+
+def _collect_cache_metrics():
+    gauge = Gauge(
+        'transcript_cache_events',
+        'Transcript cache lookups and evictions in this process',
+        ['event'],
+    )
+    for event, value in transcript_cache.stats().items():
+        if event != 'hit_ratio':
+            gauge.set(value, event=event)
+    return [gauge]
+
+
+REGISTRY.register_collector(_collect_cache_metrics)
@@ -0,0 +1,181 @@
+"""Process-wide API clients shared by every request.
+
+Building an ``openai.OpenAI`` client per request throws away its HTTP
+connection pool, so every generation paid for a fresh TLS handshake.
+Clients here are created once per process and keep their connections
+alive between requests. ``YoutubeDL`` instances are not thread-safe, so
+they are handed out from a small pool instead of being shared directly.
+Async views get ``AsyncOpenAI`` clients and run the remaining blocking
+calls on a bounded thread pool through ``run_blocking``.
+
+Everything is dropped in the child after a fork so that prefork servers
+never share sockets or locks with their parent.
+"""
+import asyncio
+import functools
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import httpx
+import openai
+import yt_dlp
+from django.conf import settings
+from django.db import connection
+
+_lock = threading.Lock()
+_openai_clients = {}
+_async_openai_clients = {}
+_ydl_pool = queue.LifoQueue()
+_blocking_executor = None
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.OPENAI_TIMEOUT,
+        connect=settings.OPENAI_CONNECT_TIMEOUT,
+    )
+
+
+def get_openai_client(api_key: str = None, base_url: str = None):
+    """Return the shared client for an API key and base URL.
+
+    Clients make a single attempt per call; the router in api/llm.py
+    retries transient errors, on another provider when it can.
+    """
+    api_key = api_key or settings.OPENAI_API_KEY
+    base_url = base_url or settings.OPENAI_BASE_URL
+    key = (base_url, api_key)
+
+    client = _openai_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                client = openai.OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=_http_timeout(),
+                    max_retries=0,
+                    http_client=openai.DefaultHttpxClient(
+                        limits=_http_limits(),
+                        timeout=_http_timeout(),
+                    ),
+                )
+                _openai_clients[key] = client
+    return client
+
+
+def get_async_openai_client(api_key: str = None, base_url: str = None):
+    """AsyncOpenAI counterpart of get_openai_client.
+
+    Async clients are tied to the event loop that first uses them; ASGI
+    servers run one loop per process, so they are shared like the sync ones.
+    """
+    api_key = api_key or settings.OPENAI_API_KEY
+    base_url = base_url or settings.OPENAI_BASE_URL
+    key = (base_url, api_key)
+
+    client = _async_openai_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _async_openai_clients.get(key)
+            if client is None:
+                client = openai.AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=_http_timeout(),
+                    max_retries=0,
+                    http_client=openai.DefaultAsyncHttpxClient(
+                        limits=_http_limits(),
+                        timeout=_http_timeout(),
+                    ),
+                )
+                _async_openai_clients[key] = client
+    return client
+
+
+def _closing_connection(func, *args):
+    try:
+        return func(*args)
+    finally:
+        connection.close()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the shared bounded pool and await it.
+
+    The pool holds at most BLOCKING_IO_WORKERS threads, so a burst of async
+    requests queues here instead of spawning a thread each. Database
+    connections opened by func are closed before the thread is reused.
+    """
+    global _blocking_executor
+    if _blocking_executor is None:
+        with _lock:
+            if _blocking_executor is None:
+                _blocking_executor = ThreadPoolExecutor(
+                    max_workers=settings.BLOCKING_IO_WORKERS,
+                    thread_name_prefix='blocking-io',
+                )
+    return await asyncio.get_running_loop().run_in_executor(
+        _blocking_executor,
+        _closing_connection,
+        functools.partial(func, *args, **kwargs),
+    )
+
+
+def new_ydl(options: dict = None) -> yt_dlp.YoutubeDL:
+    return yt_dlp.YoutubeDL({"quiet": True, **(options or {})})
+
+
+@contextmanager
+def borrow_ydl():
+    """Borrow a YoutubeDL instance for the duration of a block"""
+    try:
+        ydl = _ydl_pool.get_nowait()
+    except queue.Empty:
+        ydl = new_ydl()
+    try:
+        yield ydl
+    finally:
+        if _ydl_pool.qsize() < settings.YTDL_POOL_SIZE:
+            _ydl_pool.put(ydl)
+
+
+def reset():
+    """Forget every shared client without closing inherited sockets"""
+    global _lock, _ydl_pool, _blocking_executor
+    _lock = threading.Lock()
+    _openai_clients.clear()
+    _async_openai_clients.clear()
+    _blocking_executor = None
+    _ydl_pool = queue.LifoQueue()
+
+
+def close():
+    """Close every shared client, e.g. on shutdown or in benchmarks"""
+    with _lock:
+        clients = list(_openai_clients.values())
+        _openai_clients.clear()
+        executor = _blocking_executor
+    for client in clients:
+        client.close()
+    if executor is not None:
+        executor.shutdown(wait=False)
+    # Async clients can only be closed from their event loop; dropping them
+    # lets their connections be collected
+    reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
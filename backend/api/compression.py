@@ -0,0 +1,204 @@
+"""Extractive compression of transcripts before they are sent to the LLM.
+
+Captions are cleaned (music and applause markers, fillers), merged into
+sentences, and exact or near duplicate sentences (auto captions repeat
+themselves a lot) are dropped. When the result is still over budget,
+sentences are ranked by TF-IDF centrality and the best ones are kept in
+their original order.
+
+Centrality is each sentence's cosine similarity to all sentences, which is
+its dot product with the sum of the normalized sentence vectors. That makes
+ranking linear in the transcript length instead of quadratic. It is
+vectorized with NumPy when installed, with a pure Python fallback.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+
+from .policy import count_tokens
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# [Music], (applause), ♪ ... ♪ and similar non-speech captions
+MARKER_RE = re.compile(
+    r"\[[^\]]{0,40}\]"
+    r"|\((?:music|applause|laughter|laughs|cheering|inaudible)[^)]{0,20}\)"
+    r"|[♪♫]+",
+    re.IGNORECASE,
+)
+FILLER_RE = re.compile(
+    r"\b(?:u+m+|u+h+|e+r+m+|h+m+)\b[,.]?\s*",
+    re.IGNORECASE,
+)
+SPACE_RE = re.compile(r"\s+")
+WORD_RE = re.compile(r"[a-z0-9']+")
+SENTENCE_END = ('.', '!', '?')
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Auto captions often have no punctuation; cut sentences there
+MAX_SENTENCE_WORDS = 40
+# Sentences sharing this much of their vocabulary with a recent one are
+# near duplicates
+DUPLICATE_SIMILARITY = 0.8
+DUPLICATE_WINDOW = 8
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its of on or so
+that the this to was we were will with you your they them he she not do
+just like what there their our if then than can going get got know really
+""".split())
+
+
+def clean_text(text: str) -> str:
+    text = MARKER_RE.sub(" ", text)
+    text = FILLER_RE.sub("", text)
+    return SPACE_RE.sub(" ", text).strip()
+
+
+def merge_sentences(segments: List[Dict]) -> List[str]:
+    """Join caption fragments into sentences"""
+    sentences = []
+    buffer = []
+    words = 0
+    for segment in segments:
+        text = clean_text(segment["text"])
+        if not text:
+            continue
+        buffer.append(text)
+        words += text.count(" ") + 1
+        if text.endswith(SENTENCE_END) or words >= MAX_SENTENCE_WORDS:
+            sentences.append(" ".join(buffer))
+            buffer = []
+            words = 0
+    if buffer:
+        sentences.append(" ".join(buffer))
+    return sentences
+
+
+def drop_duplicates(sentences: List[str]) -> List[str]:
+    """Remove repeated sentences and near copies of recent ones"""
+    seen = set()
+    recent = []
+    kept = []
+    for sentence in sentences:
+        terms = frozenset(WORD_RE.findall(sentence.lower()))
+        key = " ".join(sorted(terms))
+        if not terms or key in seen:
+            continue
+        if any(
+            len(terms & other) / len(terms | other) >= DUPLICATE_SIMILARITY
+            for other in recent
+        ):
+            continue
+        seen.add(key)
+        recent.append(terms)
+        if len(recent) > DUPLICATE_WINDOW:
+            recent.pop(0)
+        kept.append(sentence)
+    return kept
+
+
+def _terms(sentence: str) -> List[str]:
+    return [
+        word for word in WORD_RE.findall(sentence.lower())
+        if word not in STOPWORDS
+    ]
+
+
+def _centrality_numpy(documents: List[List[str]]) -> List[float]:
+    vocabulary = {}
+    rows, cols = [], []
+    for row, terms in enumerate(documents):
+        for term in terms:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+    if not rows:
+        return [0.0] * len(documents)
+
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    count = len(documents)
+    # Merge repeated (sentence, term) pairs into term frequencies
+    pairs, tf = np.unique(
+        rows * len(vocabulary) + cols, return_counts=True
+    )
+    rows = pairs // len(vocabulary)
+    cols = pairs % len(vocabulary)
+
+    df = np.bincount(cols, minlength=len(vocabulary))
+    # idf is per term, tf per (sentence, term) pair
+    idf = np.log((1 + count) / (1 + df))
+    weights = tf * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights * weights, minlength=count))
+    weights = weights / np.where(norms > 0, norms, 1)[rows]
+    centroid = np.bincount(cols, weights, minlength=len(vocabulary))
+    return np.bincount(
+        rows, weights * centroid[cols], minlength=count
+    ).tolist()
+
+
+def _centrality_python(documents: List[List[str]]) -> List[float]:
+    count = len(documents)
+    frequencies = [Counter(terms) for terms in documents]
+    df = Counter(term for tf in frequencies for term in tf)
+    vectors = []
+    centroid = Counter()
+    for tf in frequencies:
+        vector = {
+            term: freq * math.log((1 + count) / (1 + df[term]))
+            for term, freq in tf.items()
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        vector = {term: w / norm for term, w in vector.items()}
+        centroid.update(vector)
+        vectors.append(vector)
+    return [
+        sum(w * centroid[term] for term, w in vector.items())
+        for vector in vectors
+    ]
+
+
+def centrality(sentences: List[str]) -> List[float]:
+    """Sum of each sentence's TF-IDF cosine similarity to all sentences"""
+    documents = [_terms(sentence) for sentence in sentences]
+    if np is not None:
+        return _centrality_numpy(documents)
+    return _centrality_python(documents)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split prose, such as chunk summaries, after each sentence end"""
+    return [
+        sentence for sentence in SENTENCE_SPLIT_RE.split(text.strip())
+        if sentence
+    ]
+
+
+def select_sentences(sentences: List[str], max_tokens: int) -> List[str]:
+    """The most central sentences that fit max_tokens, in original order"""
+    sizes = [count_tokens(sentence) + 1 for sentence in sentences]
+    if sum(sizes) <= max_tokens:
+        return sentences
+
+    scores = centrality(sentences)
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda index: scores[index],
+        reverse=True,
+    )
+    chosen = []
+    used = 0
+    for index in ranked:
+        if used + sizes[index] <= max_tokens:
+            chosen.append(index)
+            used += sizes[index]
+    return [sentences[index] for index in sorted(chosen)]
+
+
+def compress_segments(segments: List[Dict]) -> List[str]:
+    """Clean, merge and deduplicate captions into sentences"""
+    return drop_duplicates(merge_sentences(segments))
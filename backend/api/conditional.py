@@ -0,0 +1,70 @@
+"""Conditional GET for the blog views.
+
+A view answers ``If-None-Match`` and ``If-Modified-Since`` from validators
+it reads with one indexed query, before loading or serializing anything:
+a blog post's ``updated_at`` for the detail view, the version of the
+user's collection (see ``BlogCollection``) for the list. Responses are
+private and must be revalidated, so a browser keeps them and turns its next
+request into a conditional one.
+"""
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+
+from .models import BlogCollection, BlogPost
+
+
+def post_validators(user, pk) -> tuple:
+    """ETag and Last-Modified of a user's post, or Nones if it is not theirs"""
+    try:
+        updated_at = BlogPost.objects.filter(user=user, pk=pk).values_list(
+            'updated_at', flat=True
+        ).get()
+    except BlogPost.DoesNotExist:
+        return None, None
+    return f'W/"blog-{pk}-{updated_at.timestamp():.6f}"', updated_at
+
+
+def collection_validators(user) -> tuple:
+    """ETag and Last-Modified of the user's set of posts"""
+    try:
+        version, updated_at = BlogCollection.objects.filter(
+            user=user
+        ).values_list('version', 'updated_at').get()
+    except BlogCollection.DoesNotExist:
+        version, updated_at = 0, None
+    return f'W/"blogs-{user.pk}-{version}"', updated_at
+
+
+class ConditionalGetMixin:
+    """Answer conditional GETs with 304 before doing any work.
+
+    Views define get_validators(request, *args, **kwargs), returning the
+    ETag and the last modification time of what they would serve, and list
+    the request headers their responses vary on in vary_headers.
+    """
+    vary_headers = ['Authorization']
+
+    def get_validators(self, request, *args, **kwargs) -> tuple:
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        if etag:
+            response.headers['ETag'] = etag
+        if timestamp is not None:
+            response.headers['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, self.vary_headers)
+        return response
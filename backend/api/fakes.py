@@ -0,0 +1,218 @@
+"""Offline stand-ins for YouTube and the LLM API, used by benchmarks.
+
+``FakeLLMServer`` is a real HTTP server speaking the OpenAI chat completions
+protocol, so benchmarks exercise the shared clients, connection pools and
+router exactly as in production. It waits ``latency`` seconds before the
+first token and then produces ``tokens_per_second``. yt-dlp and the
+transcript API are replaced in-process by ``offline_youtube``.
+"""
+import json
+import random
+import string
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+WORDS = (
+    "video", "signal", "latency", "python", "stream", "model", "cache",
+    "worker", "request", "token", "queue", "window", "blog", "summary",
+)
+
+
+def fake_text(words: int, seed: int = 0) -> str:
+    return " ".join(WORDS[(seed + i * 7) % len(WORDS)] for i in range(words))
+
+
+def fake_transcript(words: int, seed: int = 0) -> list:
+    """Auto-caption style segments with fillers, markers and repeats"""
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice(string.ascii_lowercase)
+                for _ in range(rng.randint(3, 9)))
+        for _ in range(2000)
+    ] + list(WORDS)
+    noise = ["um", "uh", "[Music]", "(applause)"]
+    segments = []
+    produced = 0
+    while produced < words:
+        if segments and rng.random() < 0.05:
+            # Auto captions repeat lines when speakers pause
+            segments.append(dict(segments[-1]))
+            continue
+        size = rng.randint(6, 14)
+        text = [rng.choice(vocabulary) for _ in range(size)]
+        if rng.random() < 0.2:
+            text.insert(rng.randrange(size), rng.choice(noise))
+        if rng.random() < 0.3:
+            text[-1] += "."
+        segments.append({
+            "text": " ".join(text),
+            "start": produced / 2.5,
+            "duration": size / 2.5,
+        })
+        produced += size
+    return segments
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        server = self.server
+        server.count()
+        prompt = sum(
+            len(message.get("content") or "")
+            for message in request.get("messages", [])
+        )
+        words = min(server.completion_tokens, request.get("max_tokens") or
+                    server.completion_tokens)
+        blog = json.dumps({
+            "title": "Benchmark post",
+            "content": "# Benchmark\n\n" + fake_text(words, prompt),
+        })
+        usage = {
+            "prompt_tokens": prompt // 4,
+            "completion_tokens": words,
+            "total_tokens": prompt // 4 + words,
+        }
+        base = {
+            "id": "chatcmpl-bench",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+        }
+
+        time.sleep(server.latency)
+        if not request.get("stream"):
+            time.sleep(words / server.tokens_per_second)
+            try:
+                self._send_json(200, {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": blog},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+            except (BrokenPipeError, ConnectionResetError):
+                # The client timed out and went away
+                self.close_connection = True
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(chunk: dict):
+            data = f"data: {json.dumps(chunk)}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        pieces = blog.split(" ")
+        try:
+            for index, piece in enumerate(pieces):
+                time.sleep(1 / server.tokens_per_second)
+                text = piece if index == len(pieces) - 1 else piece + " "
+                send({
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": text},
+                                 "finish_reason": None}],
+                })
+            send({**base, "object": "chat.completion.chunk", "choices": [],
+                  "usage": usage})
+            data = b"data: [DONE]\n\n"
+            self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early
+            self.close_connection = True
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """OpenAI-compatible chat completions server on a free local port"""
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.5, tokens_per_second: float = 500,
+                 completion_tokens: int = 800):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeYoutubeDL:
+    """yt-dlp replacement answering video lookups without the network"""
+    latency = 0.0
+
+    def __init__(self, options=None):
+        self.options = options or {}
+
+    def extract_info(self, url, download=False):
+        from .youtube import extract_video_id
+
+        time.sleep(self.latency)
+        video_id = extract_video_id(url)
+        return {"id": video_id, "title": f"Benchmark video {video_id}"}
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def offline_youtube(info_latency: float = 0.0,
+                    transcript_latency: float = 0.0,
+                    transcript_chars: int = 6000):
+    """Replace yt-dlp and the transcript API for the duration of a block"""
+
+    def get_transcript(video_id, languages=None, **kwargs):
+        time.sleep(transcript_latency)
+        return fake_transcript(transcript_chars // 7, len(video_id))
+
+    fake_ydl = type("FakeYoutubeDL", (FakeYoutubeDL,),
+                    {"latency": info_latency})
+    with mock.patch("yt_dlp.YoutubeDL", fake_ydl), mock.patch(
+        "youtube_transcript_api.YouTubeTranscriptApi.get_transcript",
+        staticmethod(get_transcript),
+    ):
+        yield
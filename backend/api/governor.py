@@ -0,0 +1,256 @@
+"""Admission control for calls against a provider's rate limits.
+
+Providers cap both requests and tokens per minute, and a burst from many
+users at once would otherwise get every call rejected with a 429. Each
+provider gets a ``Governor`` that admits a call only while the last 60
+seconds leave room for it. Calls that do not fit wait in FIFO order until
+enough of the window has slid by.
+
+The window is kept in a file per provider in ``LLM_GOVERNOR_DIR``, locked
+while it is read and written, so the limits hold across every worker
+process on the host. Without ``fcntl`` it falls back to a window per
+process. Waiting calls are queued per process; a call at the head of its
+process's queue polls the shared window, as other processes do not wake it.
+
+The token cost of a call is estimated before it is sent, from the length of
+its prompt and its ``max_tokens``, and corrected to the usage the API
+reports once the call returns. Async callers wait with ``aacquire``, which
+sleeps on the event loop instead of holding a thread.
+"""
+import asyncio
+import json
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+from .metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    fcntl = None
+
+WINDOW = 60.0
+# Rough size of a token in characters for English text
+CHARS_PER_TOKEN = 4
+# Longest sleep between checks of a window shared with other processes
+SHARED_POLL = 1.0
+UNSAFE_FILENAME_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+QUEUE_DEPTH = REGISTRY.gauge(
+    'llm_governor_queue_depth',
+    'Chat completion calls waiting for rate limit capacity',
+    ['provider'],
+)
+WAIT_SECONDS = REGISTRY.histogram(
+    'llm_governor_wait_seconds',
+    'Time chat completion calls waited for rate limit capacity',
+    ['provider'],
+)
+REJECTED = REGISTRY.counter(
+    'llm_governor_timeouts_total',
+    'Chat completion calls that gave up waiting for capacity',
+    ['provider'],
+)
+
+
+class CapacityTimeout(Exception):
+    """A call waited longer than allowed for rate limit capacity"""
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int = 0) -> int:
+    """Upper estimate of the tokens a completion call will use"""
+    chars = sum(len(message.get('content') or '') for message in messages)
+    return chars // CHARS_PER_TOKEN + len(messages) * 4 + (max_tokens or 0)
+
+
+class Admission:
+    """Capacity taken by one admitted call"""
+
+    def __init__(self, governor: 'Governor', entry_id: str):
+        self.governor = governor
+        self.entry_id = entry_id
+
+    def settle(self, tokens: int):
+        """Replace the estimate with the tokens the call actually used"""
+        self.governor.settle(self, tokens)
+
+
+class Governor:
+    """Sliding one-minute window of requests and tokens for one provider.
+
+    A limit of 0 disables that dimension. With a state_dir the window is
+    shared with every process using the same directory.
+    """
+
+    def __init__(self, name: str, tokens_per_minute: int = 0,
+                 requests_per_minute: int = 0, max_wait: float = 60.0,
+                 state_dir: str = ''):
+        self.name = name
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        # [admitted_at, tokens, id] of every call admitted within the
+        # window, when it is not shared
+        self._window = []
+        self._path = None
+        if state_dir and fcntl is not None:
+            filename = UNSAFE_FILENAME_RE.sub('_', name)
+            self._path = Path(state_dir) / f"{filename}.json"
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tokens_per_minute or self.requests_per_minute)
+
+    @contextmanager
+    def _locked_window(self, now: float):
+        """Unexpired calls of the window, written back after the block.
+
+        Callers hold self._cond, which serializes the threads of this
+        process; the file lock serializes the processes.
+        """
+        if self._path is None:
+            self._window[:] = [
+                entry for entry in self._window if now - entry[0] < WINDOW
+            ]
+            yield self._window
+            return
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._path, 'a+') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            file.seek(0)
+            try:
+                window = json.loads(file.read() or '[]')
+            except ValueError:
+                # Torn by a crash mid-write; forget it
+                window = []
+            window = [entry for entry in window if now - entry[0] < WINDOW]
+            yield window
+            file.seek(0)
+            file.truncate()
+            json.dump(window, file)
+
+    def _delay(self, window: List, cost: int, now: float) -> float:
+        """Seconds until a call of cost fits, 0 when it fits now"""
+        delay = 0.0
+        if self.requests_per_minute and \
+                len(window) >= self.requests_per_minute:
+            index = len(window) - self.requests_per_minute
+            delay = window[index][0] + WINDOW - now
+        if self.tokens_per_minute:
+            excess = sum(entry[1] for entry in window) + cost \
+                - self.tokens_per_minute
+            for admitted_at, tokens, _ in window:
+                if excess <= 0:
+                    break
+                excess -= tokens
+                delay = max(delay, admitted_at + WINDOW - now)
+        return max(delay, 0.0)
+
+    def _try_admit(self, cost: int, now: float, admit: bool):
+        """Take the share of a call that fits now.
+
+        Returns the id of the admitted call, or None and the seconds to
+        wait before trying again. admit=False only measures the delay.
+        """
+        with self._locked_window(now) as window:
+            delay = self._delay(window, cost, now)
+            if delay or not admit:
+                if self._path is not None:
+                    # Other processes may settle or free capacity earlier
+                    delay = min(delay, SHARED_POLL)
+                return None, delay
+            entry_id = secrets.token_hex(8)
+            window.append([now, cost, entry_id])
+            return entry_id, 0.0
+
+    def _clamp(self, cost: int) -> int:
+        if self.tokens_per_minute:
+            # A call larger than the whole budget runs alone
+            return min(cost, self.tokens_per_minute)
+        return cost
+
+    def _timeout(self):
+        REJECTED.inc(provider=self.name)
+        return CapacityTimeout(
+            f"No capacity on provider {self.name} after {self.max_wait:.0f}s"
+        )
+
+    def acquire(self, cost: int) -> Admission:
+        """Block until a call of cost tokens fits, then take its share.
+
+        Raises CapacityTimeout after waiting max_wait seconds.
+        """
+        cost = self._clamp(cost)
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        ticket = object()
+
+        with self._cond:
+            self._waiting.append(ticket)
+            QUEUE_DEPTH.inc(provider=self.name)
+            try:
+                while True:
+                    now = time.monotonic()
+                    first = self._waiting[0] is ticket
+                    entry_id, delay = self._try_admit(
+                        cost, time.time(), admit=first
+                    )
+                    if entry_id is not None:
+                        break
+                    if now >= deadline:
+                        raise self._timeout()
+                    if not first:
+                        # Woken when the head of the queue is admitted
+                        delay = deadline - now
+                    self._cond.wait(min(delay, deadline - now))
+            finally:
+                self._waiting.remove(ticket)
+                QUEUE_DEPTH.dec(provider=self.name)
+                self._cond.notify_all()
+
+        WAIT_SECONDS.observe(time.monotonic() - started, provider=self.name)
+        return Admission(self, entry_id)
+
+    async def aacquire(self, cost: int) -> Admission:
+        """acquire for coroutines; threads blocked in acquire go first"""
+        cost = self._clamp(cost)
+        started = time.monotonic()
+        deadline = started + self.max_wait
+
+        QUEUE_DEPTH.inc(provider=self.name)
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    entry_id, delay = self._try_admit(
+                        cost, time.time(), admit=not self._waiting
+                    )
+                    if entry_id is not None:
+                        break
+                if now >= deadline:
+                    raise self._timeout()
+                # Threads ahead in the queue give no delay; poll for them
+                await asyncio.sleep(min(delay or 0.05, deadline - now))
+        finally:
+            QUEUE_DEPTH.dec(provider=self.name)
+
+        WAIT_SECONDS.observe(time.monotonic() - started, provider=self.name)
+        return Admission(self, entry_id)
+
+    def settle(self, admission: Admission, tokens: int):
+        with self._cond:
+            with self._locked_window(time.time()) as window:
+                for entry in window:
+                    if entry[2] == admission.entry_id:
+                        entry[1] = tokens
+                        break
+            self._cond.notify_all()
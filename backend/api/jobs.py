@@ -0,0 +1,280 @@
+"""Background blog generation backed by the database.
+
+Jobs are stored as ``GenerationJob`` rows, which act as the queue. A job is
+claimed with a conditional UPDATE so that a job is only ever run once, no
+matter how many pools or worker commands poll the table. A running job
+holds a lease that a heartbeat thread renews; when its worker dies the
+lease runs out and requeue_expired_jobs() puts the job back in the queue.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .batch import STATUS_FAILED, run_batch
+from .metrics import REGISTRY
+from .models import BlogPost, GenerationJob
+from .policy import DEPTH_STANDARD
+from .services import BlogGenerator, generate_blog_post
+from .usage import QuotaExceeded
+from .youtube import canonical_url
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_process_worker():
+    """Prepare a freshly spawned worker process to use the ORM"""
+    django.setup()
+
+
+def get_executor():
+    """Return the process-wide worker pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = settings.BLOG_JOB_WORKERS
+                if settings.BLOG_JOB_EXECUTOR == 'process':
+                    _executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_process_worker,
+                    )
+                else:
+                    _executor = ThreadPoolExecutor(
+                        max_workers=workers,
+                        thread_name_prefix='blog-job',
+                    )
+    return _executor
+
+
+def submit(job_id: int):
+    """Hand a job to the worker pool once the current transaction commits"""
+    transaction.on_commit(lambda: get_executor().submit(run_job, job_id))
+
+
+def enqueue(user, url: str = '', kind: str = GenerationJob.KIND_VIDEO,
+            depth: str = DEPTH_STANDARD, urls=None,
+            regen: bool = False) -> GenerationJob:
+    """Create a pending job and dispatch it if configured to.
+
+    Video and playlist jobs take a url, batch jobs a list of urls.
+    """
+    job = GenerationJob.objects.create(
+        user=user,
+        youtube_url=url,
+        urls=urls or [],
+        regen=regen,
+        kind=kind,
+        depth=depth,
+    )
+    if settings.BLOG_JOB_AUTODISPATCH:
+        submit(job.pk)
+    return job
+
+
+def claim_job(job_id: int) -> bool:
+    """Atomically move a job from pending to running"""
+    now = timezone.now()
+    claimed = GenerationJob.objects.filter(
+        pk=job_id,
+        status=GenerationJob.STATUS_PENDING,
+    ).update(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at=now,
+        heartbeat_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return claimed == 1
+
+
+def _keep_alive(job_id: int, stop: threading.Event):
+    """Renew the lease of a running job until stop is set"""
+    interval = settings.BLOG_JOB_LEASE_SECONDS / 3
+    try:
+        while not stop.wait(interval):
+            GenerationJob.objects.filter(
+                pk=job_id,
+                status=GenerationJob.STATUS_RUNNING,
+            ).update(heartbeat_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def requeue_expired_jobs() -> int:
+    """Requeue running jobs whose worker stopped renewing their lease.
+
+    Jobs that were already started BLOG_JOB_MAX_ATTEMPTS times fail instead,
+    so that a job which kills its worker cannot do so forever. Returns the
+    number of jobs requeued.
+    """
+    expired = GenerationJob.objects.filter(
+        status=GenerationJob.STATUS_RUNNING,
+        heartbeat_at__lt=(
+            timezone.now() - timedelta(seconds=settings.BLOG_JOB_LEASE_SECONDS)
+        ),
+    )
+    expired.filter(attempts__gte=settings.BLOG_JOB_MAX_ATTEMPTS).update(
+        status=GenerationJob.STATUS_FAILED,
+        error="The job stopped responding",
+        finished_at=timezone.now(),
+    )
+    requeued = expired.update(
+        status=GenerationJob.STATUS_PENDING,
+        started_at=None,
+        heartbeat_at=None,
+    )
+    if requeued:
+        logger.warning("Requeued %s generation jobs with expired leases",
+                       requeued)
+    return requeued
+
+
+def run_playlist(job: GenerationJob):
+    """Generate posts for every video of a playlist or channel job"""
+    generator = BlogGenerator()
+    videos = generator.list_videos(
+        job.youtube_url,
+        settings.PLAYLIST_MAX_VIDEOS,
+    )
+
+    owned = set(
+        BlogPost.objects.filter(
+            user=job.user,
+            video_id__in=[video['video_id'] for video in videos],
+        ).order_by().values_list('video_id', flat=True)
+    )
+    # Videos finished by an earlier attempt of the job are not skipped
+    # videos, even though the user owns their posts now
+    done = {result.get('video_id') for result in job.results}
+    todo = [
+        video for video in videos
+        if video['video_id'] not in owned | done
+    ]
+    GenerationJob.objects.filter(pk=job.pk).update(
+        total_items=len(videos),
+        skipped_items=sum(
+            1 for video in videos
+            if video['video_id'] in owned - done
+        ),
+    )
+
+    job.results = job.results + run_batch(
+        job.user,
+        [canonical_url(video['video_id']) for video in todo],
+        titles={video['video_id']: video['title'] for video in todo},
+        progress=_progress(job),
+        depth=job.depth,
+    )
+
+
+def run_url_batch(job: GenerationJob):
+    """Generate posts for the videos of a batch job"""
+    done = {result['url'] for result in job.results}
+    GenerationJob.objects.filter(pk=job.pk).update(total_items=len(job.urls))
+    job.results = job.results + run_batch(
+        job.user,
+        [url for url in job.urls if url not in done],
+        regen=job.regen,
+        progress=_progress(job),
+        depth=job.depth,
+    )
+
+
+def _progress(job: GenerationJob):
+    """Save each final video result of a batch on the job as it comes in.
+
+    Results are saved with the counters, so a job requeued after a crash
+    picks up after the last video it stored.
+    """
+    results = list(job.results)
+
+    def progress(result):
+        results.append(dict(result))
+        failed = sum(
+            1 for item in results if item['status'] == STATUS_FAILED
+        )
+        GenerationJob.objects.filter(pk=job.pk).update(
+            results=results,
+            completed_items=len(results) - failed,
+            failed_items=failed,
+        )
+    return progress
+
+
+def run_job(job_id: int):
+    """Run a single job in a worker thread or process"""
+    close_old_connections()
+    try:
+        if not claim_job(job_id):
+            return
+
+        stop = threading.Event()
+        threading.Thread(
+            target=_keep_alive,
+            args=(job_id, stop),
+            name=f'blog-job-{job_id}-heartbeat',
+            daemon=True,
+        ).start()
+        job = GenerationJob.objects.select_related('user').get(pk=job_id)
+        try:
+            if job.kind == GenerationJob.KIND_PLAYLIST:
+                run_playlist(job)
+            elif job.kind == GenerationJob.KIND_BATCH:
+                run_url_batch(job)
+            else:
+                job.blog_post = generate_blog_post(
+                    job.user,
+                    job.youtube_url,
+                    job.depth,
+                )
+        except QuotaExceeded:
+            job.status = GenerationJob.STATUS_FAILED
+            job.error = "Monthly token quota exceeded"
+        except ValueError as e:
+            logger.warning("Generation job %s failed: %s", job_id, e)
+            job.status = GenerationJob.STATUS_FAILED
+            job.error = "Error generating blog post"
+        except Exception:
+            logger.exception("Generation job %s crashed", job_id)
+            job.status = GenerationJob.STATUS_FAILED
+            job.error = "An unexpected error occurred"
+        else:
+            job.status = GenerationJob.STATUS_SUCCEEDED
+        finally:
+            stop.set()
+
+        # Only if the job was not requeued meanwhile and claimed again
+        GenerationJob.objects.filter(
+            pk=job_id,
+            status=GenerationJob.STATUS_RUNNING,
+            attempts=job.attempts,
+        ).update(
+            status=job.status,
+            error=job.error,
+            blog_post=job.blog_post,
+            results=job.results,
+            finished_at=timezone.now(),
+        )
+    finally:
+        close_old_connections()
+        REGISTRY.flush()
+
+
+def pending_job_ids(limit: int):
+    """Oldest pending jobs first"""
+    return list(
+        GenerationJob.objects.filter(status=GenerationJob.STATUS_PENDING)
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
@@ -0,0 +1,452 @@
+"""Routing of chat completions across OpenAI-compatible providers.
+
+Providers come from ``settings.LLM_PROVIDERS``. Each call goes to the
+available provider with the best score, an exponential moving average of
+the latency of its successful calls inflated by its recent error rate;
+providers without samples are tried first so new ones get measured.
+Transient errors (timeouts, connection errors, 429 and 5xx) are retried with
+jittered exponential backoff, preferring a different provider for the retry.
+Calls are bounded by the shared clients' ``OPENAI_TIMEOUT``, and the
+clients themselves never retry. A provider that
+fails ``LLM_BREAKER_THRESHOLD`` times in a row is taken out of rotation
+for ``LLM_BREAKER_COOLDOWN`` seconds, then given a single trial call.
+Calls to a provider with rate limits configured first wait for capacity
+in its ``Governor``; a call that times out waiting moves on to another
+provider. Streams are settled against the governor once they report their
+usage, or are closed.
+"""
+import asyncio
+import random
+import threading
+import time
+from os import getenv
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import openai
+from django.conf import settings
+
+from .clients import get_async_openai_client, get_openai_client
+from .governor import (
+    CHARS_PER_TOKEN,
+    CapacityTimeout,
+    Governor,
+    estimate_tokens,
+)
+from .metrics import REGISTRY, Gauge
+
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+# Errors that say nothing about the request, only about the provider
+PROVIDER_ERRORS = (
+    openai.AuthenticationError,
+    openai.PermissionDeniedError,
+    openai.NotFoundError,
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+PROVIDER_SECONDS = REGISTRY.histogram(
+    'llm_provider_request_seconds',
+    'Latency of chat completion calls per provider',
+    ['provider'],
+)
+PROVIDER_FAILURES = REGISTRY.counter(
+    'llm_provider_failures_total',
+    'Failed chat completion calls per provider and error type',
+    ['provider', 'error'],
+)
+BREAKER_TRIPS = REGISTRY.counter(
+    'llm_provider_breaker_trips_total',
+    'Times a provider circuit breaker opened',
+    ['provider'],
+)
+
+
+class NoProviderAvailable(Exception):
+    """Every provider's circuit breaker is open"""
+
+
+@dataclass
+class Provider:
+    name: str
+    base_url: str
+    api_key: str
+    model: str
+    summary_model: str = ''
+    fast_model: str = ''
+    latency: Optional[float] = None
+    error_rate: float = 0.0
+    failures: int = 0
+    state: str = CLOSED
+    opened_at: float = 0.0
+    trial_in_flight: bool = field(default=False, repr=False)
+    governor: Optional[Governor] = field(default=None, repr=False)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'Provider':
+        api_key = config.get('api_key')
+        if not api_key and config.get('api_key_env'):
+            api_key = getenv(config['api_key_env'])
+        return cls(
+            name=config['name'],
+            base_url=config['base_url'],
+            api_key=api_key or '',
+            model=config['model'],
+            summary_model=config.get('summary_model', ''),
+            fast_model=config.get('fast_model', ''),
+            governor=Governor(
+                config['name'],
+                tokens_per_minute=config.get(
+                    'tokens_per_minute', settings.LLM_TOKENS_PER_MINUTE
+                ),
+                requests_per_minute=config.get(
+                    'requests_per_minute', settings.LLM_REQUESTS_PER_MINUTE
+                ),
+                max_wait=settings.LLM_GOVERNOR_MAX_WAIT,
+                state_dir=settings.LLM_GOVERNOR_DIR,
+            ),
+        )
+
+    def model_for(self, role: str) -> str:
+        if role == 'summary' and self.summary_model:
+            return self.summary_model
+        if role == 'fast' and self.fast_model:
+            return self.fast_model
+        return self.model
+
+    @property
+    def client(self):
+        return get_openai_client(self.api_key, self.base_url)
+
+    @property
+    def async_client(self):
+        return get_async_openai_client(self.api_key, self.base_url)
+
+    def score(self) -> float:
+        if self.latency is None:
+            if not self.error_rate:
+                return 0.0
+            # Failed before its first success: as slow as a timed out call
+            latency = settings.OPENAI_TIMEOUT
+        else:
+            latency = self.latency
+        return latency * (1 + settings.LLM_ERROR_PENALTY * self.error_rate)
+
+
+class SettledStream:
+    """Completion stream that settles its admission when it ends.
+
+    Streams report their usage in the last chunk (with include_usage);
+    one closed before that is settled to its estimated prompt tokens plus
+    the content received so far.
+    """
+
+    def __init__(self, stream, admission, prompt_tokens: int):
+        self.stream = stream
+        self.admission = admission
+        self.prompt_tokens = prompt_tokens
+        self.chars = 0
+        self.total_tokens = None
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                usage = getattr(chunk, 'usage', None)
+                if usage is not None:
+                    self.total_tokens = usage.total_tokens
+                for choice in getattr(chunk, 'choices', None) or ():
+                    self.chars += len(choice.delta.content or '')
+                yield chunk
+        finally:
+            self._settle()
+
+    def close(self):
+        self.stream.close()
+        self._settle()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _settle(self):
+        if self.admission is None:
+            return
+        admission, self.admission = self.admission, None
+        if self.total_tokens is None:
+            admission.settle(
+                self.prompt_tokens + self.chars // CHARS_PER_TOKEN
+            )
+        else:
+            admission.settle(self.total_tokens)
+
+
+class LLMRouter:
+    def __init__(self, providers: List[Provider]):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self._lock = threading.Lock()
+
+    def _available(self, now: float) -> List[Provider]:
+        available = []
+        for provider in self.providers:
+            if provider.state == OPEN:
+                if now - provider.opened_at < settings.LLM_BREAKER_COOLDOWN:
+                    continue
+                provider.state = HALF_OPEN
+                provider.trial_in_flight = False
+            if provider.state == HALF_OPEN and provider.trial_in_flight:
+                continue
+            available.append(provider)
+        return available
+
+    def choose(self, exclude=()) -> Provider:
+        """Pick the provider for the next attempt"""
+        with self._lock:
+            available = self._available(time.monotonic())
+            preferred = [p for p in available if p.name not in exclude]
+            candidates = preferred or available
+            if not candidates:
+                raise NoProviderAvailable("No LLM provider is available")
+            provider = min(candidates, key=Provider.score)
+            if provider.state == HALF_OPEN:
+                provider.trial_in_flight = True
+            return provider
+
+    def _record(self, provider: Provider, latency: float, ok: bool):
+        alpha = settings.LLM_EWMA_ALPHA
+        with self._lock:
+            # Failures are often fast (refused connections) or as slow as
+            # the timeout, so only successful calls measure latency
+            if ok and provider.latency is None:
+                provider.latency = latency
+            elif ok:
+                provider.latency += alpha * (latency - provider.latency)
+            provider.error_rate += alpha * ((0.0 if ok else 1.0)
+                                            - provider.error_rate)
+            provider.trial_in_flight = False
+
+            if ok:
+                provider.failures = 0
+                provider.state = CLOSED
+                return
+
+            provider.failures += 1
+            if provider.state == HALF_OPEN or \
+                    provider.failures >= settings.LLM_BREAKER_THRESHOLD:
+                if provider.state != OPEN:
+                    BREAKER_TRIPS.inc(provider=provider.name)
+                provider.state = OPEN
+                provider.opened_at = time.monotonic()
+
+    def _prepare(self, kwargs) -> int:
+        """Fill in call defaults and return the estimated token cost"""
+        kwargs.pop('model', None)
+        return estimate_tokens(
+            kwargs.get('messages', []), kwargs.get('max_tokens')
+        )
+
+    def _release(self, provider: Provider):
+        with self._lock:
+            provider.trial_in_flight = False
+
+    def _out_of_capacity(self, provider: Provider, tried: List) -> bool:
+        """Record a call that found no capacity; True to try another"""
+        self._release(provider)
+        tried.append(provider.name)
+        with self._lock:
+            return any(
+                other.name not in tried
+                for other in self._available(time.monotonic())
+            )
+
+    def _failed(self, provider: Provider, admission, elapsed: float,
+                error: Exception, attempt: int) -> bool:
+        """Record a failed call; True when it should be retried"""
+        if admission is not None:
+            # Rejected calls count against the request limit only
+            admission.settle(0)
+        if not isinstance(error, TRANSIENT_ERRORS + PROVIDER_ERRORS):
+            # Bad requests fail the same way everywhere; do not count
+            # them against the provider
+            self._release(provider)
+            return False
+        self._record(provider, elapsed, ok=False)
+        PROVIDER_FAILURES.inc(
+            provider=provider.name, error=type(error).__name__
+        )
+        return attempt < settings.LLM_MAX_ATTEMPTS
+
+    def _succeeded(self, provider: Provider, admission, elapsed: float,
+                   response):
+        usage = getattr(response, 'usage', None)
+        if admission is not None and usage is not None:
+            admission.settle(usage.total_tokens or 0)
+        self._record(provider, elapsed, ok=True)
+        PROVIDER_SECONDS.observe(elapsed, provider=provider.name)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        ceiling = min(
+            settings.LLM_BACKOFF_MAX,
+            settings.LLM_BACKOFF_BASE * (2 ** attempt),
+        )
+        return random.uniform(0, ceiling)
+
+    def create(self, role: str = 'blog', **kwargs):
+        """chat.completions.create on the best provider, with failover.
+
+        role selects the provider's model ("blog", "fast" or "summary");
+        any model passed in kwargs is ignored. For streams only opening the
+        stream is retried, not failures in the middle of it.
+        """
+        cost = self._prepare(kwargs)
+        tried = []
+        while True:
+            provider = self.choose(exclude=tried)
+            admission = None
+            if provider.governor is not None and provider.governor.enabled:
+                try:
+                    admission = provider.governor.acquire(cost)
+                except CapacityTimeout:
+                    if self._out_of_capacity(provider, tried):
+                        continue
+                    raise
+            started = time.perf_counter()
+            try:
+                response = provider.client.chat.completions.create(
+                    model=provider.model_for(role),
+                    **kwargs
+                )
+            except Exception as e:
+                tried.append(provider.name)
+                elapsed = time.perf_counter() - started
+                if not self._failed(provider, admission, elapsed, e,
+                                    len(tried)):
+                    raise
+                if isinstance(e, TRANSIENT_ERRORS):
+                    time.sleep(self._backoff_delay(len(tried) - 1))
+                continue
+
+            self._succeeded(
+                provider, admission, time.perf_counter() - started, response
+            )
+            if kwargs.get('stream') and admission is not None:
+                return SettledStream(
+                    response, admission,
+                    estimate_tokens(kwargs.get('messages', [])),
+                )
+            return response
+
+    async def acreate(self, role: str = 'blog', **kwargs):
+        """create for coroutines, using the providers' AsyncOpenAI clients"""
+        cost = self._prepare(kwargs)
+        tried = []
+        while True:
+            provider = self.choose(exclude=tried)
+            admission = None
+            if provider.governor is not None and provider.governor.enabled:
+                try:
+                    admission = await provider.governor.aacquire(cost)
+                except CapacityTimeout:
+                    if self._out_of_capacity(provider, tried):
+                        continue
+                    raise
+                except BaseException:
+                    self._release(provider)
+                    raise
+            started = time.perf_counter()
+            try:
+                response = await provider.async_client.chat.completions.create(
+                    model=provider.model_for(role),
+                    **kwargs
+                )
+            except asyncio.CancelledError:
+                if admission is not None:
+                    admission.settle(0)
+                self._release(provider)
+                raise
+            except Exception as e:
+                tried.append(provider.name)
+                elapsed = time.perf_counter() - started
+                if not self._failed(provider, admission, elapsed, e,
+                                    len(tried)):
+                    raise
+                if isinstance(e, TRANSIENT_ERRORS):
+                    await asyncio.sleep(self._backoff_delay(len(tried) - 1))
+                continue
+
+            self._succeeded(
+                provider, admission, time.perf_counter() - started, response
+            )
+            return response
+
+    def status(self) -> List[Dict]:
+        """Current routing state of every provider"""
+        with self._lock:
+            return [
+                {
+                    'name': provider.name,
+                    'state': provider.state,
+                    'latency': provider.latency,
+                    'error_rate': round(provider.error_rate, 4),
+                    'consecutive_failures': provider.failures,
+                }
+                for provider in self.providers
+            ]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """Process-wide router built from settings.LLM_PROVIDERS"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter([
+                    Provider.from_config(config)
+                    for config in settings.LLM_PROVIDERS
+                ])
+    return _router
+
+
+def _collect_router_metrics():
+    if _router is None:
+        return []
+    gauge = Gauge(
+        'llm_provider_state',
+        'Routing state of each LLM provider in this process '
+        '(0 closed, 1 half open, 2 open)',
+        ['provider'],
+    )
+    latency = Gauge(
+        'llm_provider_latency_seconds',
+        'Smoothed latency of each LLM provider in this process',
+        ['provider'],
+    )
+    states = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    for provider in _router.status():
+        gauge.set(states[provider['state']], provider=provider['name'])
+        if provider['latency'] is not None:
+            latency.set(provider['latency'], provider=provider['name'])
+    return [gauge, latency]
+
+
+REGISTRY.register_collector(_collect_router_metrics)
+
+
+def reset_router():
+    """Forget provider state, e.g. after changing LLM_PROVIDERS in tests"""
+    global _router
+    _router = None
@@ -0,0 +1,160 @@
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.benchmark import format_summary, summarize, throwaway_database
+from api.fakes import fake_text
+from api.models import BlogContent, BlogPost
+from api.throttling import GCRAThrottle
+from api.youtube import canonical_url
+
+
+class Command(BaseCommand):
+    help = (
+        "Walk the blog list of a user with many posts page by page, in a "
+        "throwaway database, and report page latency by depth and memory "
+        "allocated per page. With cursor pagination the last pages should "
+        "cost the same as the first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--content-chars', type=int, default=2000,
+                            help="Size of each post's body")
+        parser.add_argument('--buckets', type=int, default=10,
+                            help="Report latency per this many depth ranges")
+        parser.add_argument('--output', help="Write the results as JSON")
+
+    def handle(self, *args, **options):
+        no_limits = {scope: None for scope in ('user', 'generation', 'admin')}
+        with throwaway_database(), override_settings(
+            BLOG_LIST_MAX_PAGE_SIZE=max(options['page_size'], 1),
+        ), mock.patch.object(GCRAThrottle, 'THROTTLE_RATES', no_limits):
+            user = self.create_posts(options)
+            samples = self.walk(user, options)
+            # A second walk, as tracing allocations slows every page down
+            tracemalloc.start()
+            try:
+                peaks = self.walk(user, options, self.allocation_peak)
+            finally:
+                tracemalloc.stop()
+
+        results = self.report(samples, options)
+        results['memory_peak_kib'] = {
+            'mean': round(statistics.fmean(peaks) / 1024, 1),
+            'max': round(max(peaks) / 1024, 1),
+        }
+        self.stdout.write(
+            f"memory per page: mean={results['memory_peak_kib']['mean']}KiB "
+            f"max={results['memory_peak_kib']['max']}KiB"
+        )
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def create_posts(self, options):
+        user = get_user_model().objects.create_user(
+            email='bench@example.com',
+            password='benchmark',
+            first_name='Bench',
+            last_name='List',
+        )
+        content = fake_text(options['content_chars'] // 7)
+        now = timezone.now()
+        created_at = BlogPost._meta.get_field('created_at')
+        started = time.perf_counter()
+        # Spread creation times like a real history instead of the instant
+        # of the bulk insert
+        with mock.patch.object(created_at, 'auto_now_add', False):
+            for start in range(0, options['posts'], 5000):
+                posts = BlogPost.objects.bulk_create([
+                    BlogPost(
+                        user=user,
+                        youtube_url=canonical_url(f'b{i:010d}'),
+                        video_id=f'b{i:010d}',
+                        youtube_title=f'Benchmark video {i}',
+                        blog_title=f'Benchmark post {i}',
+                        author_name='Bench List',
+                        created_at=now - timedelta(minutes=i),
+                    )
+                    for i in range(start, min(start + 5000, options['posts']))
+                ])
+                BlogContent.objects.bulk_create([
+                    BlogContent(post=post, content=content) for post in posts
+                ])
+        self.stdout.write(
+            f"Created {options['posts']} posts in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+        return user
+
+    @staticmethod
+    def allocation_peak(request):
+        """Bytes allocated at the peak of a request"""
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        response = request()
+        return response, tracemalloc.get_traced_memory()[1] - baseline
+
+    @staticmethod
+    def duration(request):
+        started = time.perf_counter()
+        response = request()
+        return response, time.perf_counter() - started
+
+    def walk(self, user, options, measure=None):
+        """Follow next links to the last page; a measurement per page.
+
+        measure calls the request it is given and returns the response and
+        the measured value; pages are timed by default.
+        """
+        measure = measure or self.duration
+        client = APIClient()
+        token = RefreshToken.for_user(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        samples = []
+        url = f"{reverse('api:blog-list')}?page_size={options['page_size']}"
+        while url:
+            response, value = measure(lambda: client.get(url))
+            samples.append(value)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"Page {len(samples)} failed with {response.status_code}"
+                )
+            url = response.json()['next']
+        return samples
+
+    def report(self, samples, options):
+        size = max(1, -(-len(samples) // options['buckets']))
+        depths = {}
+        for start in range(0, len(samples), size):
+            first = start * options['page_size']
+            last = min(len(samples), start + size) * options['page_size']
+            label = f"posts {first}-{min(last, options['posts'])}"
+            depths[label] = summarize(samples[start:start + size])
+            self.stdout.write(format_summary(label, depths[label]))
+        overall = summarize(samples)
+        self.stdout.write(format_summary('all pages', overall))
+        return {
+            'config': {
+                key: options[key]
+                for key in ('posts', 'page_size', 'content_chars', 'buckets')
+            },
+            'pages': len(samples),
+            'overall': overall,
+            'by_depth': depths,
+        }
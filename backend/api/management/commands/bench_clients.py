@@ -0,0 +1,69 @@
+import httpx
+import openai
+import yt_dlp
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import clients
+from api.benchmark import format_summary, summarize, time_calls
+from api.llm import get_router
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-request client setup cost of building fresh OpenAI "
+        "and YoutubeDL clients against the shared process-wide clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument(
+            '--probe-url',
+            help=(
+                "Optional HTTPS URL to GET on every iteration, showing the "
+                "cost of a cold connection versus a kept-alive one"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        api_key = settings.OPENAI_API_KEY or 'benchmark'
+
+        def fresh_setup():
+            openai.OpenAI(api_key=api_key, base_url=settings.OPENAI_BASE_URL)
+            yt_dlp.YoutubeDL({"quiet": True})
+
+        def shared_setup():
+            for provider in get_router().providers:
+                provider.client
+            with clients.borrow_ydl():
+                pass
+
+        clients.close()
+        results = [
+            ('setup, fresh clients', time_calls(fresh_setup, iterations)),
+            ('setup, shared clients', time_calls(shared_setup, iterations)),
+        ]
+
+        probe_url = options['probe_url']
+        if probe_url:
+            def cold_request():
+                with httpx.Client() as client:
+                    client.get(probe_url)
+
+            shared = httpx.Client(limits=clients._http_limits())
+
+            def warm_request():
+                shared.get(probe_url)
+
+            results.append(
+                ('request, new connection', time_calls(cold_request, iterations))
+            )
+            results.append(
+                ('request, kept alive', time_calls(warm_request, iterations))
+            )
+            shared.close()
+
+        for label, samples in results:
+            self.stdout.write(format_summary(label, summarize(samples)))
+        clients.close()
@@ -0,0 +1,78 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from api import compression
+from api.benchmark import format_summary, summarize
+from api.fakes import fake_transcript
+from api.policy import count_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure transcript compression throughput on a synthetic "
+        "auto-caption transcript, per stage, with the token reduction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=100000)
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--max-tokens', type=int, default=1800,
+                            help="Budget for the extractive selection")
+        parser.add_argument('--output', help="Write the results as JSON")
+
+    def handle(self, *args, **options):
+        segments = fake_transcript(options['words'])
+        words = sum(segment['text'].count(' ') + 1 for segment in segments)
+        timings = {'clean': [], 'rank': [], 'total': []}
+
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            sentences = compression.compress_segments(segments)
+            cleaned = time.perf_counter()
+            selected = compression.select_sentences(
+                sentences, options['max_tokens']
+            )
+            finished = time.perf_counter()
+            timings['clean'].append(cleaned - started)
+            timings['rank'].append(finished - cleaned)
+            timings['total'].append(finished - started)
+
+        original_tokens = count_tokens(
+            " ".join(segment['text'] for segment in segments)
+        )
+        compressed_tokens = count_tokens(" ".join(sentences))
+        selected_tokens = count_tokens(" ".join(selected))
+        total = summarize(timings['total'])
+        results = {
+            'config': {
+                key: options[key]
+                for key in ('words', 'iterations', 'max_tokens')
+            },
+            'numpy': compression.np is not None,
+            'segments': len(segments),
+            'sentences': len(sentences),
+            'selected_sentences': len(selected),
+            'tokens': {
+                'original': original_tokens,
+                'compressed': compressed_tokens,
+                'selected': selected_tokens,
+            },
+            'words_per_second': round(words / (total['mean_ms'] / 1000)),
+            'stages': {
+                name: summarize(samples) for name, samples in timings.items()
+            },
+        }
+
+        for name, summary in results['stages'].items():
+            self.stdout.write(format_summary(name, summary))
+        self.stdout.write(
+            f"words={words} words_per_second={results['words_per_second']} "
+            f"numpy={results['numpy']} tokens {original_tokens} -> "
+            f"{compressed_tokens} -> {selected_tokens}"
+        )
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import clients
+from api.benchmark import format_summary, summarize, throwaway_database
+from api.cache import transcript_cache
+from api.fakes import FakeLLMServer, offline_youtube
+from api.llm import reset_router
+from api.models import BlogPost
+from api.throttling import GCRAThrottle
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the generate, list and detail endpoints against local "
+        "fakes of YouTube and the LLM API, in a throwaway database. Reports "
+        "throughput and latency percentiles per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help="Requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--users', type=int, default=4)
+        parser.add_argument('--llm-latency', type=float, default=0.5,
+                            help="Seconds before the first token")
+        parser.add_argument('--llm-tokens-per-second', type=float,
+                            default=500)
+        parser.add_argument('--completion-tokens', type=int, default=800)
+        parser.add_argument('--youtube-latency', type=float, default=0.1,
+                            help="Seconds per video info or transcript call")
+        parser.add_argument('--transcript-chars', type=int, default=6000)
+        parser.add_argument('--output', help="Write the results as JSON")
+
+    def handle(self, *args, **options):
+        with throwaway_database() as workdir:
+            results = self.run_benchmark(options, workdir)
+
+        for name, result in results['endpoints'].items():
+            self.stdout.write(
+                f"{format_summary(name, result['latency'])} "
+                f"rps={result['throughput_rps']} errors={result['errors']}"
+            )
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run_benchmark(self, options, workdir):
+        started_at = timezone.now()
+        server = FakeLLMServer(
+            latency=options['llm_latency'],
+            tokens_per_second=options['llm_tokens_per_second'],
+            completion_tokens=options['completion_tokens'],
+        )
+        provider = {
+            'name': 'fake',
+            'base_url': server.base_url,
+            'api_key': 'benchmark',
+            'model': 'fake-model',
+        }
+        no_limits = {scope: None for scope in ('user', 'generation', 'admin')}
+
+        with server, offline_youtube(
+            info_latency=options['youtube_latency'],
+            transcript_latency=options['youtube_latency'],
+            transcript_chars=options['transcript_chars'],
+        ), override_settings(
+            LLM_PROVIDERS=[provider],
+            SINGLE_FLIGHT_LOCK_DIR=str(Path(workdir) / 'locks'),
+            METRICS_DIR='',
+        ), mock.patch.object(GCRAThrottle, 'THROTTLE_RATES', no_limits):
+            clients.close()
+            reset_router()
+            transcript_cache.clear()
+            try:
+                tokens = self.create_users(options['users'])
+                endpoints = {}
+                endpoints['generate'] = self.run_phase(
+                    tokens, options,
+                    lambda client, i: client.post(
+                        reverse('api:generate-blog'),
+                        {'url': f'https://youtu.be/bench{i:06d}',
+                         'regen': 'true'},
+                        format='json',
+                    ),
+                )
+                post_ids = self.post_ids(tokens)
+                endpoints['list'] = self.run_phase(
+                    tokens, options,
+                    lambda client, i: client.get(reverse('api:blog-list')),
+                )
+                endpoints['detail'] = self.run_phase(
+                    tokens, options,
+                    lambda client, i: client.get(reverse(
+                        'api:blog-detail',
+                        kwargs={'pk': post_ids[client.user_id][
+                            i % len(post_ids[client.user_id])
+                        ]},
+                    )),
+                )
+            finally:
+                clients.close()
+                reset_router()
+
+        return {
+            'started_at': started_at.isoformat(),
+            'config': {
+                key: options[key] for key in (
+                    'requests', 'concurrency', 'users', 'llm_latency',
+                    'llm_tokens_per_second', 'completion_tokens',
+                    'youtube_latency', 'transcript_chars',
+                )
+            },
+            'llm_requests': server.requests,
+            'endpoints': endpoints,
+        }
+
+    def create_users(self, count):
+        User = get_user_model()
+        tokens = []
+        for index in range(count):
+            user = User.objects.create_user(
+                email=f'bench{index}@example.com',
+                password='benchmark',
+                first_name='Bench',
+                last_name=str(index),
+            )
+            access = RefreshToken.for_user(user).access_token
+            tokens.append((user.pk, str(access)))
+        return tokens
+
+    def post_ids(self, tokens):
+        """Ids of each user's posts; users without any get a missing id"""
+        ids = {user_id: [] for user_id, _ in tokens}
+        for user_id, pk in BlogPost.objects.values_list('user_id', 'pk'):
+            ids[user_id].append(pk)
+        return {user_id: pks or [0] for user_id, pks in ids.items()}
+
+    def run_phase(self, tokens, options, send):
+        """Send options['requests'] requests spread over the users"""
+        local = threading.local()
+
+        def client_for(index):
+            if not hasattr(local, 'clients'):
+                local.clients = {}
+            user_id, token = tokens[index % len(tokens)]
+            client = local.clients.get(user_id)
+            if client is None:
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+                client.user_id = user_id
+                local.clients[user_id] = client
+            return client
+
+        def one(index):
+            client = client_for(index)
+            started = time.perf_counter()
+            try:
+                response = send(client, index)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            duration = time.perf_counter() - started
+            # The test client skips the request_finished cleanup that
+            # closes connections in production
+            connections.close_all()
+            return duration, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            outcomes = list(pool.map(one, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        samples = [duration for duration, _ in outcomes]
+        return {
+            'latency': summarize(samples),
+            'errors': sum(1 for _, ok in outcomes if not ok),
+            'throughput_rps': round(len(outcomes) / elapsed, 3),
+            'wall_seconds': round(elapsed, 3),
+        }
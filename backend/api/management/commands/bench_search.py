@@ -0,0 +1,152 @@
+import json
+import random
+import string
+import time
+from itertools import accumulate
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.benchmark import format_summary, summarize, throwaway_database
+from api.models import BlogContent, BlogPost
+from api.throttling import GCRAThrottle
+from api.youtube import canonical_url
+
+TARGET_MS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill a throwaway database with posts spread over many users and "
+        "time searches of one user's posts for rare, common and multi-word "
+        "queries, including the first page of results and a later one. "
+        "Search time grows with the posts of the user that match, not "
+        "with the posts of all users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--words', type=int, default=150,
+                            help="Words in each post's body")
+        parser.add_argument('--vocabulary', type=int, default=20000)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', help="Write the results as JSON")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        # Word frequencies follow Zipf's law as in real text, so a query
+        # for a common word matches a good part of the user's posts
+        vocabulary = sorted({
+            ''.join(rng.choice(string.ascii_lowercase)
+                    for _ in range(rng.randint(4, 10)))
+            for _ in range(options['vocabulary'])
+        })
+        rng.shuffle(vocabulary)
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)
+        ))
+        no_limits = {scope: None for scope in ('user', 'generation', 'admin')}
+        with throwaway_database(), mock.patch.object(
+            GCRAThrottle, 'THROTTLE_RATES', no_limits
+        ):
+            user = self.create_posts(rng, vocabulary, weights, options)
+            results = self.run_queries(user, vocabulary, options)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def create_posts(self, rng, vocabulary, weights, options):
+        def words(count):
+            return ' '.join(rng.choices(vocabulary, cum_weights=weights,
+                                        k=count))
+
+        users = get_user_model().objects.bulk_create([
+            get_user_model()(
+                email=f'bench{index}@example.com',
+                first_name='Bench',
+                last_name='Search',
+            )
+            for index in range(options['users'])
+        ])
+        started = time.perf_counter()
+        for start in range(0, options['posts'], 5000):
+            end = min(start + 5000, options['posts'])
+            posts = BlogPost.objects.bulk_create([
+                BlogPost(
+                    user=users[i % len(users)],
+                    youtube_url=canonical_url(f's{i:010d}'),
+                    video_id=f's{i:010d}',
+                    youtube_title=words(6),
+                    blog_title=words(5),
+                    author_name='Bench Search',
+                )
+                for i in range(start, end)
+            ])
+            BlogContent.objects.bulk_create([
+                BlogContent(post=post, content=words(options['words']))
+                for post in posts
+            ])
+        with connection.cursor() as cursor:
+            # As after any large import
+            cursor.execute(
+                "INSERT INTO api_blogsearch(api_blogsearch) VALUES ('optimize')"
+            )
+        self.stdout.write(
+            f"Created {options['posts']} posts for {len(users)} users in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+        return users[0]
+
+    def run_queries(self, user, vocabulary, options):
+        client = APIClient()
+        token = RefreshToken.for_user(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        url = reverse('api:blog-search')
+        queries = {
+            'most common word': {'q': vocabulary[0]},
+            'common word': {'q': vocabulary[9]},
+            'rare word': {'q': vocabulary[len(vocabulary) // 2]},
+            'two common words': {'q': f'{vocabulary[1]} {vocabulary[2]}'},
+            'common and uncommon word': {
+                'q': f'{vocabulary[9]} {vocabulary[300]}',
+            },
+            'common word, page 10': {'q': vocabulary[9], 'offset': 180},
+        }
+
+        results = {}
+        for label, params in queries.items():
+            samples = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                response = client.get(url, params)
+                samples.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(
+                        f"{label} failed with {response.status_code}"
+                    )
+            results[label] = summarize(samples)
+            results[label]['results'] = len(response.json()['results'])
+            self.stdout.write(format_summary(label, results[label]))
+
+        slowest = max(summary['p95_ms'] for summary in results.values())
+        verdict = 'within' if slowest <= TARGET_MS else 'OVER'
+        self.stdout.write(
+            f"Slowest p95 {slowest:.1f}ms, {verdict} the {TARGET_MS}ms target"
+        )
+        return {
+            'config': {
+                key: options[key]
+                for key in ('posts', 'users', 'words', 'vocabulary',
+                            'iterations')
+            },
+            'queries': results,
+            'target_ms': TARGET_MS,
+        }
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import BlogContent, BlogPost
+from api.rendering import ENCODINGS, markdown, render_html, store_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the HTML and the compressed detail responses of blog posts "
+        "that have none or only stale ones, e.g. posts saved before these "
+        "existed. Posts are rendered as they are saved, so this is only "
+        "needed after an upgrade, or with --all after installing the "
+        "markdown or brotli package."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Render every post again",
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if markdown is None:
+            self.stderr.write(
+                "The markdown package is not installed; posts get no HTML"
+            )
+        posts = BlogPost.objects.filter(body__isnull=False)
+        if not options['all']:
+            posts = posts.filter(
+                Q(rendition__isnull=True) |
+                ~Q(rendition__updated_at=F('updated_at'))
+            )
+
+        rendered, last_pk = 0, 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_pk).select_related('body')
+                .order_by('pk')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            # A post whose HTML changed gets a new updated_at, and with it a
+            # new ETag, so clients holding the old response fetch it again
+            changed, now = [], timezone.now()
+            for post in batch:
+                html = render_html(post.body.content)
+                if html != post.body.html:
+                    post.body.html, post.updated_at = html, now
+                    changed.append(post)
+            BlogContent.objects.bulk_update(
+                [post.body for post in changed], ['html']
+            )
+            BlogPost.objects.bulk_update(changed, ['updated_at'])
+            # Compresses before it writes, so the write lock is held briefly
+            store_renditions(batch)
+            rendered += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(
+            f"Rendered {rendered} posts with {', '.join(ENCODINGS)}"
+        )
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.jobs import (
+    get_executor,
+    pending_job_ids,
+    requeue_expired_jobs,
+    run_job,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued blog generation jobs using the configured worker pool. "
+        "Use this when BLOG_JOB_AUTODISPATCH is off or to recover jobs left "
+        "pending by a restarted web server, or left running by a worker that "
+        "crashed: those are requeued once their lease expires."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help="Seconds to wait between queue polls",
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the current queue and exit",
+        )
+
+    def handle(self, *args, **options):
+        executor = get_executor()
+        in_flight = {}
+        self.stdout.write(
+            f"Worker pool started ({settings.BLOG_JOB_EXECUTOR}, "
+            f"{settings.BLOG_JOB_WORKERS} workers)"
+        )
+
+        # Requeue at startup, then as often as running jobs renew leases
+        requeue_every = settings.BLOG_JOB_LEASE_SECONDS / 3
+        last_requeue = None
+        while True:
+            now = time.monotonic()
+            if last_requeue is None or now - last_requeue >= requeue_every:
+                requeue_expired_jobs()
+                last_requeue = now
+
+            for job_id, future in list(in_flight.items()):
+                if future.done():
+                    del in_flight[job_id]
+
+            free = settings.BLOG_JOB_WORKERS - len(in_flight)
+            job_ids = [
+                job_id for job_id in pending_job_ids(max(free, 0))
+                if job_id not in in_flight
+            ]
+            for job_id in job_ids:
+                in_flight[job_id] = executor.submit(run_job, job_id)
+
+            if options['once'] and not job_ids and not in_flight:
+                break
+            time.sleep(options['poll_interval'])
+
+        executor.shutdown(wait=True)
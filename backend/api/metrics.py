@@ -0,0 +1,325 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Recording a sample takes one lock and a dict update, cheap enough to leave
+on in production. Every process keeps its own values. When ``METRICS_DIR``
+is set, each process also writes a snapshot there at most once per
+``METRICS_FLUSH_INTERVAL`` seconds and the metrics endpoint sums the
+snapshots of all processes, so prefork servers report host-wide totals.
+Snapshots of processes that exited, or that have not written one for
+``METRICS_SNAPSHOT_MAX_AGE`` seconds, are deleted instead of summed.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.core.signals import request_finished
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120,
+)
+
+
+def _escape(value) -> str:
+    """A label value as the text format quotes it"""
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple,
+                   extra: str = '') -> str:
+    pairs = [
+        f'{name}="{_escape(value)}"'
+        for name, value in zip(labelnames, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                json.dumps(key): value for key, value in self._values.items()
+            }
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, values: Dict) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                json.dumps(key): {
+                    'counts': list(state['counts']),
+                    'sum': state['sum'],
+                }
+                for key, state in self._values.items()
+            }
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {
+                    'counts': [0] * (len(self.buckets) + 1),
+                    'sum': 0.0,
+                }
+            state['counts'][index] += 1
+            state['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return {'counts': list(value['counts']), 'sum': value['sum']}
+        total['counts'] = [a + b for a, b in zip(total['counts'],
+                                                 value['counts'])]
+        total['sum'] += value['sum']
+        return total
+
+    def render(self, values: Dict) -> List[str]:
+        lines = []
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            cumulative += state['counts'][-1]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {state["sum"]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def _is_running(pid: int) -> bool:
+    """Whether a process with this id exists on the host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._last_flush = 0.0
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[Metric]]):
+        """Add a callable producing extra metrics at render time"""
+        self._collectors.append(collector)
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def reset(self):
+        """Drop values inherited from a parent process after fork"""
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+            metric._values = {}
+        self._last_flush = 0.0
+
+    def _snapshot(self) -> Dict:
+        return {
+            name: metric.snapshot() for name, metric in self._metrics.items()
+        }
+
+    def flush(self, force: bool = False):
+        """Write this process's snapshot to METRICS_DIR, rate limited"""
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{os.getpid()}.json'
+        temp = path.with_suffix('.tmp')
+        temp.write_text(json.dumps(self._snapshot()))
+        temp.replace(path)
+
+    def _snapshots(self) -> List[Dict]:
+        if not settings.METRICS_DIR:
+            return [self._snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        oldest = time.time() - settings.METRICS_SNAPSHOT_MAX_AGE
+        for path in Path(settings.METRICS_DIR).glob('*.json'):
+            try:
+                if not _is_running(int(path.stem)) or \
+                        path.stat().st_mtime < oldest:
+                    path.unlink(missing_ok=True)
+                    continue
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    @staticmethod
+    def _render_metric(metric: Metric, values: Dict) -> List[str]:
+        return [
+            f'# HELP {metric.name} {metric.documentation}',
+            f'# TYPE {metric.name} {metric.kind}',
+            *metric.render(values),
+        ]
+
+    def render(self) -> str:
+        merged = {}
+        for snapshot in self._snapshots():
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                target = merged.setdefault(name, {})
+                for key, value in values.items():
+                    key = tuple(json.loads(key))
+                    target[key] = metric.merge(target.get(key), value)
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(self._render_metric(
+                metric, merged.get(metric.name, {})
+            ))
+        for collect in self._collectors:
+            for metric in collect():
+                lines.extend(self._render_metric(metric, metric._values))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'blog_generation_stage_seconds',
+    'Time spent in each blog generation stage',
+    ['stage'],
+)
+STAGE_FAILURES = REGISTRY.counter(
+    'blog_generation_stage_failures_total',
+    'Blog generation stages that raised an error',
+    ['stage'],
+)
+LLM_TOKENS = REGISTRY.counter(
+    'llm_tokens_total',
+    'Tokens reported by the LLM API',
+    ['model', 'kind'],
+)
+
+
+def _flush_after_request(sender, **kwargs):
+    REGISTRY.flush()
+
+
+request_finished.connect(_flush_after_request, dispatch_uid='metrics_flush')
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=REGISTRY.reset)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Time a generation stage and count it as failed if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            STAGE_FAILURES.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_usage(model: str, usage):
+    """Count the tokens of an API response's usage block, if present"""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind='prompt')
+    LLM_TOKENS.inc(
+        usage.completion_tokens or 0, model=model, kind='completion'
+    )
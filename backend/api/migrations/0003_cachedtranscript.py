@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-17 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedTranscript',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('video_id', models.CharField(max_length=32)),
+                ('language', models.CharField(max_length=16)),
+                ('segments', models.JSONField()),
+                ('fetched_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='api_cachedt_last_us_56d43a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('video_id', 'language'), name='unique_transcript_per_language')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.3 on 2026-10-17 15:53
+
+import re
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.db import migrations, models
+
+# A copy of api.youtube.extract_video_id as of this migration, so that later
+# changes to the parser do not change what this migration does
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+YOUTUBE_HOSTS = {
+    'youtube.com',
+    'www.youtube.com',
+    'm.youtube.com',
+    'music.youtube.com',
+    'youtube-nocookie.com',
+    'www.youtube-nocookie.com',
+}
+SHORT_HOSTS = {'youtu.be', 'www.youtu.be'}
+PATH_PREFIXES = ('shorts', 'embed', 'v', 'e', 'live')
+
+
+def extract_video_id(url):
+    url = url.strip()
+    if '://' not in url:
+        url = f'https://{url}'
+
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    segments = [segment for segment in parts.path.split('/') if segment]
+
+    candidate = None
+    if host in SHORT_HOSTS:
+        candidate = segments[0] if segments else None
+    elif host in YOUTUBE_HOSTS:
+        if segments[:1] == ['watch']:
+            candidate = parse_qs(parts.query).get('v', [None])[0]
+        elif len(segments) >= 2 and segments[0] in PATH_PREFIXES:
+            candidate = segments[1]
+
+    if candidate and VIDEO_ID_RE.fullmatch(candidate):
+        return candidate
+    raise ValueError(f"Not a YouTube video URL: {url}")
+
+
+def backfill_video_ids(apps, schema_editor):
+    BlogPost = apps.get_model('api', 'BlogPost')
+    posts = BlogPost.objects.filter(video_id='').only('pk', 'youtube_url')
+    for post in posts.iterator():
+        try:
+            post.video_id = extract_video_id(post.youtube_url)
+        except ValueError:
+            continue
+        post.save(update_fields=['video_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_cachedtranscript'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='video_id',
+            field=models.CharField(blank=True, default='', max_length=11),
+        ),
+        migrations.RunPython(
+            backfill_video_ids,
+            migrations.RunPython.noop,
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['user', 'video_id'], name='api_blogpos_user_id_3a6ae5_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-17 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_chunksummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('video_title', models.CharField(max_length=255)),
+                ('blog_title', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('finished_at', models.DateTimeField()),
+            ],
+        ),
+    ]
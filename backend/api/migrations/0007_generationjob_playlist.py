@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-17 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_sharedgeneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='completed_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='failed_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='kind',
+            field=models.CharField(choices=[('video', 'Video'), ('playlist', 'Playlist or channel')], default='video', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='results',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='skipped_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='total_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_generationusage_monthlytokenusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='depth',
+            field=models.CharField(default='standard', max_length=10),
+        ),
+    ]
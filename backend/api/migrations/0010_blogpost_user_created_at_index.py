@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_generationjob_depth'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='api_blogpos_user_id_3bfb5b_idx'),
+        ),
+    ]
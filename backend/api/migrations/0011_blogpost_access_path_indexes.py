@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_blogpost_user_created_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='api_blogpos_youtube_d35f65_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='api_blogpos_blog_ti_1ba16c_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='api_blogpos_user_id_83ccd5_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blogpost',
+            name='api_blogpos_author__194de5_idx',
+        ),
+        migrations.AlterField(
+            model_name='blogpost',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='blog_posts', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
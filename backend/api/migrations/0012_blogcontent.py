@@ -0,0 +1,52 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_content(apps, schema_editor):
+    BlogPost = apps.get_model('api', 'BlogPost')
+    BlogContent = apps.get_model('api', 'BlogContent')
+    posts = BlogPost.objects.values_list('pk', 'content')
+    batch = []
+    for pk, content in posts.iterator(chunk_size=500):
+        batch.append(BlogContent(post_id=pk, content=content))
+        if len(batch) == 500:
+            BlogContent.objects.bulk_create(batch)
+            batch = []
+    BlogContent.objects.bulk_create(batch)
+
+
+def restore_content(apps, schema_editor):
+    BlogPost = apps.get_model('api', 'BlogPost')
+    BlogContent = apps.get_model('api', 'BlogContent')
+    for body in BlogContent.objects.iterator(chunk_size=500):
+        BlogPost.objects.filter(pk=body.post_id).update(content=body.content)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_blogpost_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogContent',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='body', serialize=False, to='api.blogpost')),
+                ('content', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(move_content, restore_content),
+        # Lets the field be added back to existing rows when reversing
+        migrations.AlterField(
+            model_name='blogpost',
+            name='content',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='blogpost',
+            name='content',
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.3 on 2026-10-17 20:30
+
+from django.db import migrations
+
+# Full-text index of every post, one row per post with rowid = post id. The
+# owner column holds "u<user id>" so that a search only matches the user's
+# own posts. Triggers keep it in sync with both halves of a post; a post is
+# indexed once its body is written.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE api_blogsearch USING fts5(
+        owner, title, video_title, body,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER api_blogsearch_content_insert
+    AFTER INSERT ON api_blogcontent BEGIN
+        INSERT INTO api_blogsearch(rowid, owner, title, video_title, body)
+        SELECT id, 'u' || user_id, blog_title, youtube_title, NEW.content
+        FROM api_blogpost WHERE id = NEW.post_id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_blogsearch_content_update
+    AFTER UPDATE OF content ON api_blogcontent BEGIN
+        UPDATE api_blogsearch SET body = NEW.content
+        WHERE rowid = NEW.post_id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_blogsearch_content_delete
+    AFTER DELETE ON api_blogcontent BEGIN
+        DELETE FROM api_blogsearch WHERE rowid = OLD.post_id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_blogsearch_post_update
+    AFTER UPDATE OF user_id, blog_title, youtube_title ON api_blogpost BEGIN
+        UPDATE api_blogsearch
+        SET owner = 'u' || NEW.user_id,
+            title = NEW.blog_title,
+            video_title = NEW.youtube_title
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_blogsearch_post_delete
+    AFTER DELETE ON api_blogpost BEGIN
+        DELETE FROM api_blogsearch WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    INSERT INTO api_blogsearch(rowid, owner, title, video_title, body)
+    SELECT p.id, 'u' || p.user_id, p.blog_title, p.youtube_title, c.content
+    FROM api_blogpost p JOIN api_blogcontent c ON c.post_id = p.id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER api_blogsearch_post_delete",
+    "DROP TRIGGER api_blogsearch_post_update",
+    "DROP TRIGGER api_blogsearch_content_delete",
+    "DROP TRIGGER api_blogsearch_content_update",
+    "DROP TRIGGER api_blogsearch_content_insert",
+    "DROP TABLE api_blogsearch",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_blogcontent'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.1.3 on 2026-10-17 20:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Bump the version of the user's collection whenever one of their posts is
+# written, whichever way it is written. Deletes only update an existing
+# row: when a user is deleted their row may already be gone.
+BUMP = """
+    INSERT INTO api_blogcollection(user_id, version, updated_at)
+    VALUES ({user}, 1, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    ON CONFLICT(user_id) DO UPDATE SET
+        version = version + 1,
+        updated_at = excluded.updated_at;
+"""
+BUMP_EXISTING = """
+    UPDATE api_blogcollection
+    SET version = version + 1,
+        updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE user_id = {user};
+"""
+
+CREATE_SQL = [
+    f"""
+    CREATE TRIGGER api_blogcollection_post_insert
+    AFTER INSERT ON api_blogpost BEGIN
+        {BUMP.format(user='NEW.user_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_blogcollection_post_update
+    AFTER UPDATE ON api_blogpost BEGIN
+        {BUMP.format(user='NEW.user_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_blogcollection_post_move
+    AFTER UPDATE OF user_id ON api_blogpost
+    WHEN OLD.user_id != NEW.user_id BEGIN
+        {BUMP_EXISTING.format(user='OLD.user_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_blogcollection_post_delete
+    AFTER DELETE ON api_blogpost BEGIN
+        {BUMP_EXISTING.format(user='OLD.user_id')}
+    END
+    """,
+    """
+    INSERT INTO api_blogcollection(user_id, version, updated_at)
+    SELECT user_id, 1, max(updated_at) FROM api_blogpost GROUP BY user_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER api_blogcollection_post_delete",
+    "DROP TRIGGER api_blogcollection_post_move",
+    "DROP TRIGGER api_blogcollection_post_update",
+    "DROP TRIGGER api_blogcollection_post_insert",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_first_name_alter_user_last_name'),
+        ('api', '0013_blogsearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogCollection',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='blog_collection', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+    ]
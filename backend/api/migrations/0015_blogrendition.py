@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Django adds a NOT NULL column on SQLite by rebuilding the table, which
+# would drop the search triggers of migration 0013; ALTER TABLE keeps them.
+# Existing posts get their HTML from "manage.py render_blogs".
+ADD_HTML_SQL = (
+    "ALTER TABLE api_blogcontent ADD COLUMN html text NOT NULL DEFAULT ''"
+)
+DROP_HTML_SQL = "ALTER TABLE api_blogcontent DROP COLUMN html"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_blogcollection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogRendition',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rendition', serialize=False, to='api.blogpost')),
+                ('updated_at', models.DateTimeField()),
+                ('gzip', models.BinaryField()),
+                ('br', models.BinaryField(null=True)),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(ADD_HTML_SQL, DROP_HTML_SQL),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='blogcontent',
+                    name='html',
+                    field=models.TextField(blank=True, default=''),
+                ),
+            ],
+        ),
+    ]
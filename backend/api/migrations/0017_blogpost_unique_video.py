@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_video_ids(apps, schema_editor):
+    """Keep the video id on the newest of a user's posts for a video.
+
+    Before the constraint, concurrent generations and the backfill of
+    migration 0004 could leave several posts for one video. The older ones
+    keep their content but lose the video id, like posts whose URL never
+    parsed, so they are listed but no longer found or overwritten by video.
+    """
+    BlogPost = apps.get_model('api', 'BlogPost')
+    duplicates = (
+        BlogPost.objects.exclude(video_id='')
+        .values('user_id', 'video_id')
+        .annotate(posts=Count('pk'))
+        .filter(posts__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        posts = BlogPost.objects.filter(
+            user_id=duplicate['user_id'], video_id=duplicate['video_id']
+        ).order_by('-updated_at', '-pk')
+        keep = posts.values_list('pk', flat=True)[0]
+        posts.exclude(pk=keep).update(video_id='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_generationjob_lease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_video_ids, migrations.RunPython.noop),
+        # A partial unique index is created in place on SQLite, so the
+        # search and collection triggers on api_blogpost are kept
+        migrations.AddConstraint(
+            model_name='blogpost',
+            constraint=models.UniqueConstraint(condition=models.Q(('video_id', ''), _negated=True), fields=('user', 'video_id'), name='unique_blog_post_per_video'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_blogpost_unique_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='regen',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='urls',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='generationjob',
+            name='kind',
+            field=models.CharField(choices=[('video', 'Video'), ('playlist', 'Playlist or channel'), ('batch', 'List of videos')], default='video', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='generationjob',
+            name='youtube_url',
+            field=models.URLField(blank=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_generationjob_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleState',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('tat', models.FloatField()),
+            ],
+        ),
+    ]
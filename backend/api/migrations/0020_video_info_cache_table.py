@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:20
+
+from django.core.management import call_command
+from django.db import migrations
+
+# The video_info cache is a DatabaseCache, whose table Django only creates
+# with "manage.py createcachetable". Creating it here means a deployment that
+# only migrates has it too; the command skips tables that already exist.
+
+
+def create_cache_tables(apps, schema_editor):
+    call_command(
+        'createcachetable',
+        database=schema_editor.connection.alias,
+        verbosity=0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_throttlestate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
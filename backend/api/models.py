@@ -6,26 +6,40 @@ User = get_user_model()
 
 
 class BlogPost(models.Model):
+    # Both indexes below start with user, so the foreign key needs none
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='blog_posts'
+        related_name='blog_posts',
+        db_index=False,
     )
     youtube_url = models.URLField()
+    video_id = models.CharField(max_length=11, blank=True, default='')
     youtube_title = models.CharField(max_length=255)
     blog_title = models.CharField(max_length=255)
-    content = models.TextField()
     author_name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        # One post per video and user. Posts whose URL did not parse have
+        # no video id; the partial index is not used for lookups, which
+        # SQLite cannot prove exclude '', so the plain index stays below.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'video_id'],
+                condition=~models.Q(video_id=''),
+                name='unique_blog_post_per_video',
+            ),
+        ]
+        # One index per access path; see QueryPlanTests in api/tests.py
         indexes = [
-            models.Index(fields=['youtube_url']),
-            models.Index(fields=['blog_title']),
-            models.Index(fields=['user']),
-            models.Index(fields=['author_name']),
+            # A user's post for a video: existing-post checks, batches,
+            # playlist skips and update_or_create on save
+            models.Index(fields=['user', 'video_id']),
+            # A user's posts newest first: the paginated blog list
+            models.Index(fields=['user', '-created_at', '-id']),
         ]
 
     def __str__(self):
@@ -39,3 +53,262 @@ class BlogPost(models.Model):
                 user.email
             )
         super().save(*args, **kwargs)
+
+
+class BlogContent(models.Model):
+    """The markdown body of a blog post, and the HTML rendered from it.
+
+    Kept out of the blog_post table so that listing posts never reads the
+    bodies; only views of a single post join it. The HTML is rendered when
+    the body is written, and is empty without the markdown package.
+    """
+    post = models.OneToOneField(
+        BlogPost,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='body',
+    )
+    content = models.TextField()
+    html = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Content of post {self.post_id}"
+
+
+class BlogRendition(models.Model):
+    """The detail response of a blog post, compressed when it was saved.
+
+    Only served while updated_at matches the post's; see api/rendering.py.
+    br is empty without the brotli package.
+    """
+    post = models.OneToOneField(
+        BlogPost,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rendition',
+    )
+    updated_at = models.DateTimeField()
+    gzip = models.BinaryField()
+    br = models.BinaryField(null=True)
+
+    def __str__(self):
+        return f"Rendition of post {self.post_id}"
+
+
+class BlogCollection(models.Model):
+    """Version of a user's set of blog posts, for conditional list requests.
+
+    Database triggers (migration 0014) bump it on every insert, update and
+    delete of one of the user's posts, so bulk writes and cascades count
+    too. Users who never had a post have no row.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='blog_collection',
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Blogs of user {self.user_id}, version {self.version}"
+
+
+class GenerationJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    KIND_VIDEO = 'video'
+    KIND_PLAYLIST = 'playlist'
+    KIND_BATCH = 'batch'
+    KIND_CHOICES = [
+        (KIND_VIDEO, 'Video'),
+        (KIND_PLAYLIST, 'Playlist or channel'),
+        (KIND_BATCH, 'List of videos'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='generation_jobs'
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        default=KIND_VIDEO
+    )
+    # Batch jobs have no single URL; they carry the list in urls
+    youtube_url = models.URLField(blank=True)
+    urls = models.JSONField(default=list, blank=True)
+    regen = models.BooleanField(default=False)
+    depth = models.CharField(max_length=10, default='standard')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    blog_post = models.ForeignKey(
+        BlogPost,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='generation_jobs'
+    )
+    error = models.TextField(blank=True)
+    # Progress of playlist and batch jobs; results holds one entry per video
+    total_items = models.PositiveIntegerField(default=0)
+    completed_items = models.PositiveIntegerField(default=0)
+    failed_items = models.PositiveIntegerField(default=0)
+    skipped_items = models.PositiveIntegerField(default=0)
+    results = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Renewed while the job runs; a running job whose heartbeat is older
+    # than BLOG_JOB_LEASE_SECONDS lost its worker and is requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'heartbeat_at']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status}) for {self.youtube_url}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+
+class CachedTranscript(models.Model):
+    video_id = models.CharField(max_length=32)
+    language = models.CharField(max_length=16)
+    segments = models.JSONField()
+    fetched_at = models.DateTimeField()
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['video_id', 'language'],
+                name='unique_transcript_per_language',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['last_used_at']),
+        ]
+
+    def __str__(self):
+        return f"Transcript {self.video_id} ({self.language})"
+
+
+class ChunkSummary(models.Model):
+    """Summary of one transcript chunk, reused across regenerations"""
+    digest = models.CharField(max_length=64, unique=True)
+    video_id = models.CharField(max_length=11)
+    summary = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Chunk summary {self.digest[:12]} of {self.video_id}"
+
+
+class SharedGeneration(models.Model):
+    """Latest generated blog for a flight key, read by joined requests"""
+    key = models.CharField(max_length=64, unique=True)
+    video_title = models.CharField(max_length=255)
+    blog_title = models.CharField(max_length=255)
+    content = models.TextField()
+    finished_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Shared generation {self.key[:12]}"
+
+
+class GenerationUsage(models.Model):
+    """Tokens and latency of one blog generation"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='generation_usage'
+    )
+    blog_post = models.ForeignKey(
+        BlogPost,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='generation_usage'
+    )
+    video_id = models.CharField(max_length=11)
+    model = models.CharField(max_length=255, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Usage of {self.video_id} by user {self.user_id}"
+
+
+class MonthlyTokenUsage(models.Model):
+    """Running token totals per user and calendar month"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='token_usage'
+    )
+    month = models.DateField()
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    generations = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'month'],
+                name='unique_token_usage_per_month',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+
+    def __str__(self):
+        return f"Tokens of user {self.user_id} in {self.month:%Y-%m}"
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+class ThrottleState(models.Model):
+    """GCRA state of one rate limit key, shared by every worker process.
+
+    tat is the theoretical arrival time of the key's next request as a Unix
+    timestamp. A missing row, or one with a tat in the past, is a full
+    bucket; such rows are pruned from time to time.
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    tat = models.FloatField()
+
+    def __str__(self):
+        return f"Rate limit {self.key}"
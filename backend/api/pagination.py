@@ -0,0 +1,181 @@
+"""Pagination for the blog list and blog search.
+
+Pages of the list are addressed by the position of their last post instead
+of an offset, so the database seeks straight to the page through the
+``(user, -created_at, -id)`` index and page 500 costs the same as page 1.
+``id`` breaks ties between posts created in the same instant: a cursor
+holds both, and a page starts strictly after ``(created_at, id)``, so posts
+sharing a timestamp are neither skipped nor counted past with an offset.
+
+Search results are ordered by how well they match, which gives no
+position to seek to, so they are paged by offset. Counting every match to
+number the pages would cost more than the search itself; one extra row is
+fetched instead to tell whether there is a next page.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, Cursor, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class BlogCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.BLOG_LIST_PAGE_SIZE
+        self.max_page_size = settings.BLOG_LIST_MAX_PAGE_SIZE
+
+    def decode_cursor(self, request):
+        """The cursor's position as (created_at, id), None on the first page"""
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            created_at, _, pk = cursor.position.rpartition('_')
+            position = (datetime.fromisoformat(created_at), int(pk))
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def encode_row(self, row, reverse: bool) -> str:
+        position = f"{row['created_at'].isoformat()}_{row['id']}"
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=reverse, position=position)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """One page of values() rows with created_at and id, newest first"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        if self.cursor is None:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            # (created_at, id) < (?, ?) written so the index range is on
+            # created_at and only ties are checked against id
+            created_at, pk = self.cursor.position
+            if reverse:
+                queryset = queryset.filter(created_at__gte=created_at).exclude(
+                    created_at=created_at, id__lte=pk
+                ).order_by('created_at', 'id')
+            else:
+                queryset = queryset.filter(created_at__lte=created_at).exclude(
+                    created_at=created_at, id__gte=pk
+                ).order_by(*self.ordering)
+
+        rows = list(queryset[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next = more
+            self.has_previous = self.cursor is not None
+        self.display_page_controls = self.template is not None and (
+            self.has_next or self.has_previous
+        )
+        return self.page
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_row(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.encode_row(self.page[0], reverse=True)
+
+
+class BlogSearchPagination(BasePagination):
+    page_size_query_param = 'page_size'
+    offset_query_param = 'offset'
+
+    def __init__(self):
+        self.page_size = settings.BLOG_LIST_PAGE_SIZE
+        self.max_page_size = settings.BLOG_LIST_MAX_PAGE_SIZE
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_offset(self, request) -> int:
+        try:
+            return max(0, int(request.query_params[self.offset_query_param]))
+        except (KeyError, ValueError):
+            return 0
+
+    def paginate_search(self, search, request) -> list:
+        """One page of search(limit, offset), a function returning results"""
+        self.request = request
+        self.limit = self.get_page_size(request)
+        self.offset = self.get_offset(request)
+        results = search(self.limit + 1, self.offset)
+        self.has_next = len(results) > self.limit
+        return results[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+    def get_previous_link(self):
+        if self.offset <= 0:
+            return None
+        url = self.request.build_absolute_uri()
+        offset = self.offset - self.limit
+        if offset <= 0:
+            return remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.offset_query_param, offset)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.offset_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to skip.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {
+                    'type': 'string', 'nullable': True, 'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
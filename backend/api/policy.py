@@ -0,0 +1,126 @@
+"""Choice of model tier and output budget for a blog generation.
+
+The reference text is measured in tokens and matched against
+``settings.GENERATION_TIERS``, smallest first. A tier names the model role
+to use (``fast`` maps to each provider's ``fast_model``), the output budget
+and the temperature. The requested depth then scales the budget, so a short
+clip asked for a brief post gets a small, quick completion while a lecture
+asked for a detailed one gets the full budget.
+
+Tokens are counted with tiktoken and estimated from words and punctuation
+when its encoding cannot be loaded. tiktoken downloads an encoding the first
+time it is used, so the app loads it once at startup (``load_encoding``)
+rather than inside a request.
+"""
+import logging
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .metrics import REGISTRY
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEPTH_BRIEF = 'brief'
+DEPTH_STANDARD = 'standard'
+DEPTH_DETAILED = 'detailed'
+DEPTH_CHOICES = [DEPTH_BRIEF, DEPTH_STANDARD, DEPTH_DETAILED]
+
+# Words, numbers and single punctuation marks, the units BPE tokenizers
+# split English text into before merging
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+TIER_CHOICES = REGISTRY.counter(
+    'blog_generation_tier_total',
+    'Blog generations per selected policy tier and depth',
+    ['tier', 'depth'],
+)
+
+
+_encoding = None
+
+
+def load_encoding():
+    """Load the configured encoding, None if it cannot be loaded"""
+    global _encoding
+    _encoding = None
+    if tiktoken is None:
+        logger.warning("tiktoken is not installed; estimating tokens")
+        return None
+    try:
+        _encoding = tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(
+            "Could not load the %s encoding (%s); estimating tokens",
+            settings.TOKENIZER_ENCODING, e,
+        )
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text for the configured encoding"""
+    encoding = _encoding
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Long words are usually split into several tokens
+    return sum(
+        1 + len(piece) // 8 for piece in _PIECE_RE.findall(text)
+    )
+
+
+@dataclass(frozen=True)
+class GenerationPolicy:
+    tier: str
+    role: str
+    max_tokens: int
+    temperature: float
+    input_tokens: int
+    depth: str
+
+    def as_kwargs(self) -> dict:
+        return {
+            'role': self.role,
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperature,
+        }
+
+
+def choose_policy(reference: str,
+                  depth: str = DEPTH_STANDARD) -> GenerationPolicy:
+    """Policy for writing a blog from reference at the requested depth"""
+    input_tokens = count_tokens(reference)
+    tiers = settings.GENERATION_TIERS
+    tier = next(
+        (
+            tier for tier in tiers
+            if tier.get('max_input_tokens') is None
+            or input_tokens <= tier['max_input_tokens']
+        ),
+        tiers[-1],
+    )
+    factor = settings.BLOG_DEPTH_FACTORS.get(depth, 1.0)
+    policy = GenerationPolicy(
+        tier=tier['name'],
+        role=tier.get('role', 'blog'),
+        max_tokens=max(256, min(
+            round(tier['max_tokens'] * factor),
+            settings.BLOG_MAX_OUTPUT_TOKENS,
+        )),
+        temperature=tier.get('temperature', 0.9),
+        input_tokens=input_tokens,
+        depth=depth,
+    )
+    TIER_CHOICES.inc(tier=policy.tier, depth=depth)
+    logger.info(
+        "Generation policy: tier=%s role=%s input_tokens=%d depth=%s "
+        "max_tokens=%d temperature=%s",
+        policy.tier, policy.role, policy.input_tokens, policy.depth,
+        policy.max_tokens, policy.temperature,
+    )
+    return policy
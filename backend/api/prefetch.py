@@ -0,0 +1,101 @@
+"""Speculative warming of the video info and transcript caches.
+
+The frontend sends a prefetch as soon as a URL is pasted, so by the time the
+user asks for a blog only the LLM call is left. Prefetches run on a small
+thread pool per process and are deduplicated by video: a video already
+queued or running is not queued again, and the fetch itself is skipped when
+both caches are already warm. At most ``PREFETCH_MAX_PENDING`` videos are
+queued or running, and at most ``PREFETCH_MAX_PENDING_PER_USER`` of them for
+one user, so a single user pasting many URLs cannot take the whole queue.
+Further prefetches are dropped rather than queued, so they can never hold
+up request workers.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import REGISTRY
+from .services import BlogGenerator
+from .youtube import canonical_url
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+PENDING = 'pending'
+DROPPED = 'dropped'
+
+PREFETCHES = REGISTRY.counter(
+    'transcript_prefetch_total',
+    'Prefetch requests by outcome',
+    ['outcome'],
+)
+
+_lock = threading.Lock()
+# User that queued each video that is queued or running
+_pending = {}
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PREFETCH_WORKERS,
+            thread_name_prefix='prefetch',
+        )
+    return _executor
+
+
+def _warm(video_id: str):
+    try:
+        generator = BlogGenerator()
+        generator.get_transcript_segments(video_id)
+        generator.get_video_info(canonical_url(video_id))
+        PREFETCHES.inc(outcome='done')
+    except Exception as e:
+        # The generate request reports the error if the user goes ahead
+        PREFETCHES.inc(outcome='failed')
+        logger.info("Prefetch of %s failed: %s", video_id, e)
+    finally:
+        connection.close()
+        with _lock:
+            _pending.pop(video_id, None)
+
+
+def prefetch(video_id: str, user_id=None) -> str:
+    """Warm the caches for a video in the background for a user.
+
+    Returns QUEUED when a fetch was started, PENDING when one is already
+    queued or running for the video, and DROPPED when the queue, or the
+    user's share of it, is full.
+    """
+    with _lock:
+        if video_id in _pending:
+            outcome = PENDING
+        elif len(_pending) >= settings.PREFETCH_MAX_PENDING or (
+            sum(1 for owner in _pending.values() if owner == user_id)
+            >= settings.PREFETCH_MAX_PENDING_PER_USER
+        ):
+            outcome = DROPPED
+        else:
+            _pending[video_id] = user_id
+            _get_executor().submit(_warm, video_id)
+            outcome = QUEUED
+    PREFETCHES.inc(outcome=outcome)
+    return outcome
+
+
+def reset():
+    """Forget the pool and pending videos, e.g. after a fork"""
+    global _lock, _executor
+    _lock = threading.Lock()
+    _pending.clear()
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
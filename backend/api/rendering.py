@@ -0,0 +1,140 @@
+"""Representations of a blog post built once, when the post is written.
+
+The markdown body is rendered to HTML as it is saved, so clients need no
+markdown parser. The detail response is then serialized and stored
+compressed in every encoding the server supports (``BlogRendition``), and
+the detail view sends those bytes as they are to clients that accept one
+of them: no serializing, rendering or compressing per request. A stored
+response carries the ``updated_at`` of the post it was built from and is
+only served while that still matches, so writes that skip
+store_renditions() fall back to the regular view instead of serving a
+stale post. The detail ETag is weak and shared by all encodings, which
+are the same representation.
+"""
+import gzip
+import re
+
+from django.db.models import F
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import track_stage
+from .models import BlogRendition
+from .serializers import BlogResponseSerializer
+
+try:
+    import markdown
+except ImportError:  # pragma: no cover - optional dependency
+    markdown = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Tables, fenced code and lists as remark-gfm renders them on the client
+MARKDOWN_EXTENSIONS = ['tables', 'fenced_code', 'sane_lists']
+SAFE_SCHEMES = {'http', 'https', 'mailto'}
+URL_PATH_RE = re.compile(r'[/?#]')
+
+# Content codings stored for every post, most preferred first; each is
+# also the name of its BlogRendition field
+ENCODINGS = {'gzip': gzip.compress}
+if brotli is not None:
+    ENCODINGS = {'br': brotli.compress, **ENCODINGS}
+
+
+class SafeLinks:
+    """Treeprocessor that drops script URLs and opens links in a new tab.
+
+    Runs after escapes are restored. A URL is kept if it is relative or
+    its scheme is one of SAFE_SCHEMES; anything with a colon before its
+    path, such as "javascript:", is dropped.
+    """
+
+    def run(self, root):
+        for element in root.iter():
+            if element.tag not in ('a', 'img'):
+                continue
+            attribute = 'href' if element.tag == 'a' else 'src'
+            url = ''.join(element.get(attribute, '').split())
+            head = URL_PATH_RE.split(url, maxsplit=1)[0]
+            scheme, colon, _ = head.partition(':')
+            if colon and scheme.lower() not in SAFE_SCHEMES:
+                element.attrib.pop(attribute, None)
+            if element.tag == 'a':
+                element.set('target', '_blank')
+                element.set('rel', 'noopener noreferrer')
+
+
+def render_html(content: str) -> str:
+    """HTML of a markdown body, or '' without the markdown package.
+
+    Raw HTML in the markdown is escaped rather than passed through, as
+    react-markdown does, since the body comes from an LLM prompted with
+    third-party captions.
+    """
+    if markdown is None:
+        return ''
+    # Markdown instances keep state between conversions; one per call keeps
+    # this safe on the generation threads
+    parser = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    parser.preprocessors.deregister('html_block')
+    parser.inlinePatterns.deregister('html')
+    parser.treeprocessors.register(SafeLinks(), 'safe_links', -1)
+    return parser.convert(content)
+
+
+def build_rendition(post) -> BlogRendition:
+    """Compress the detail response of a saved post, body loaded"""
+    response = JSONRenderer().render(BlogResponseSerializer(post).data)
+    return BlogRendition(
+        post=post,
+        updated_at=post.updated_at,
+        **{
+            encoding: compress(response)
+            for encoding, compress in ENCODINGS.items()
+        },
+    )
+
+
+def store_renditions(posts):
+    """Build and store the compressed detail responses of saved posts"""
+    with track_stage("render"):
+        renditions = [build_rendition(post) for post in posts]
+    BlogRendition.objects.bulk_create(
+        renditions,
+        update_conflicts=True,
+        unique_fields=['post'],
+        update_fields=['updated_at', 'gzip', 'br'],
+    )
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """The stored encoding a client accepts best, None for none of them"""
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def stored_response(user, pk, encoding: str) -> bytes | None:
+    """The user's post compressed with encoding, None if missing or stale"""
+    body = BlogRendition.objects.filter(
+        post_id=pk, post__user=user, updated_at=F('post__updated_at')
+    ).values_list(encoding, flat=True).first()
+    return bytes(body) if body is not None else None
@@ -0,0 +1,132 @@
+"""Full-text search over a user's blog posts.
+
+Posts are indexed in the ``api_blogsearch`` FTS5 table (migration 0013),
+which triggers keep in sync with ``api_blogpost`` and ``api_blogcontent``.
+Every search is scoped to its user through the indexed ``owner`` column, so
+it only ever visits the user's own posts.
+
+Results are ranked in tiers: posts with every word in the blog title, then
+in the video title, then anywhere in the post, newest first within a tier.
+The two title tiers are small, so they are collected whole, and the posts
+of the last tier are read from the index in rowid order until the page is
+full, skipping those already in a title tier. Only the posts on the page
+are highlighted. bm25 is not used: its document frequencies walk the whole
+index entry of every word, for all users, which costs over 100ms per
+common word at a million posts. Neither are prefix queries, which merge
+the entries of every word with the prefix, for all users, before the
+owner can narrow them down. Words are matched by their stem instead, so
+"baking" finds "bake".
+"""
+import html
+import re
+
+from django.db import connection
+
+TITLE = 0
+VIDEO_TITLE = 1
+BODY = 2
+
+# Markers put around matched terms by SQLite; the text is escaped before
+# they are turned into <mark> tags, so post content can never inject HTML
+MARK_START = '\x02'
+MARK_END = '\x03'
+ELLIPSIS = '…'
+SNIPPET_TOKENS = 24
+
+TERM_RE = re.compile(r'\w+')
+
+SEARCH_SQL = f"""
+    WITH title_tier(id) AS (
+        SELECT rowid FROM api_blogsearch
+        WHERE api_blogsearch MATCH %(title)s
+    ),
+    video_title_tier(id) AS (
+        SELECT rowid FROM api_blogsearch
+        WHERE api_blogsearch MATCH %(video_title)s
+    ),
+    page(id, tier) AS (
+        SELECT id, {TITLE} FROM title_tier
+        UNION ALL
+        SELECT id, {VIDEO_TITLE} FROM video_title_tier
+        WHERE id NOT IN title_tier
+        UNION ALL
+        SELECT rowid, {BODY} FROM api_blogsearch
+        WHERE api_blogsearch MATCH %(anywhere)s
+            AND rowid NOT IN title_tier
+            AND rowid NOT IN video_title_tier
+        ORDER BY 2, 1 DESC
+        LIMIT %(limit)s OFFSET %(offset)s
+    )
+    SELECT page.tier, api_blogpost.id, api_blogpost.youtube_title,
+           api_blogpost.blog_title, api_blogpost.author_name,
+           api_blogpost.created_at, api_blogpost.updated_at,
+           highlight(api_blogsearch, 1, char(2), char(3)),
+           snippet(api_blogsearch, 3, char(2), char(3), '{ELLIPSIS}',
+                   {SNIPPET_TOKENS})
+    FROM page
+    CROSS JOIN api_blogsearch
+    JOIN api_blogpost ON api_blogpost.id = page.id
+    WHERE api_blogsearch MATCH %(anywhere)s
+        AND api_blogsearch.rowid = page.id
+"""
+
+
+def match_expressions(user_id: int, query: str) -> dict | None:
+    """FTS5 queries for the words of query in the user's posts.
+
+    Returns the queries for the words in the blog title, in the video
+    title and anywhere. Words are quoted, so FTS5 operators typed by the
+    user match as plain text, and only match the text columns, never the
+    owner. None when query has no words.
+    """
+    terms = TERM_RE.findall(query)
+    if not terms:
+        return None
+    words = ' AND '.join(f'"{term}"' for term in terms)
+    owner = f'owner : "u{user_id}"'
+    return {
+        'title': f'{owner} AND title : ({words})',
+        'video_title': f'{owner} AND video_title : ({words})',
+        'anywhere': f'{owner} AND {{title video_title body}} : ({words})',
+    }
+
+
+def mark(text: str) -> str:
+    """Escape text and turn the match markers into <mark> tags"""
+    return html.escape(text).replace(MARK_START, '<mark>').replace(
+        MARK_END, '</mark>'
+    )
+
+
+def search_posts(user, query: str, limit: int, offset: int = 0) -> list:
+    """Posts of user matching query, best first.
+
+    Each result holds the blog list fields plus ``title_highlight``, the
+    blog title, and ``snippet``, the best matching passage of the body,
+    both HTML-escaped with matched terms in <mark> tags.
+    """
+    expressions = match_expressions(user.pk, query)
+    if expressions is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, {
+            **expressions, 'limit': limit, 'offset': offset,
+        })
+        rows = cursor.fetchall()
+    # The page comes out of the join in no particular order
+    rows.sort(key=lambda row: (row[0], -row[1]))
+    field = connection.ops.convert_datetimefield_value
+    results = []
+    for (tier, pk, youtube_title, blog_title, author_name, created_at,
+         updated_at, title_highlight, snippet) in rows:
+        results.append({
+            'id': pk,
+            'youtube_title': youtube_title,
+            'blog_title': blog_title,
+            'author_name': author_name,
+            'created_at': field(created_at, None, connection),
+            'updated_at': field(updated_at, None, connection),
+            'title_highlight': mark(title_highlight),
+            'snippet': mark(snippet),
+        })
+    return results
@@ -1,6 +1,36 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from .models import BlogPost
+from .models import BlogPost, GenerationJob
+from .policy import DEPTH_CHOICES, DEPTH_STANDARD
+from .search import match_expressions
+from .youtube import canonical_url, collection_url, extract_video_id
+
+
+def parse_bool(value):
+    """Convert string value to boolean, case-insensitive"""
+    if value is None:
+        return False
+
+    if isinstance(value, bool):
+        return value
+
+    if isinstance(value, str):
+        return value.lower() in ['true', 't', 'yes', 'y', '1']
+
+    return bool(value)
+
+
+class DepthField(serializers.ChoiceField):
+    """The depth option of every generation request"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('default', DEPTH_STANDARD)
+        kwargs.setdefault('help_text', (
+            "How long and detailed the post should be: 'brief', 'standard' "
+            "or 'detailed'. Short videos use a faster model either way."
+        ))
+        super().__init__(DEPTH_CHOICES, **kwargs)
 
 
 class BlogRequestSerializer(serializers.Serializer):
@@ -8,7 +38,7 @@ class BlogRequestSerializer(serializers.Serializer):
         required=True,
         help_text=(
             "YouTube video URL to generate blog post from. Supports standard, "
-            "shortened, and embed URLs."
+            "shortened, shorts and embed URLs, with or without timestamps."
         ),
     )
     regen = serializers.CharField(
@@ -21,29 +51,125 @@ class BlogRequestSerializer(serializers.Serializer):
         ),
     )
 
+    background = serializers.CharField(
+        required=False,
+        default="false",
+        allow_null=True,
+        help_text=(
+            "Set to 'true' to queue generation as a background job. The "
+            "response is then 202 with a job to poll instead of the blog "
+            "post. Case-insensitive. Defaults to 'false' if not provided."
+        ),
+    )
+    depth = DepthField()
+
+    def validate_url(self, value):
+        """Reduce any YouTube URL form to its canonical watch URL"""
+        try:
+            return canonical_url(extract_video_id(value))
+        except ValueError:
+            raise serializers.ValidationError(
+                "Enter a valid YouTube video URL"
+            )
+
+    def validate_regen(self, value):
+        return parse_bool(value)
+
+    def validate_background(self, value):
+        return parse_bool(value)
+
+
+class PrefetchRequestSerializer(serializers.Serializer):
+    url = serializers.CharField(
+        help_text="YouTube video URL the user is about to generate from.",
+    )
+
+    def validate_url(self, value):
+        try:
+            return extract_video_id(value)
+        except ValueError:
+            raise serializers.ValidationError(
+                "Enter a valid YouTube video URL"
+            )
+
+
+class PrefetchResponseSerializer(serializers.Serializer):
+    video_id = serializers.CharField()
+    url = serializers.CharField()
+    status = serializers.ChoiceField(
+        choices=['queued', 'pending', 'dropped'],
+        help_text=(
+            "'queued' when a fetch was started, 'pending' when one is "
+            "already running and 'dropped' when the server is busy or "
+            "the user already has the most prefetches in flight."
+        ),
+    )
+
+
+class BatchBlogRequestSerializer(serializers.Serializer):
+    urls = serializers.ListField(
+        child=serializers.CharField(),
+        min_length=1,
+        max_length=settings.BLOG_BATCH_MAX_URLS,
+        help_text=(
+            "YouTube video URLs to generate blog posts from. Invalid URLs "
+            "are reported per item and do not fail the batch."
+        ),
+    )
+    regen = serializers.CharField(
+        required=False,
+        default="false",
+        allow_null=True,
+        help_text=(
+            "Set to 'true' to regenerate videos you already have blog posts "
+            "for. Case-insensitive. Defaults to 'false' if not provided."
+        ),
+    )
+    depth = DepthField()
+
     def validate_regen(self, value):
-        """Convert string value to boolean, case-insensitive"""
-        if value is None:
-            return False
-            
-        if isinstance(value, bool):
-            return value
-            
-        if isinstance(value, str):
-            return value.lower() in ['true', 't', 'yes', 'y', '1']
-            
-        return bool(value)
+        return parse_bool(value)
+
+
+class PlaylistRequestSerializer(serializers.Serializer):
+    url = serializers.CharField(
+        help_text=(
+            "YouTube playlist or channel URL. Channel URLs without a tab "
+            "use the channel's uploads."
+        ),
+    )
+    depth = DepthField()
+
+    def validate_url(self, value):
+        try:
+            return collection_url(value)
+        except ValueError:
+            raise serializers.ValidationError(
+                "Enter a valid YouTube playlist or channel URL"
+            )
 
 
 class BlogResponseSerializer(serializers.ModelSerializer):
+    content = serializers.CharField(source='body.content', read_only=True)
+    html = serializers.CharField(
+        source='body.html',
+        read_only=True,
+        help_text=(
+            "The content rendered to HTML when the post was saved, with "
+            "raw HTML escaped. Empty if the server cannot render markdown."
+        ),
+    )
+
     class Meta:
         model = BlogPost
         fields = [
             "id",
             "youtube_url",
+            "video_id",
             "youtube_title",
             "blog_title",
             "content",
+            "html",
             "author_name",
             "created_at",
             "updated_at",
@@ -52,6 +178,8 @@ class BlogResponseSerializer(serializers.ModelSerializer):
 
 
 class BlogListSerializer(serializers.ModelSerializer):
+    """Documents the blog list; the view renders values() rows directly"""
+
     class Meta:
         model = BlogPost
         fields = [
@@ -63,3 +191,63 @@ class BlogListSerializer(serializers.ModelSerializer):
             "updated_at",
         ]
         read_only_fields = fields
+
+
+class BlogSearchRequestSerializer(serializers.Serializer):
+    q = serializers.CharField(
+        max_length=200,
+        help_text=(
+            "Words to search for. Posts must contain all of them, in any "
+            "form: 'baking' also finds 'bake' and 'baked'."
+        ),
+    )
+
+    def validate_q(self, value):
+        if match_expressions(0, value) is None:
+            raise serializers.ValidationError("Enter at least one word")
+        return value
+
+
+class BlogSearchResultSerializer(BlogListSerializer):
+    """Documents search results; the view renders them directly"""
+    title_highlight = serializers.CharField(
+        help_text="HTML-escaped blog title with matches in <mark> tags.",
+    )
+    snippet = serializers.CharField(
+        help_text=(
+            "HTML-escaped passage of the post that best matches, with "
+            "matches in <mark> tags."
+        ),
+    )
+
+    class Meta(BlogListSerializer.Meta):
+        fields = BlogListSerializer.Meta.fields + [
+            "title_highlight",
+            "snippet",
+        ]
+        read_only_fields = fields
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    blog_post = BlogResponseSerializer(read_only=True)
+
+    class Meta:
+        model = GenerationJob
+        fields = [
+            "id",
+            "kind",
+            "youtube_url",
+            "depth",
+            "status",
+            "error",
+            "blog_post",
+            "total_items",
+            "completed_items",
+            "failed_items",
+            "skipped_items",
+            "results",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
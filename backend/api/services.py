@@ -1,48 +1,322 @@
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import hashlib
 import json
+import logging
 
-import openai
-import yt_dlp
 from youtube_transcript_api import YouTubeTranscriptApi
 from django.conf import settings
+from django.db import transaction
+
+from .cache import transcript_cache, video_info_cache
+from .clients import borrow_ydl, new_ydl, run_blocking
+from .compression import (
+    compress_segments,
+    select_sentences,
+    split_sentences,
+)
+from .llm import get_router
+from .metrics import record_usage, track_stage
+from .models import BlogContent, BlogPost, ChunkSummary
+from .policy import (
+    DEPTH_BRIEF,
+    DEPTH_DETAILED,
+    DEPTH_STANDARD,
+    choose_policy,
+    count_tokens,
+)
+from .rendering import render_html, store_renditions
+from .singleflight import asingle_flight, flight_key, single_flight
+from .usage import Usage, check_quota, record_generation
+from .youtube import VIDEO_ID_RE, canonical_url, extract_video_id
+
+logger = logging.getLogger(__name__)
+# Bump when the blog prompt changes so in-flight generations are not joined
+# across prompt versions
+BLOG_PROMPT_VERSION = 2
+
+DEPTH_INSTRUCTIONS = {
+    DEPTH_BRIEF: "Keep the post concise and focused on the key points.",
+    DEPTH_STANDARD: "Write comprehensive, detailed content.",
+    DEPTH_DETAILED: (
+        "Write an in-depth, thorough post that covers every point of the "
+        "source with explanations and examples."
+    ),
+}
+
+# Bump when the chunk summary prompt changes so cached summaries are not reused
+SUMMARY_PROMPT_VERSION = 1
+# Chunk summaries are asked for at least this many words, and summarized
+# again at most this many times in total when they do not fit together
+SUMMARY_MIN_WORDS = 50
+SUMMARY_MAX_ROUNDS = 3
+
+
+def chunk_segments(segments: List[Dict], max_chars: int) -> List[str]:
+    """Group transcript segments into chunks of at most max_chars.
+
+    Chunks only break between segments, so no caption is ever cut in half.
+    A single segment longer than max_chars becomes a chunk of its own.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for segment in segments:
+        text = segment["text"].strip()
+        if not text:
+            continue
+        if current and size + len(text) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current = []
+            size = 0
+        current.append(text)
+        size += len(text) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
 
 
 class BlogGenerator:
-    def __init__(self, api_key: str):
-        self.client = openai.OpenAI(
-            api_key=api_key,
-            base_url=settings.OPENAI_BASE_URL,
-        )
-        self.ydl = yt_dlp.YoutubeDL({"quiet": True})
+    def __init__(self, router=None):
+        self.llm = router or get_router()
 
     def get_video_info(self, url: str) -> Dict:
-        """Extract video title and ID from YouTube URL"""
+        """Extract video title and ID from YouTube URL, cached per video"""
         try:
-            info = self.ydl.extract_info(url, download=False)
-            return {"title": info["title"], "video_id": info["id"]}
+            video_id = extract_video_id(url)
+        except ValueError:
+            video_id = None
+        if video_id:
+            info = video_info_cache.get(video_id)
+            if info is not None:
+                return info
+
+        try:
+            with track_stage("video_info"), borrow_ydl() as ydl:
+                info = ydl.extract_info(url, download=False)
+            info = {"title": info["title"], "video_id": info["id"]}
         except Exception as e:
             raise ValueError(f"Failed to fetch video info: {str(e)}")
 
-    def get_transcript(self, video_id: str) -> str:
-        """Get video transcript"""
+        video_info_cache.set(info["video_id"], info)
+        return info
+
+    def list_videos(self, url: str, limit: int) -> List[Dict]:
+        """Enumerate a playlist or channel without per-video extraction.
+
+        Uses yt-dlp's flat extraction, which reads only the listing pages,
+        so each entry costs no extra request. Returns dicts with the video
+        id and title, in playlist order.
+        """
+        ydl = new_ydl({
+            "extract_flat": "in_playlist",
+            "playlistend": limit,
+        })
         try:
-            transcript = YouTubeTranscriptApi.get_transcript(video_id)
-            return " ".join(segment["text"] for segment in transcript)
+            with track_stage("playlist"):
+                info = ydl.extract_info(url, download=False)
+        except Exception as e:
+            raise ValueError(f"Failed to fetch playlist: {str(e)}")
+        finally:
+            ydl.close()
+
+        videos = []
+        for entry in info.get("entries") or []:
+            video_id = entry.get("id") or ""
+            if entry.get("ie_key", "Youtube") != "Youtube":
+                continue
+            if VIDEO_ID_RE.fullmatch(video_id):
+                videos.append({
+                    "video_id": video_id,
+                    "title": entry.get("title") or "",
+                })
+        return videos
+
+    def get_transcript_segments(
+        self, video_id: str, language: str = None
+    ) -> List[Dict]:
+        """Get timed transcript segments, served from the cache when possible"""
+        language = language or settings.TRANSCRIPT_LANGUAGE
+        segments = transcript_cache.get(video_id, language)
+        if segments is not None:
+            return segments
+
+        try:
+            with track_stage("transcript"):
+                segments = YouTubeTranscriptApi.get_transcript(
+                    video_id,
+                    languages=[language],
+                )
         except Exception as e:
             raise ValueError(f"Failed to fetch transcript: {str(e)}")
 
-    def generate_blog(self, transcript: str, video_title: str) -> Dict:
-        """Generate blog post using OpenAI-compatible API"""
+        transcript_cache.set(video_id, language, segments)
+        return segments
+
+    def get_transcript(self, video_id: str, language: str = None) -> str:
+        """Get video transcript"""
+        segments = self.get_transcript_segments(video_id, language)
+        return " ".join(segment["text"] for segment in segments)
+
+    def summarize_chunk(self, chunk: str, index: int, total: int,
+                        max_words: int, usage: Usage = None) -> str:
+        """Summarize one transcript chunk for the final composition step"""
+        with track_stage("summarize"):
+            response = self.llm.create(
+                role="summary",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "You summarize parts of video transcripts. Keep "
+                            "every key point, name, number and example. "
+                            "Return plain text only."
+                        ),
+                    },
+                    {
+                        "role": "user",
+                        "content": (
+                            f"This is part {index + 1} of {total} of a video "
+                            f"transcript. Summarize it in at most {max_words} "
+                            f"words.\n\n{chunk}"
+                        ),
+                    },
+                ],
+                temperature=0.3,
+                max_tokens=max_words * 2,
+            )
+        self.count_usage(response.model, response.usage, usage)
+        return response.choices[0].message.content.strip()
+
+    def count_usage(self, model: str, response_usage, usage: Usage = None):
+        """Report a response's tokens to metrics and the generation's usage"""
+        record_usage(model, response_usage)
+        if usage is not None:
+            usage.add(model, response_usage)
+
+    def summarize_chunks(self, video_id: str, chunks: List[str],
+                         max_words: int, usage: Usage = None) -> List[str]:
+        """Summaries of chunks in order, from the store where possible"""
+        digests = [
+            hashlib.sha256(
+                f"{SUMMARY_PROMPT_VERSION}:{settings.SUMMARY_MODEL}:"
+                f"{max_words}:{chunk}".encode()
+            ).hexdigest()
+            for chunk in chunks
+        ]
+
+        summaries = dict(
+            ChunkSummary.objects.filter(digest__in=digests)
+            .values_list('digest', 'summary')
+        )
+        missing = [
+            index for index, digest in enumerate(digests)
+            if digest not in summaries
+        ]
+
+        if missing:
+            try:
+                with ThreadPoolExecutor(
+                    max_workers=settings.SUMMARY_CONCURRENCY
+                ) as executor:
+                    results = executor.map(
+                        lambda index: self.summarize_chunk(
+                            chunks[index], index, len(chunks), max_words,
+                            usage,
+                        ),
+                        missing,
+                    )
+                    fresh = {
+                        digests[index]: summary
+                        for index, summary in zip(missing, results)
+                    }
+            except Exception as e:
+                logger.exception("Summarizing the transcript of %s failed",
+                                 video_id)
+                raise ValueError(f"Failed to summarize transcript: {str(e)}")
+
+            ChunkSummary.objects.bulk_create(
+                [
+                    ChunkSummary(
+                        digest=digest,
+                        video_id=video_id,
+                        summary=summary,
+                    )
+                    for digest, summary in fresh.items()
+                ],
+                ignore_conflicts=True,
+            )
+            summaries.update(fresh)
+
+        return [summaries[digest] for digest in digests]
+
+    def prepare_reference(self, video_id: str, segments: List[Dict],
+                          usage: Usage = None) -> str:
+        """Reference text for the blog prompt, within the prompt budget.
+
+        Captions are first compressed: merged into sentences, cleaned of
+        markers and fillers, and deduplicated. Short results are used as
+        they are. Results within a few times the budget are cut down to
+        their most central sentences. Longer ones are split on sentence
+        boundaries, the chunks are summarized concurrently, and the
+        summaries are joined in order. Summaries that together exceed the
+        budget are chunked and summarized again, up to SUMMARY_MAX_ROUNDS
+        times, and whatever still exceeds it is cut to its most central
+        sentences, so the result always fits BLOG_REFERENCE_MAX_TOKENS.
+        Chunk summaries are stored so a regeneration only pays for the
+        final composition call.
+        """
+        budget = settings.BLOG_REFERENCE_MAX_TOKENS
+        with track_stage("compress"):
+            sentences = compress_segments(segments)
+            transcript = " ".join(sentences)
+            tokens = count_tokens(transcript)
+            if tokens <= budget:
+                return transcript
+            if tokens <= budget * settings.EXTRACTIVE_MAX_RATIO:
+                return " ".join(select_sentences(sentences, budget))
+
+        chunks = chunk_segments(
+            [{"text": sentence} for sentence in sentences],
+            settings.TRANSCRIPT_CHUNK_CHARS,
+        )
+        for _ in range(SUMMARY_MAX_ROUNDS):
+            # About four tokens for every three words
+            max_words = max(
+                SUMMARY_MIN_WORDS, budget * 3 // 4 // len(chunks)
+            )
+            summaries = self.summarize_chunks(
+                video_id, chunks, max_words, usage
+            )
+            reference = "\n\n".join(summaries)
+            if count_tokens(reference) <= budget or len(summaries) == 1:
+                break
+            chunks = chunk_segments(
+                [{"text": summary} for summary in summaries],
+                settings.TRANSCRIPT_CHUNK_CHARS,
+            )
+
+        if count_tokens(reference) > budget:
+            with track_stage("compress"):
+                reference = " ".join(
+                    select_sentences(split_sentences(reference), budget)
+                )
+        return reference
+
+    def build_messages(self, transcript: str, video_title: str,
+                       depth: str = DEPTH_STANDARD) -> List[Dict]:
+        """Chat messages asking for a blog post about the transcript"""
         system_prompt = (
             "You are a professional blog writer. Create a unique blog post "
             "with a clear structure. Return only a JSON object with 'title' "
             "and 'content' fields. Each generation should be different "
-            "even for the same input. Write comprehensive, detailed content."
+            f"even for the same input. {DEPTH_INSTRUCTIONS[depth]}"
         )
 
         user_prompt = (
             f"Topic: {video_title}\n\n"
-            f"Reference content:\n{transcript[:8000]}\n\n"
+            "Reference content:\n"
+            f"{transcript}\n\n"
             "Instructions:\n"
             "1. Write a unique, comprehensive blog post\n"
             "2. Use markdown formatting\n"
@@ -55,36 +329,306 @@ class BlogGenerator:
             '{"title": "Unique Title", "content": "# Heading\\n\\nContent"}'
         )
 
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def parse_blog(self, content: str) -> Dict:
+        """Parse and validate the model's JSON answer"""
         try:
-            response = self.client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.9,
-                max_tokens=8000,
-                response_format={"type": "json_object"}
-            )
+            text = content.strip()
+            # Streamed answers are not forced into JSON mode and sometimes
+            # arrive wrapped in a markdown code fence
+            if text.startswith("```"):
+                text = text.strip("`")
+                text = text[text.find("{"):]
+            parsed_content = json.loads(text)
+        except json.JSONDecodeError:
+            logger.exception("Could not parse the model's answer: %r", content)
+            raise ValueError("Failed to parse AI response")
 
-            try:
-                content = response.choices[0].message.content
-                parsed_content = json.loads(content.strip())
-                
-                # Validate response structure
-                if not isinstance(parsed_content, dict):
-                    raise ValueError("Response is not a dictionary")
-                
-                if not all(k in parsed_content for k in ['title', 'content']):
-                    raise ValueError("Missing required fields")
-                
-                return parsed_content
-
-            except json.JSONDecodeError as e:
-                print(f"JSON Parse Error: {str(e)}")
-                print(f"Raw content: {content}")
-                raise ValueError("Failed to parse AI response")
+        # Validate response structure
+        if not isinstance(parsed_content, dict):
+            raise ValueError("Response is not a dictionary")
+
+        if not all(k in parsed_content for k in ['title', 'content']):
+            raise ValueError("Missing required fields")
+
+        return parsed_content
+
+    def blog_request(self, transcript: str, video_title: str,
+                     depth: str = DEPTH_STANDARD) -> Dict:
+        """Arguments of the blog completion, sized by the policy layer.
+
+        transcript is the prepared reference, already within the prompt
+        budget, and the policy measures all of it.
+        """
+        policy = choose_policy(transcript, depth)
+        return {
+            "messages": self.build_messages(transcript, video_title, depth),
+            **policy.as_kwargs(),
+        }
+
+    def generate_blog(self, transcript: str, video_title: str,
+                      usage: Usage = None,
+                      depth: str = DEPTH_STANDARD) -> Dict:
+        """Generate blog post using OpenAI-compatible API"""
+        try:
+            with track_stage("llm"):
+                response = self.llm.create(
+                    **self.blog_request(transcript, video_title, depth),
+                    response_format={"type": "json_object"}
+                )
+            self.count_usage(response.model, response.usage, usage)
+            return self.parse_blog(response.choices[0].message.content)
 
         except Exception as e:
-            print(f"Generation Error: {str(e)}")
+            logger.exception("Blog generation failed")
             raise ValueError(f"Failed to generate blog: {str(e)}")
+
+    async def agenerate_blog(self, transcript: str, video_title: str,
+                             usage: Usage = None,
+                             depth: str = DEPTH_STANDARD) -> Dict:
+        """generate_blog for coroutines, awaiting the API call"""
+        try:
+            with track_stage("llm"):
+                response = await self.llm.acreate(
+                    **self.blog_request(transcript, video_title, depth),
+                    response_format={"type": "json_object"}
+                )
+            self.count_usage(response.model, response.usage, usage)
+            return self.parse_blog(response.choices[0].message.content)
+
+        except Exception as e:
+            logger.exception("Blog generation failed")
+            raise ValueError(f"Failed to generate blog: {str(e)}")
+
+    def stream_blog(self, transcript: str, video_title: str,
+                    depth: str = DEPTH_STANDARD):
+        """Start a streamed completion and return the open stream.
+
+        The caller owns the stream and must close it, which also stops
+        the provider from generating tokens nobody will read.
+        """
+        try:
+            return self.llm.create(
+                **self.blog_request(transcript, video_title, depth),
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        except Exception as e:
+            logger.exception("Starting the blog stream failed")
+            raise ValueError(f"Failed to generate blog: {str(e)}")
+
+
+def save_blog_post(user, video_id: str, video_title: str,
+                   blog_data: Dict) -> BlogPost:
+    """Create or overwrite the user's blog post for a video"""
+    html = render_html(blog_data['content'])
+    with track_stage("db_write"), transaction.atomic():
+        blog_post, _ = BlogPost.objects.update_or_create(
+            video_id=video_id,
+            user=user,
+            defaults={
+                'youtube_url': canonical_url(video_id),
+                'youtube_title': video_title,
+                'blog_title': blog_data['title'],
+                'author_name': (
+                    f"{user.first_name} {user.last_name}".strip() or
+                    user.email
+                )
+            }
+        )
+        blog_post.body, _ = BlogContent.objects.update_or_create(
+            post=blog_post,
+            defaults={'content': blog_data['content'], 'html': html},
+        )
+    store_renditions([blog_post])
+    return blog_post
+
+
+async def asave_blog_post(user, video_id: str, video_title: str,
+                          blog_data: Dict) -> BlogPost:
+    """save_blog_post for async views.
+
+    The post and its body are written in one transaction, which the async
+    ORM cannot open, so this runs save_blog_post on the blocking pool.
+    """
+    return await run_blocking(
+        save_blog_post, user, video_id, video_title, blog_data
+    )
+
+
+def generation_flight_key(video_id: str,
+                          depth: str = DEPTH_STANDARD) -> str:
+    """Requests with the same key would produce interchangeable posts"""
+    return flight_key(
+        video_id, settings.OPENAI_MODEL, BLOG_PROMPT_VERSION, depth
+    )
+
+
+def generate_blog_post(user, url: str,
+                       depth: str = DEPTH_STANDARD) -> BlogPost:
+    """Run the full generation pipeline for a URL and store the result.
+
+    Creates the user's blog post for the video or overwrites the existing
+    one. Concurrent requests for the same video share one generation.
+    Raises QuotaExceeded before doing any work when the user is over the
+    monthly token quota, and ValueError when any generation stage fails.
+    """
+    video_id = extract_video_id(url)
+    check_quota(user)
+
+    usage = Usage()
+    blog_post = None
+    try:
+        with single_flight(generation_flight_key(video_id, depth)) as flight:
+            shared = flight.result()
+            if shared is not None:
+                return save_blog_post(user, video_id, shared.video_title, {
+                    'title': shared.blog_title,
+                    'content': shared.content,
+                })
+
+            generator = BlogGenerator()
+
+            # The transcript is usually cached, so fetch it before paying
+            # for the title lookup; a video without a transcript then fails
+            # fast
+            segments = generator.get_transcript_segments(video_id)
+            video_info = generator.get_video_info(canonical_url(video_id))
+            reference = generator.prepare_reference(video_id, segments, usage)
+            blog_data = generator.generate_blog(
+                reference, video_info['title'], usage, depth
+            )
+
+            flight.publish(video_info['title'], blog_data)
+
+        blog_post = save_blog_post(
+            user, video_id, video_info['title'], blog_data
+        )
+    finally:
+        # Calls made before a failure, such as chunk summaries or an
+        # unparseable completion, are billed as well
+        record_generation(user, video_id, blog_post, usage)
+    return blog_post
+
+
+async def agenerate_blog_post(user, url: str,
+                              depth: str = DEPTH_STANDARD) -> BlogPost:
+    """generate_blog_post for ASGI views.
+
+    The LLM call is awaited on an AsyncOpenAI client. YouTube lookups and
+    chunk summarization still block, so they run on the bounded pool of
+    run_blocking; the event loop only waits on them.
+    """
+    video_id = extract_video_id(url)
+    await run_blocking(check_quota, user)
+
+    usage = Usage()
+    blog_post = None
+    try:
+        async with asingle_flight(
+            generation_flight_key(video_id, depth)
+        ) as flight:
+            shared = await run_blocking(flight.result)
+            if shared is not None:
+                return await asave_blog_post(
+                    user, video_id, shared.video_title, {
+                        'title': shared.blog_title,
+                        'content': shared.content,
+                    }
+                )
+
+            generator = BlogGenerator()
+
+            segments = await run_blocking(
+                generator.get_transcript_segments, video_id
+            )
+            video_info = await run_blocking(
+                generator.get_video_info, canonical_url(video_id)
+            )
+            reference = await run_blocking(
+                generator.prepare_reference, video_id, segments, usage
+            )
+            blog_data = await generator.agenerate_blog(
+                reference, video_info['title'], usage, depth
+            )
+
+            await run_blocking(
+                flight.publish, video_info['title'], blog_data
+            )
+
+        blog_post = await asave_blog_post(
+            user, video_id, video_info['title'], blog_data
+        )
+    finally:
+        await run_blocking(
+            record_generation, user, video_id, blog_post, usage
+        )
+    return blog_post
+
+
+def stream_blog_post(user, url: str, depth: str = DEPTH_STANDARD):
+    """Streaming variant of generate_blog_post.
+
+    Yields ("delta", text) for every content fragment as it arrives and a
+    final ("done", BlogPost) once the post has been stored. A request that
+    joins an in-flight generation only gets the "done" event. Closing the
+    generator early closes the upstream completion stream.
+    """
+    video_id = extract_video_id(url)
+    check_quota(user)
+
+    usage = Usage()
+    blog_post = None
+    try:
+        with single_flight(generation_flight_key(video_id, depth)) as flight:
+            shared = flight.result()
+            if shared is not None:
+                yield "done", save_blog_post(
+                    user, video_id, shared.video_title, {
+                        'title': shared.blog_title,
+                        'content': shared.content,
+                    }
+                )
+                return
+
+            generator = BlogGenerator()
+
+            segments = generator.get_transcript_segments(video_id)
+            video_info = generator.get_video_info(canonical_url(video_id))
+            reference = generator.prepare_reference(video_id, segments, usage)
+
+            stream = generator.stream_blog(
+                reference, video_info['title'], depth
+            )
+            try:
+                parts = []
+                with track_stage("llm_stream"):
+                    for chunk in stream:
+                        if getattr(chunk, "usage", None):
+                            generator.count_usage(
+                                chunk.model, chunk.usage, usage
+                            )
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            parts.append(delta)
+                            yield "delta", delta
+            finally:
+                stream.close()
+
+            blog_data = generator.parse_blog("".join(parts))
+            flight.publish(video_info['title'], blog_data)
+
+        blog_post = save_blog_post(
+            user, video_id, video_info['title'], blog_data
+        )
+    finally:
+        # Also bills a stream that failed, or was closed by the client,
+        # for the calls made so far
+        record_generation(user, video_id, blog_post, usage)
+    yield "done", blog_post
@@ -0,0 +1,118 @@
+"""Coalescing of identical concurrent generations.
+
+When many users submit the same video at once, only the first request (the
+leader) runs the pipeline. Later requests for the same key block on a file
+lock, which works across every worker process on the host, and once the
+leader is done they reuse its result instead of starting again. Each request
+still stores its own ``BlogPost``.
+
+A request only joins work that finished after it arrived, so a request made
+when nothing is in flight always generates a fresh post.
+"""
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import SharedGeneration
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    fcntl = None
+
+
+def flight_key(*parts) -> str:
+    """Stable key for the work identified by parts"""
+    return hashlib.sha256(
+        ":".join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+class Flight:
+    def __init__(self, key: str):
+        self.key = key
+        self.started_at = timezone.now()
+        self.joined = False
+
+    def result(self) -> Optional[SharedGeneration]:
+        """The result of work that finished while this request waited"""
+        if not self.joined:
+            return None
+        return SharedGeneration.objects.filter(
+            key=self.key,
+            finished_at__gte=self.started_at,
+        ).first()
+
+    def publish(self, video_title: str, blog_data: Dict):
+        """Make the leader's result available to joined requests"""
+        SharedGeneration.objects.update_or_create(
+            key=self.key,
+            defaults={
+                'video_title': video_title,
+                'blog_title': blog_data['title'],
+                'content': blog_data['content'],
+                'finished_at': timezone.now(),
+            }
+        )
+
+
+def _open_lock(key: str):
+    lock_dir = Path(settings.SINGLE_FLIGHT_LOCK_DIR)
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    return open(lock_dir / f"{key}.lock", "a")
+
+
+@contextmanager
+def single_flight(key: str):
+    """Hold the flight lock for key for the duration of the block.
+
+    The yielded Flight has joined=True when another request held the lock
+    on arrival; its result() then returns that request's output.
+    """
+    flight = Flight(key)
+    if fcntl is None:
+        yield flight
+        return
+
+    with _open_lock(key) as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            flight.joined = True
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield flight
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def asingle_flight(key: str, poll_interval: float = 0.1):
+    """single_flight for coroutines.
+
+    A joined request polls the lock from the event loop rather than
+    blocking a thread on it, so waiters never starve the leader of the
+    threads it needs to finish.
+    """
+    flight = Flight(key)
+    if fcntl is None:
+        yield flight
+        return
+
+    with _open_lock(key) as handle:
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                flight.joined = True
+                await asyncio.sleep(poll_interval)
+        try:
+            yield flight
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
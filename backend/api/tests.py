@@ -1,3 +1,2507 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+import openai
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import (
+    IntegrityError,
+    OperationalError,
+    connection,
+    transaction,
+)
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    batch,
+    clients,
+    compression,
+    governor,
+    jobs,
+    prefetch,
+    singleflight,
+)
+from .batch import run_batch
+from .benchmark import percentile, summarize
+from .cache import TranscriptCache, video_info_cache
+from .compression import (
+    _centrality_numpy,
+    _centrality_python,
+    _terms,
+    compress_segments,
+    select_sentences,
+    split_sentences,
+)
+from .fakes import FakeLLMServer, fake_transcript, offline_youtube
+from .governor import CapacityTimeout, Governor
+from .llm import LLMRouter, NoProviderAvailable, Provider, reset_router
+from .metrics import Registry
+from .models import (
+    BlogCollection,
+    BlogContent,
+    BlogPost,
+    BlogRendition,
+    CachedTranscript,
+    GenerationJob,
+    GenerationUsage,
+    MonthlyTokenUsage,
+    ThrottleState,
+)
+from .policy import choose_policy, count_tokens, load_encoding
+from .rendering import (
+    ENCODINGS,
+    brotli,
+    choose_encoding,
+    markdown,
+    render_html,
+)
+from .serializers import (
+    BatchBlogRequestSerializer,
+    BlogListSerializer,
+    BlogRequestSerializer,
+    PlaylistRequestSerializer,
+)
+from .services import (
+    BlogGenerator,
+    agenerate_blog_post,
+    chunk_segments,
+    generate_blog_post,
+    save_blog_post,
+    stream_blog_post,
+)
+from .singleflight import asingle_flight, flight_key, single_flight
+from .throttling import GCRAThrottle, GenerationRateThrottle
+from .usage import QuotaExceeded
+from .youtube import canonical_url, collection_url, extract_video_id
+
+User = get_user_model()
+
+# Plan lines of SQLite's EXPLAIN QUERY PLAN that mean the query reads the
+# whole table (or a whole index) or sorts its result in a temporary b-tree
+FULL_SCAN_RE = re.compile(r"\bSCAN (?:TABLE )?api_blogpost\b")
+TEMP_SORT_RE = re.compile(r"\bUSE TEMP B-TREE\b")
+# Lookups of a user's post for a video
+VIDEO_SEEK = "user_id=? AND video_id=?"
+# Later and earlier pages of a user's blog list
+LIST_SEEK = "user_id=? AND created_at<?"
+LIST_SEEK_BACK = "user_id=? AND created_at>?"
+
+
+class QueryPlanTests(TestCase):
+    """Every query a view runs on api_blogpost must be served by an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create_user(
+            email='plans@example.com',
+            password='plans',
+            first_name='Query',
+            last_name='Plans',
+        )
+        cls.other = User.objects.create_user(
+            email='other@example.com',
+            password='plans',
+            first_name='Other',
+            last_name='User',
+        )
+        cls.posts = []
+        for owner in (cls.user, cls.other):
+            for index in range(30):
+                video_id = f'{owner.pk:02d}video{index:04d}'
+                post = BlogPost.objects.create(
+                    user=owner,
+                    youtube_url=canonical_url(video_id),
+                    video_id=video_id,
+                    youtube_title=f'Video {index}',
+                    blog_title=f'Post {index}',
+                    author_name='Query Plans',
+                )
+                BlogContent.objects.create(post=post, content='# Post\n\nBody')
+                BlogPost.objects.filter(pk=post.pk).update(
+                    created_at=now - timedelta(minutes=index)
+                )
+                if owner == cls.user:
+                    cls.posts.append(post)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, queries, seek=None):
+        """Fail on any full scan or temporary sort of api_blogpost.
+
+        With seek, every SELECT must also search the index on that
+        condition, e.g. "user_id=? AND video_id=?", rather than walk a
+        shorter prefix of another index.
+        """
+        checked = 0
+        for query in queries:
+            sql = query['sql']
+            if 'api_blogpost' not in sql or sql.startswith('INSERT'):
+                continue
+            checked += 1
+            plan = self.explain(sql)
+            for line in plan:
+                self.assertIsNone(
+                    FULL_SCAN_RE.search(line) or TEMP_SORT_RE.search(line),
+                    f"{line}\n  in the plan of\n{sql}\n  {plan}",
+                )
+            if seek and sql.startswith('SELECT'):
+                self.assertTrue(
+                    any(f"({seek}" in line for line in plan),
+                    f"No search on {seek} in the plan of\n{sql}\n  {plan}",
+                )
+        self.assertGreater(checked, 0, "No api_blogpost query was run")
+
+    def assertViewIndexed(self, method, url, *args, seek=None, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, *args, **kwargs)
+        # Streaming responses have no content to show
+        detail = getattr(response, 'data', None)
+        self.assertLess(response.status_code, 400, detail)
+        self.assertIndexed(context.captured_queries, seek)
+        return response
+
+    def test_blog_list_pages(self):
+        url = reverse('api:blog-list')
+        response = self.assertViewIndexed('get', url, {'page_size': 10})
+        response = self.assertViewIndexed(
+            'get', response.json()['next'], seek=LIST_SEEK
+        )
+        self.assertViewIndexed(
+            'get', response.json()['previous'], seek=LIST_SEEK_BACK
+        )
+
+    def test_blog_detail(self):
+        self.assertViewIndexed('get', reverse(
+            'api:blog-detail', kwargs={'pk': self.posts[5].pk}
+        ))
+
+    def test_blog_detail_compressed(self):
+        self.assertViewIndexed('get', reverse(
+            'api:blog-detail', kwargs={'pk': self.posts[6].pk}
+        ), HTTP_ACCEPT_ENCODING='gzip')
+
+    def test_blog_delete(self):
+        self.assertViewIndexed('delete', reverse(
+            'api:blog-delete', kwargs={'pk': self.posts[7].pk}
+        ))
+
+    def test_generate_returns_existing_post(self):
+        self.assertViewIndexed(
+            'post',
+            reverse('api:generate-blog'),
+            {'url': self.posts[3].youtube_url},
+            format='json',
+            seek=VIDEO_SEEK,
+        )
+
+    def test_stream_returns_existing_post(self):
+        self.assertViewIndexed(
+            'post',
+            reverse('api:generate-blog-stream'),
+            {'url': self.posts[4].youtube_url},
+            format='json',
+            seek=VIDEO_SEEK,
+        )
+
+    def test_batch_of_existing_posts(self):
+        # Batches run as jobs; this is what the job runs
+        with CaptureQueriesContext(connection) as context:
+            results = run_batch(
+                self.user, [post.youtube_url for post in self.posts[:10]]
+            )
+        self.assertEqual({item['status'] for item in results}, {'existing'})
+        self.assertIndexed(context.captured_queries, VIDEO_SEEK)
+
+    def test_save_overwrites_post(self):
+        post = self.posts[2]
+        with CaptureQueriesContext(connection) as context:
+            save_blog_post(self.user, post.video_id, post.youtube_title, {
+                'title': 'New title',
+                'content': 'New content',
+            })
+        self.assertIndexed(context.captured_queries, VIDEO_SEEK)
+
+    def test_user_delete_cascades(self):
+        with CaptureQueriesContext(connection) as context:
+            self.other.delete()
+        self.assertIndexed(context.captured_queries)
+
+
+class BlogListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='list@example.com',
+            password='list',
+            first_name='Blog',
+            last_name='List',
+        )
+        for index in range(5):
+            post = BlogPost.objects.create(
+                user=cls.user,
+                youtube_url=canonical_url(f'listvid{index:04d}'),
+                video_id=f'listvid{index:04d}',
+                youtube_title=f'Video {index}',
+                blog_title=f'Post {index}',
+                author_name='Blog List',
+            )
+            BlogContent.objects.create(post=post, content='x' * 5000)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_rows_match_serializer(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('api:blog-list'))
+        expected = BlogListSerializer(
+            BlogPost.objects.filter(user=self.user).order_by(
+                '-created_at', '-id'
+            ),
+            many=True,
+        ).data
+        self.assertEqual(response.json()['results'], [
+            dict(row) for row in expected
+        ])
+        for query in context.captured_queries:
+            self.assertNotIn('content', query['sql'])
+
+    def test_detail_has_content(self):
+        post = BlogPost.objects.filter(user=self.user).first()
+        response = self.client.get(
+            reverse('api:blog-detail', kwargs={'pk': post.pk})
+        )
+        self.assertEqual(response.json()['content'], 'x' * 5000)
+
+    def walk(self, url, link):
+        """Ids of the posts on every page from url on, following link"""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [row['id'] for row in response.json()['results']]
+            ids.extend(page if link == 'next' else reversed(page))
+            url = response.json()[link]
+        return ids
+
+    def test_pages_through_ties(self):
+        # Posts created in the same instant are ordered by id
+        posts = BlogPost.objects.filter(user=self.user)
+        posts.update(created_at=timezone.now())
+        expected = sorted(posts.values_list('id', flat=True), reverse=True)
+
+        url = reverse('api:blog-list') + '?page_size=2'
+        with CaptureQueriesContext(connection) as context:
+            ids = self.walk(url, 'next')
+        self.assertEqual(ids, expected)
+        for query in context.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_previous_pages(self):
+        posts = BlogPost.objects.filter(user=self.user)
+        instant = timezone.now()
+        for index, pk in enumerate(posts.values_list('id', flat=True)):
+            # Two pairs of ties among five posts
+            posts.filter(pk=pk).update(
+                created_at=instant - timedelta(seconds=index // 2)
+            )
+        expected = list(
+            posts.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+        url = reverse('api:blog-list') + '?page_size=2'
+        while True:
+            response = self.client.get(url)
+            if not response.json()['next']:
+                break
+            url = response.json()['next']
+        last_page = [row['id'] for row in response.json()['results']]
+        ids = self.walk(response.json()['previous'], 'previous')
+        self.assertEqual(ids[::-1] + last_page, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            reverse('api:blog-list'), {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='etag@example.com',
+            password='etag',
+            first_name='Blog',
+            last_name='Etag',
+        )
+        cls.other = User.objects.create_user(
+            email='etag-other@example.com',
+            password='etag',
+            first_name='Other',
+            last_name='Etag',
+        )
+        for owner in (cls.user, cls.user, cls.other):
+            cls.create_post(owner)
+        cls.post = BlogPost.objects.filter(user=cls.user).first()
+
+    @staticmethod
+    def create_post(user):
+        video_id = f'etag{BlogPost.objects.count():07d}'
+        post = BlogPost.objects.create(
+            user=user,
+            youtube_url=canonical_url(video_id),
+            video_id=video_id,
+            youtube_title='Video',
+            blog_title='Post',
+            author_name='Blog Etag',
+        )
+        BlogContent.objects.create(post=post, content='Body')
+        return post
+
+    def setUp(self):
+        self.client = self.client_for(self.user)
+        self.detail_url = reverse(
+            'api:blog-detail', kwargs={'pk': self.post.pk}
+        )
+        self.list_url = reverse('api:blog-list')
+
+    def client_for(self, user):
+        client = APIClient()
+        token = RefreshToken.for_user(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def revalidate(self, url, response, client=None):
+        return (client or self.client).get(
+            url, HTTP_IF_NONE_MATCH=response.headers['ETag']
+        )
+
+    def test_detail_carries_validators(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', response.headers)
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        self.assertIn('Authorization', response.headers['Vary'])
+
+    def test_detail_not_modified_after_one_query(self):
+        response = self.client.get(self.detail_url)
+        with CaptureQueriesContext(connection) as context:
+            revalidated = self.revalidate(self.detail_url, response)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+        self.assertEqual(revalidated.headers['ETag'], response.headers['ETag'])
+        blog_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'api_blog' in query['sql']
+        ]
+        self.assertEqual(len(blog_queries), 1)
+        self.assertNotIn('content', blog_queries[0])
+
+    def test_detail_if_modified_since(self):
+        response = self.client.get(self.detail_url)
+        revalidated = self.client.get(
+            self.detail_url,
+            HTTP_IF_MODIFIED_SINCE=response.headers['Last-Modified'],
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_detail_changes_on_save(self):
+        response = self.client.get(self.detail_url)
+        save_blog_post(self.user, self.post.video_id, 'Video', {
+            'title': 'Post',
+            'content': 'New body',
+        })
+        revalidated = self.revalidate(self.detail_url, response)
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertEqual(revalidated.json()['content'], 'New body')
+        self.assertNotEqual(
+            revalidated.headers['ETag'], response.headers['ETag']
+        )
+
+    def test_detail_of_another_user(self):
+        response = self.client.get(self.detail_url)
+        other = self.client_for(self.other)
+        self.assertEqual(
+            self.revalidate(self.detail_url, response, other).status_code,
+            404,
+        )
+
+    def test_list_not_modified(self):
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response.headers)
+        with CaptureQueriesContext(connection) as context:
+            revalidated = self.revalidate(self.list_url, response)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertFalse(any(
+            'api_blogpost' in query['sql']
+            for query in context.captured_queries
+        ))
+
+    def test_list_changes_on_every_write(self):
+        writes = [
+            lambda: self.create_post(self.user),
+            lambda: BlogPost.objects.filter(user=self.user).update(
+                blog_title='Renamed'
+            ),
+            lambda: BlogPost.objects.filter(pk=self.post.pk).delete(),
+        ]
+        response = self.client.get(self.list_url)
+        for write in writes:
+            write()
+            revalidated = self.revalidate(self.list_url, response)
+            self.assertEqual(revalidated.status_code, 200)
+            response = revalidated
+
+    def test_list_ignores_other_users(self):
+        response = self.client.get(self.list_url)
+        self.create_post(self.other)
+        self.assertEqual(
+            self.revalidate(self.list_url, response).status_code, 304
+        )
+        other = self.client_for(self.other)
+        self.assertEqual(
+            self.revalidate(self.list_url, response, other).status_code, 200
+        )
+
+    def test_list_of_user_without_posts(self):
+        user = User.objects.create_user(
+            email='etag-empty@example.com',
+            password='etag',
+            first_name='Empty',
+            last_name='Etag',
+        )
+        client = self.client_for(user)
+        response = client.get(self.list_url)
+        self.assertEqual(
+            self.revalidate(self.list_url, response, client).status_code, 304
+        )
+        self.create_post(user)
+        self.assertEqual(
+            self.revalidate(self.list_url, response, client).status_code, 200
+        )
+
+    def test_user_delete_cascades(self):
+        self.user.delete()
+        self.assertFalse(BlogPost.objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(
+            BlogCollection.objects.filter(user_id=self.user.pk).exists()
+        )
+
+
+class RenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='render@example.com',
+            password='render',
+            first_name='Blog',
+            last_name='Render',
+        )
+        cls.post = save_blog_post(cls.user, 'render00001', 'Video', {
+            'title': 'Rendered',
+            'content': '# Heading\n\nSome **bold** text. ' * 50,
+        })
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.url = reverse('api:blog-detail', kwargs={'pk': self.post.pk})
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_serves_stored_gzip(self):
+        plain = self.get()
+        self.assertNotIn('Content-Encoding', plain.headers)
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(response.headers['ETag'], plain.headers['ETag'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertFalse(any(
+            'api_blogcontent' in query['sql']
+            for query in context.captured_queries
+        ))
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_prefers_brotli(self):
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(
+            brotli.decompress(response.content), self.get().content
+        )
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip;q=0.5, identity'), 'gzip')
+        self.assertEqual(choose_encoding('*'), next(iter(ENCODINGS)))
+        for header in ('', 'identity', 'deflate', 'gzip;q=0', '*;q=0'):
+            self.assertIsNone(choose_encoding(header), header)
+
+    def test_stale_rendition_is_not_served(self):
+        BlogPost.objects.filter(pk=self.post.pk).update(
+            updated_at=timezone.now()
+        )
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_follows_saves(self):
+        save_blog_post(self.user, self.post.video_id, 'Video', {
+            'title': 'Rendered again',
+            'content': 'New body',
+        })
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content))['content'],
+            'New body',
+        )
+
+    def test_browsable_api_is_rendered(self):
+        response = self.get(
+            HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    @skipUnless(markdown, "markdown is not installed")
+    def test_html(self):
+        html = render_html(
+            '| a |\n|---|\n| 1 |\n\n<script>alert(1)</script>\n\n'
+            '[bad](javascript\\:alert(1)) [bad]( JavaScript:alert(1)) '
+            '[good](https://example.com)'
+        )
+        self.assertIn('<td>1</td>', html)
+        self.assertIn('&lt;script&gt;', html)
+        self.assertNotIn('javascript', html.lower())
+        self.assertEqual(html.replace(
+            ' rel="noopener noreferrer" target="_blank"', ''
+        ).count('<a>bad</a>'), 2)
+        self.assertIn('href="https://example.com"', html)
+        self.assertEqual(self.get().json()['html'], self.post.body.html)
+
+    def test_render_blogs(self):
+        BlogRendition.objects.all().delete()
+        BlogContent.objects.update(html='')
+        call_command('render_blogs', stdout=io.StringIO())
+        self.assertEqual(
+            self.get(HTTP_ACCEPT_ENCODING='gzip').headers['Content-Encoding'],
+            'gzip',
+        )
+        self.assertEqual(
+            BlogContent.objects.get(post=self.post).html, self.post.body.html
+        )
+
+    @skipUnless(markdown, "markdown is not installed")
+    def test_render_blogs_changes_etag(self):
+        before = self.get()
+        BlogContent.objects.update(html='')
+        call_command('render_blogs', '--all', stdout=io.StringIO())
+        response = self.client.get(
+            self.url,
+            HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=before.headers['ETag'],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content))['html'],
+            self.post.body.html,
+        )
+
+        # Posts whose HTML is unchanged keep their ETag
+        call_command('render_blogs', '--all', stdout=io.StringIO())
+        self.assertEqual(self.get().headers['ETag'], response.headers['ETag'])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='search@example.com',
+            password='search',
+            first_name='Blog',
+            last_name='Search',
+        )
+        cls.other = User.objects.create_user(
+            email='notmine@example.com',
+            password='search',
+            first_name='Other',
+            last_name='User',
+        )
+        cls.posts = {}
+        for owner, key, title, video_title, content in (
+            (cls.user, 'body', 'Weekend notes', 'Saturday',
+             'We tried baking bread with a <b>sourdough</b> starter.'),
+            (cls.user, 'video', 'Morning routine', 'Sourdough starter tips',
+             'Coffee first.'),
+            (cls.user, 'title', 'Sourdough baking basics', 'Bread 101',
+             'Flour, water and salt.'),
+            (cls.user, 'none', 'Garden planning', 'Spring garden',
+             'Tomatoes and basil.'),
+            (cls.other, 'other', 'Sourdough for experts', 'Sourdough',
+             'Sourdough everywhere.'),
+        ):
+            video_id = f'search{len(cls.posts):05d}'
+            post = BlogPost.objects.create(
+                user=owner,
+                youtube_url=canonical_url(video_id),
+                video_id=video_id,
+                youtube_title=video_title,
+                blog_title=title,
+                author_name='Blog Search',
+            )
+            BlogContent.objects.create(post=post, content=content)
+            cls.posts[key] = post
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def search(self, q, **params):
+        response = self.client.get(
+            reverse('api:blog-search'), {'q': q, **params}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.json()
+
+    def ids(self, results):
+        return [result['id'] for result in results['results']]
+
+    def keys(self, *keys):
+        return [self.posts[key].pk for key in keys]
+
+    def test_ranks_titles_first(self):
+        self.assertEqual(
+            self.ids(self.search('sourdough')),
+            self.keys('title', 'video', 'body'),
+        )
+
+    def test_newest_first_within_a_tier(self):
+        newer = BlogPost.objects.create(
+            user=self.user,
+            youtube_url=canonical_url('searchnewer'),
+            video_id='searchnewer',
+            youtube_title='Kitchen',
+            blog_title='Bread again',
+            author_name='Blog Search',
+        )
+        BlogContent.objects.create(post=newer, content='More sourdough.')
+        self.assertEqual(
+            self.ids(self.search('sourdough')),
+            self.keys('title', 'video') + [newer.pk] + self.keys('body'),
+        )
+
+    def test_matches_all_words_across_fields(self):
+        self.assertEqual(
+            self.ids(self.search('weekend bread')), self.keys('body')
+        )
+        self.assertEqual(self.ids(self.search('garden bread')), [])
+
+    def test_matches_stems(self):
+        self.assertEqual(
+            self.ids(self.search('bake')), self.keys('title', 'body')
+        )
+        self.assertEqual(self.ids(self.search('tomato')), self.keys('none'))
+
+    def test_operators_are_plain_words(self):
+        self.assertEqual(self.ids(self.search('garden OR "NEAR(')), [])
+        self.assertEqual(self.ids(self.search(f'u{self.user.pk}')), [])
+
+    def test_highlights_and_escapes(self):
+        title, video, body = self.search('sourdough')['results']
+        self.assertEqual(
+            title['title_highlight'], '<mark>Sourdough</mark> baking basics'
+        )
+        self.assertEqual(video['title_highlight'], 'Morning routine')
+        self.assertEqual(
+            body['snippet'],
+            'We tried baking bread with a &lt;b&gt;<mark>sourdough</mark>'
+            '&lt;/b&gt; starter.',
+        )
+
+    def test_follows_updates_and_deletes(self):
+        post = self.posts['none']
+        save_blog_post(self.user, post.video_id, post.youtube_title, {
+            'title': 'Sourdough garden',
+            'content': 'Nothing else.',
+        })
+        self.assertEqual(
+            self.ids(self.search('sourdough')),
+            self.keys('none', 'title', 'video', 'body'),
+        )
+        self.assertEqual(self.ids(self.search('tomatoes')), [])
+        self.posts['title'].delete()
+        self.assertEqual(
+            self.ids(self.search('sourdough')),
+            self.keys('none', 'video', 'body'),
+        )
+
+    def test_pages(self):
+        first = self.search('sourdough', page_size=2)
+        self.assertEqual(self.ids(first), self.keys('title', 'video'))
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.ids(second), self.keys('body'))
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.ids(self.client.get(second['previous']).json()),
+                         self.keys('title', 'video'))
+
+    def test_rejects_query_without_words(self):
+        response = self.client.get(reverse('api:blog-search'), {'q': '"*'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_plan(self):
+        """Only the title tiers are sorted; posts matching anywhere are
+        read in index order"""
+        with CaptureQueriesContext(connection) as context:
+            self.search('sourdough')
+        [query] = [
+            query for query in context.captured_queries
+            if 'api_blogsearch' in query['sql']
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+            plan = [row[-1] for row in cursor.fetchall()]
+        for line in plan:
+            self.assertIsNone(
+                FULL_SCAN_RE.search(line),
+                f"{line}\n  in the plan of\n{query['sql']}\n  {plan}",
+            )
+        sorts = [line for line in plan if TEMP_SORT_RE.search(line)]
+        self.assertLessEqual(len(sorts), 2, plan)
+
+
+@mock.patch('api.jobs.close_old_connections', lambda: None)
+class JobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='jobs@example.com',
+            password='jobs',
+            first_name='Blog',
+            last_name='Jobs',
+        )
+
+    def create_job(self, **fields):
+        return GenerationJob.objects.create(
+            user=self.user,
+            youtube_url=canonical_url('jobvideo001'),
+            **fields,
+        )
+
+    def expired(self):
+        return timezone.now() - timedelta(
+            seconds=settings.BLOG_JOB_LEASE_SECONDS + 1
+        )
+
+    def test_claims_once(self):
+        job = self.create_job()
+        self.assertTrue(jobs.claim_job(job.pk))
+        self.assertFalse(jobs.claim_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.heartbeat_at)
+
+    def test_runs_job(self):
+        job = self.create_job()
+        post = save_blog_post(self.user, 'jobvideo001', 'Video', {
+            'title': 'Job post',
+            'content': 'Body',
+        })
+        with mock.patch('api.jobs.generate_blog_post', return_value=post):
+            jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.blog_post, post)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_requeues_expired_jobs(self):
+        stuck = self.create_job(
+            status=GenerationJob.STATUS_RUNNING,
+            heartbeat_at=self.expired(),
+            attempts=1,
+        )
+        alive = self.create_job(
+            status=GenerationJob.STATUS_RUNNING,
+            heartbeat_at=timezone.now(),
+            attempts=1,
+        )
+        with self.assertLogs('api.jobs', 'WARNING'):
+            self.assertEqual(jobs.requeue_expired_jobs(), 1)
+        stuck.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stuck.status, GenerationJob.STATUS_PENDING)
+        self.assertIsNone(stuck.started_at)
+        self.assertEqual(alive.status, GenerationJob.STATUS_RUNNING)
+        self.assertEqual(jobs.pending_job_ids(10), [stuck.pk])
+
+    def test_fails_jobs_out_of_attempts(self):
+        job = self.create_job(
+            status=GenerationJob.STATUS_RUNNING,
+            heartbeat_at=self.expired(),
+            attempts=settings.BLOG_JOB_MAX_ATTEMPTS,
+        )
+        self.assertEqual(jobs.requeue_expired_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+
+    def test_requeued_job_is_not_overwritten(self):
+        job = self.create_job()
+
+        def reclaimed(*args):
+            # The lease expired and another worker took the job over
+            GenerationJob.objects.filter(pk=job.pk).update(attempts=2)
+            raise ValueError("Too late")
+
+        with mock.patch(
+            'api.jobs.generate_blog_post', side_effect=reclaimed
+        ), self.assertLogs('api.jobs', 'WARNING'):
+            jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_RUNNING)
+
+    def test_worker_requeues_at_startup(self):
+        job = self.create_job(
+            status=GenerationJob.STATUS_RUNNING,
+            heartbeat_at=self.expired(),
+            attempts=1,
+        )
+        submitted = []
+
+        def submit(run, job_id):
+            submitted.append(job_id)
+            GenerationJob.objects.filter(pk=job_id).update(
+                status=GenerationJob.STATUS_SUCCEEDED
+            )
+            return mock.Mock(**{'done.return_value': True})
+
+        command = 'api.management.commands.run_generation_worker'
+        with mock.patch(
+            f'{command}.get_executor',
+            return_value=mock.Mock(submit=submit),
+        ), mock.patch(
+            f'{command}.time.sleep'
+        ), self.assertLogs('api.jobs', 'WARNING'):
+            call_command('run_generation_worker', once=True,
+                         stdout=io.StringIO())
+        self.assertEqual(submitted, [job.pk])
+
+
+class TranscriptCacheTests(TestCase):
+    segments = [{'text': 'Hello', 'start': 0.0, 'duration': 1.0}]
+
+    def setUp(self):
+        self.cache = TranscriptCache(max_entries=2, max_rows=2, ttl=3600)
+
+    def test_hits_memory_then_table(self):
+        self.assertIsNone(self.cache.get('cachevid001', 'en'))
+        self.cache.set('cachevid001', 'en', self.segments)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.cache.get('cachevid001', 'en'), self.segments
+            )
+        # Another process has an empty memory layer but shares the table
+        other = TranscriptCache(max_entries=2, max_rows=2, ttl=3600)
+        self.assertEqual(other.get('cachevid001', 'en'), self.segments)
+        self.assertIsNone(other.get('cachevid001', 'de'))
+        self.assertEqual(other.stats()['db_hits'], 1)
+        self.assertEqual(other.stats()['misses'], 1)
+
+    def test_expires(self):
+        self.cache.set('cachevid001', 'en', self.segments)
+        later = timezone.now() + timedelta(hours=2)
+        with mock.patch('api.cache.timezone.now', return_value=later):
+            self.assertIsNone(self.cache.get('cachevid001', 'en'))
+
+    def test_memory_evicts_least_recently_used(self):
+        for video_id in ('cachevid001', 'cachevid002'):
+            self.cache.set(video_id, 'en', self.segments)
+        self.cache.get('cachevid001', 'en')
+        self.cache.set('cachevid003', 'en', self.segments)
+        self.assertEqual(self.cache.stats()['memory_entries'], 2)
+        with self.assertNumQueries(0):
+            self.cache.get('cachevid001', 'en')
+        with self.assertNumQueries(2):
+            # Evicted from memory, read back from the table
+            self.cache.get('cachevid002', 'en')
+
+    def test_trim_keeps_most_recently_used_rows(self):
+        for video_id in ('cachevid001', 'cachevid002', 'cachevid003'):
+            self.cache.set(video_id, 'en', self.segments)
+        CachedTranscript.objects.filter(video_id='cachevid001').update(
+            last_used_at=timezone.now() + timedelta(minutes=1)
+        )
+        self.cache.trim()
+        self.assertEqual(
+            sorted(CachedTranscript.objects.values_list(
+                'video_id', flat=True
+            )),
+            ['cachevid001', 'cachevid003'],
+        )
+
+    def test_generator_fetches_once(self):
+        generator = BlogGenerator(router=mock.Mock())
+        with mock.patch('api.services.transcript_cache', self.cache), \
+                mock.patch(
+                    'api.services.YouTubeTranscriptApi.get_transcript',
+                    return_value=self.segments,
+                ) as fetch:
+            for _ in range(2):
+                self.assertEqual(
+                    generator.get_transcript('cachevid001', 'en'), 'Hello'
+                )
+        fetch.assert_called_once()
+
+    def test_video_info_is_shared(self):
+        video_info_cache.set('cachevid001', {'title': 'Cached'})
+        generator = BlogGenerator(router=mock.Mock())
+        with mock.patch('api.services.borrow_ydl') as borrow:
+            info = generator.get_video_info(canonical_url('cachevid001'))
+        self.assertEqual(info, {'title': 'Cached'})
+        borrow.assert_not_called()
+
+    def test_migrations_create_video_info_table(self):
+        migration = import_module('api.migrations.0020_video_info_cache_table')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE api_video_info_cache')
+        # The SQLite schema editor cannot be entered inside a test's atomic
+        migration.create_cache_tables(None, SimpleNamespace(
+            connection=connection
+        ))
+        self.assertIn(
+            'api_video_info_cache', connection.introspection.table_names()
+        )
+
+    def test_video_info_cache_failure_fetches_video(self):
+        broken = mock.Mock(**{
+            'get.side_effect': OperationalError('no such table'),
+            'set.side_effect': OperationalError('no such table'),
+        })
+        ydl = mock.Mock(**{'extract_info.return_value': {
+            'title': 'Fetched', 'id': 'cachevid002',
+        }})
+        generator = BlogGenerator(router=mock.Mock())
+        with mock.patch.object(type(video_info_cache), 'cache', broken), \
+                mock.patch('api.services.borrow_ydl') as borrow, \
+                self.assertLogs('api.cache', 'ERROR'):
+            borrow.return_value.__enter__.return_value = ydl
+            info = generator.get_video_info(canonical_url('cachevid002'))
+        self.assertEqual(info, {'title': 'Fetched', 'video_id': 'cachevid002'})
+
+
+class YouTubeURLTests(SimpleTestCase):
+    def test_video_urls(self):
+        for url in [
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42s&list=PL1',
+            'youtube.com/watch?feature=share&v=dQw4w9WgXcQ',
+            'https://m.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://youtu.be/dQw4w9WgXcQ?si=tracking',
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+            'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ',
+            'https://www.youtube.com/live/dQw4w9WgXcQ?feature=share',
+            '  https://YOUTU.BE/dQw4w9WgXcQ  ',
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(extract_video_id(url), 'dQw4w9WgXcQ')
+
+    def test_rejects_other_urls(self):
+        for url in [
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ%0A',
+            'https://www.youtube.com/watch?v=dQw4w9WgXc',
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQQ',
+            'https://www.youtube.com/watch',
+            'https://www.youtube.com/@channel',
+            'https://youtu.be/',
+            'https://example.com/watch?v=dQw4w9WgXcQ',
+            'https://www.youtube.com.evil.com/watch?v=dQw4w9WgXcQ',
+        ]:
+            with self.subTest(url=url), self.assertRaises(ValueError):
+                extract_video_id(url)
+
+    def test_collection_urls(self):
+        for url, expected in [
+            ('https://www.youtube.com/playlist?list=PL123',
+             'https://www.youtube.com/playlist?list=PL123'),
+            ('https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123',
+             'https://www.youtube.com/playlist?list=PL123'),
+            ('https://www.youtube.com/@someone',
+             'https://www.youtube.com/@someone/videos'),
+            ('https://www.youtube.com/@someone/shorts',
+             'https://www.youtube.com/@someone/shorts'),
+            ('https://www.youtube.com/channel/UC123/about',
+             'https://www.youtube.com/channel/UC123/videos'),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(collection_url(url), expected)
+
+        for url in [
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://youtu.be/dQw4w9WgXcQ?list=PL123',
+            'https://www.youtube.com/channel',
+        ]:
+            with self.subTest(url=url), self.assertRaises(ValueError):
+                collection_url(url)
+
+
+class UniqueVideoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='unique@example.com',
+            password='unique',
+            first_name='Unique',
+            last_name='Video',
+        )
+
+    def test_one_post_per_video(self):
+        BlogPost.objects.create(
+            user=self.user, video_id='dQw4w9WgXcQ', youtube_title='Video',
+            blog_title='Post',
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BlogPost.objects.create(
+                user=self.user, video_id='dQw4w9WgXcQ',
+                youtube_title='Video', blog_title='Again',
+            )
+        # Posts without a video id are not constrained
+        for title in ('First', 'Second'):
+            BlogPost.objects.create(
+                user=self.user, youtube_title='Video', blog_title=title,
+            )
+
+    def test_save_overwrites(self):
+        for title in ('First', 'Second'):
+            save_blog_post(
+                self.user, 'dQw4w9WgXcQ', 'Video',
+                {'title': title, 'content': 'Body'},
+            )
+        post = BlogPost.objects.get(user=self.user)
+        self.assertEqual(post.blog_title, 'Second')
+
+
+@override_settings(
+    OPENAI_API_KEY='test-key',
+    OPENAI_BASE_URL='http://llm.invalid/v1',
+    YTDL_POOL_SIZE=2,
+)
+class ClientTests(SimpleTestCase):
+    def setUp(self):
+        clients.close()
+        self.addCleanup(clients.close)
+
+    def test_openai_client_is_shared(self):
+        client = clients.get_openai_client()
+        self.assertIs(clients.get_openai_client(), client)
+        # The router retries, across providers
+        self.assertEqual(client.max_retries, 0)
+        self.assertEqual(client.timeout.read, settings.OPENAI_TIMEOUT)
+        self.assertEqual(client.timeout.connect,
+                         settings.OPENAI_CONNECT_TIMEOUT)
+        self.assertIsNot(
+            clients.get_openai_client(base_url='http://other.invalid/v1'),
+            client,
+        )
+        self.assertIsNot(clients.get_async_openai_client(), client)
+
+    def test_concurrent_first_use_builds_one_client(self):
+        barrier = threading.Barrier(8)
+
+        def get():
+            barrier.wait()
+            return clients.get_openai_client()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            built = list(pool.map(lambda _: get(), range(8)))
+        self.assertEqual(len({id(client) for client in built}), 1)
+
+    def test_reset_forgets_clients(self):
+        client = clients.get_openai_client()
+        clients.reset()
+        self.assertIsNot(clients.get_openai_client(), client)
+
+    def test_ydl_pool(self):
+        with mock.patch('api.clients.new_ydl', side_effect=object) as new:
+            with clients.borrow_ydl() as first:
+                with clients.borrow_ydl() as second:
+                    with clients.borrow_ydl() as third:
+                        self.assertEqual(len({first, second, third}), 3)
+            # Only YTDL_POOL_SIZE instances are kept for reuse, the first
+            # ones given back
+            with clients.borrow_ydl() as again, \
+                    clients.borrow_ydl() as other, \
+                    clients.borrow_ydl():
+                self.assertEqual({again, other}, {second, third})
+        self.assertEqual(new.call_count, 4)
+
+    def test_run_blocking(self):
+        async def run():
+            return await clients.run_blocking(
+                lambda value, scale: (threading.current_thread().name,
+                                      value * scale),
+                3, scale=2,
+            )
+
+        thread, value = asyncio.run(run())
+        self.assertTrue(thread.startswith('blocking-io'))
+        self.assertEqual(value, 6)
+
+
+def completion(content, model='test-model'):
+    """A chat completion as the OpenAI client returns it"""
+    return SimpleNamespace(
+        model=model,
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+    )
+
+
+def transcript_segments(count, seed=0):
+    """Captions of count distinct sentences"""
+    words = random.Random(seed)
+    vocabulary = [f'term{index}' for index in range(2000)]
+    return [
+        {'text': ' '.join(words.sample(vocabulary, 12)) + '.'}
+        for _ in range(count)
+    ]
+
+
+@override_settings(
+    BLOG_REFERENCE_MAX_TOKENS=300,
+    EXTRACTIVE_MAX_RATIO=2,
+    TRANSCRIPT_CHUNK_CHARS=3000,
+    SUMMARY_CONCURRENCY=1,
+)
+class ReferenceBudgetTests(TestCase):
+    def generator(self, summary):
+        router = mock.Mock()
+        router.create.side_effect = lambda **kwargs: completion(summary)
+        return BlogGenerator(router=router), router
+
+    def test_short_transcript_is_used_as_is(self):
+        generator, router = self.generator('unused')
+        reference = generator.prepare_reference(
+            'budgetvid01', transcript_segments(5)
+        )
+        self.assertEqual(len(split_sentences(reference)), 5)
+        router.create.assert_not_called()
+
+    def test_mid_sized_transcript_is_cut(self):
+        generator, router = self.generator('unused')
+        segments = transcript_segments(18)
+        tokens = count_tokens(' '.join(seg['text'] for seg in segments))
+        self.assertTrue(300 < tokens <= 600)
+        reference = generator.prepare_reference('budgetvid01', segments)
+        self.assertLessEqual(count_tokens(reference), 300)
+        router.create.assert_not_called()
+
+    def test_summaries_are_reduced_until_they_fit(self):
+        # Every summary is far longer than its share of the budget
+        generator, router = self.generator(
+            ' '.join(seg['text'] for seg in transcript_segments(12, seed=1))
+        )
+        reference = generator.prepare_reference(
+            'budgetvid01', transcript_segments(400)
+        )
+        self.assertLessEqual(count_tokens(reference), 300)
+        first_round = len(chunk_segments(
+            transcript_segments(400), settings.TRANSCRIPT_CHUNK_CHARS
+        ))
+        self.assertGreater(router.create.call_count, first_round)
+
+        # Every round's summaries are stored and reused
+        router.create.reset_mock()
+        self.assertEqual(
+            generator.prepare_reference(
+                'budgetvid01', transcript_segments(400)
+            ),
+            reference,
+        )
+        router.create.assert_not_called()
+
+    def test_prompt_keeps_the_whole_reference(self):
+        generator, _ = self.generator('unused')
+        reference = 'word ' * 5000
+        messages = generator.build_messages(reference, 'Title')
+        self.assertIn(reference, messages[1]['content'])
+
+
+@skipUnless(singleflight.fcntl, "flight locks need fcntl")
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        self.enterContext(
+            override_settings(SINGLE_FLIGHT_LOCK_DIR=lock_dir.name)
+        )
+        self.key = flight_key('flightvid01', 'model', 1, 'standard')
+
+    def test_key(self):
+        self.assertEqual(
+            self.key, flight_key('flightvid01', 'model', 1, 'standard')
+        )
+        self.assertNotEqual(
+            self.key, flight_key('flightvid01', 'model', 1, 'brief')
+        )
+
+    def test_leader_generates(self):
+        with single_flight(self.key) as flight:
+            self.assertFalse(flight.joined)
+            self.assertIsNone(flight.result())
+
+    def test_waiter_joins_the_leader(self):
+        waiters = []
+
+        def wait():
+            with single_flight(self.key) as flight:
+                waiters.append(flight)
+
+        with single_flight(self.key) as leader:
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+            # The waiter blocks on the lock until the leader is done
+            waiter.join(timeout=0.2)
+            self.assertTrue(waiter.is_alive())
+            leader.publish('Video', {'title': 'Shared', 'content': 'Body'})
+        waiter.join(timeout=5)
+
+        [flight] = waiters
+        self.assertTrue(flight.joined)
+        self.assertEqual(flight.result().blog_title, 'Shared')
+
+    def test_results_from_before_arrival_are_not_joined(self):
+        with single_flight(self.key) as leader:
+            leader.publish('Video', {'title': 'Old', 'content': 'Body'})
+        with single_flight(self.key) as flight:
+            self.assertIsNone(flight.result())
+            flight.joined = True
+            self.assertIsNone(flight.result())
+
+    def test_async_waiter_polls(self):
+        async def run():
+            order = []
+
+            async def leader():
+                async with asingle_flight(self.key) as flight:
+                    order.append(('leader', flight.joined))
+                    await asyncio.sleep(0.05)
+
+            async def waiter():
+                await asyncio.sleep(0.01)
+                async with asingle_flight(self.key, 0.01) as flight:
+                    order.append(('waiter', flight.joined))
+
+            await asyncio.gather(leader(), waiter())
+            return order
+
+        self.assertEqual(
+            asyncio.run(run()), [('leader', False), ('waiter', True)]
+        )
+
+
+class WorkerCrash(BaseException):
+    """Stands in for the death of a worker process"""
+
+
+class InlineExecutor:
+    """Executor that runs every call as it is submitted"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def fake_batch_generator():
+    """BlogGenerator stand-in for run_batch, without YouTube or LLM calls"""
+    generator = mock.Mock()
+    generator.get_transcript_segments.return_value = [{'text': 'Hello.'}]
+    generator.get_video_info.side_effect = (
+        lambda url: {'title': f'Video {extract_video_id(url)}'}
+    )
+    generator.prepare_reference.return_value = 'Hello.'
+    generator.generate_blog.side_effect = (
+        lambda reference, title, usage, depth: {
+            'title': f'Post about {title}',
+            'content': 'Body',
+        }
+    )
+    return generator
+
+
+# Pool threads cannot see the test transaction, so quota checks and
+# charges, which read and write the user's rows, are left out
+@mock.patch('api.batch.check_quota', lambda user: None)
+@mock.patch('api.batch.charge', lambda user, usage: None)
+@mock.patch('api.batch.BlogGenerator', fake_batch_generator)
+@mock.patch('api.jobs.close_old_connections', lambda: None)
+class BatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='batch@example.com',
+            password='batch',
+            first_name='Blog',
+            last_name='Batch',
+        )
+
+    def test_view_queues_a_job(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        urls = [canonical_url('batchvid001'), 'not a url']
+        with self.captureOnCommitCallbacks() as callbacks, \
+                override_settings(BLOG_JOB_AUTODISPATCH=True):
+            response = client.post(
+                reverse('api:generate-blog-batch'),
+                {'urls': urls, 'regen': 'true', 'depth': 'brief'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['kind'], GenerationJob.KIND_BATCH)
+        job = GenerationJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.urls, urls)
+        self.assertTrue(job.regen)
+        self.assertEqual(job.depth, 'brief')
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(BlogPost.objects.exists())
+
+    def test_runs_batch_job(self):
+        existing = save_blog_post(self.user, 'batchvid002', 'Video', {
+            'title': 'Existing', 'content': 'Body',
+        })
+        job = jobs.enqueue(
+            self.user,
+            kind=GenerationJob.KIND_BATCH,
+            urls=[
+                canonical_url('batchvid001'),
+                canonical_url('batchvid002'),
+                'https://example.com/video',
+            ],
+        )
+        jobs.run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.total_items, 3)
+        self.assertEqual(job.completed_items, 2)
+        self.assertEqual(job.failed_items, 1)
+        statuses = {
+            result.get('video_id'): result['status'] for result in job.results
+        }
+        self.assertEqual(statuses, {
+            'batchvid001': 'created',
+            'batchvid002': 'existing',
+            None: 'failed',
+        })
+        self.assertEqual(
+            BlogPost.objects.get(video_id='batchvid001').blog_title,
+            'Post about Video batchvid001',
+        )
+        existing.refresh_from_db()
+        self.assertEqual(existing.blog_title, 'Existing')
+
+    def test_post_created_meanwhile_is_overwritten(self):
+        def race(reference, title, usage, depth):
+            # Another request stores the video while the batch generates
+            save_blog_post(self.user, 'batchvid001', title, {
+                'title': 'Concurrent', 'content': 'Body',
+            })
+            return {'title': 'From batch', 'content': 'Body'}
+
+        generator = fake_batch_generator()
+        generator.generate_blog.side_effect = race
+        # The concurrent save runs on the LLM pool; run it inline instead
+        with mock.patch('api.batch.BlogGenerator', return_value=generator), \
+                mock.patch('api.batch.ThreadPoolExecutor',
+                           InlineExecutor):
+            [result] = run_batch(self.user, [canonical_url('batchvid001')])
+
+        self.assertEqual(result['status'], 'updated')
+        post = BlogPost.objects.select_related('body').get(
+            video_id='batchvid001'
+        )
+        self.assertEqual(result['blog_id'], post.pk)
+        self.assertEqual(post.blog_title, 'From batch')
+
+    # The third video holds one LLM thread until the others are stored
+    @override_settings(BATCH_LLM_CONCURRENCY=2)
+    def test_crashed_job_keeps_stored_posts(self):
+        urls = [canonical_url(f'batchvid00{index}') for index in (1, 2, 3)]
+        job = jobs.enqueue(self.user, kind=GenerationJob.KIND_BATCH,
+                           urls=urls, regen=True)
+        stored = threading.Event()
+        store = batch._store
+
+        def store_and_count(*args):
+            store(*args)
+            if BlogPost.objects.count() == 2:
+                stored.set()
+
+        def generate(reference, title, usage, depth):
+            if title.endswith('batchvid003'):
+                # The worker dies once the other videos are stored
+                stored.wait(timeout=5)
+                raise WorkerCrash()
+            return {'title': f'Post about {title}', 'content': 'Body'}
+
+        generator = fake_batch_generator()
+        generator.generate_blog.side_effect = generate
+        with mock.patch('api.batch.BlogGenerator', return_value=generator), \
+                mock.patch('api.batch._store', store_and_count), \
+                self.assertRaises(WorkerCrash):
+            jobs.run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_RUNNING)
+        self.assertEqual(job.completed_items, 2)
+        self.assertEqual(
+            sorted(result['url'] for result in job.results), urls[:2]
+        )
+
+        # Requeued, the job only generates the video it lost
+        GenerationJob.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - timedelta(days=1)
+        )
+        with self.assertLogs('api.jobs', 'WARNING'):
+            jobs.requeue_expired_jobs()
+        generator = fake_batch_generator()
+        with mock.patch('api.batch.BlogGenerator', return_value=generator):
+            jobs.run_job(job.pk)
+        generator.generate_blog.assert_called_once()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.completed_items, 3)
+        self.assertEqual(
+            sorted(result['url'] for result in job.results), urls
+        )
+        self.assertEqual(BlogPost.objects.count(), 3)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_escapes_label_values(self):
+        registry = Registry()
+        counter = registry.counter('test_total', 'Test', ['model'])
+        counter.inc(model='a"b\\c\nd')
+        self.assertIn(
+            'test_total{model="a\\"b\\\\c\\nd"} 1', registry.render()
+        )
+
+    @override_settings(METRICS_TOKEN='secret', DEBUG=False)
+    def test_token(self):
+        url = reverse('metrics')
+        for header, expected in [
+            ({}, 403),
+            ({'HTTP_AUTHORIZATION': 'Bearer wrong'}, 403),
+            ({'HTTP_AUTHORIZATION': 'Bearer secret'}, 200),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(
+                    self.client.get(url, **header).status_code, expected
+                )
+
+    def test_prunes_snapshots_of_gone_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        registry = Registry()
+        counter = registry.counter('test_total', 'Test')
+        counter.inc(2)
+
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        alive = os.getppid()
+        snapshot = json.dumps({'test_total': {'[]': 3}})
+        path = Path(directory.name)
+        (path / f'{exited.pid}.json').write_text(snapshot)
+        (path / f'{alive}.json').write_text(snapshot)
+
+        with override_settings(METRICS_DIR=directory.name):
+            self.assertIn('test_total 5\n', registry.render())
+            stale = time.time() - settings.METRICS_SNAPSHOT_MAX_AGE - 1
+            os.utime(path / f'{alive}.json', (stale, stale))
+            self.assertIn('test_total 2\n', registry.render())
+
+        self.assertEqual(
+            sorted(child.name for child in path.iterdir()),
+            [f'{os.getpid()}.json'],
+        )
+
+
+def unused_base_url():
+    """Base URL of a local port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/v1'
+
+
+@override_settings(
+    LLM_BACKOFF_BASE=0,
+    LLM_BREAKER_THRESHOLD=2,
+    LLM_BREAKER_COOLDOWN=60,
+    LLM_TOKENS_PER_MINUTE=0,
+    LLM_REQUESTS_PER_MINUTE=0,
+)
+class RouterTests(SimpleTestCase):
+    messages = [{'role': 'user', 'content': 'Write a post'}]
+
+    def setUp(self):
+        self.server = FakeLLMServer(latency=0.01, completion_tokens=20)
+        self.enterContext(self.server)
+        self.addCleanup(clients.close)
+
+    def provider(self, name, base_url=None):
+        return Provider.from_config({
+            'name': name,
+            'base_url': base_url or self.server.base_url,
+            'api_key': 'test-key',
+            'model': f'{name}-model',
+            'fast_model': f'{name}-fast',
+        })
+
+    def test_routes_by_role(self):
+        router = LLMRouter([self.provider('main')])
+        response = router.create(role='fast', messages=self.messages)
+        self.assertEqual(response.model, 'main-fast')
+        self.assertEqual(self.server.requests, 1)
+        [status] = router.status()
+        self.assertEqual(status['state'], 'closed')
+        self.assertIsNotNone(status['latency'])
+
+    def test_fails_over_and_opens_breaker(self):
+        down = self.provider('down', unused_base_url())
+        up = self.provider('up')
+        router = LLMRouter([down, up])
+
+        for _ in range(3):
+            response = router.create(messages=self.messages)
+            self.assertEqual(response.model, 'up-model')
+        # Only the failing first call went to the provider that is down;
+        # its failure does not count as a latency sample
+        self.assertEqual(self.server.requests, 3)
+        self.assertIsNone(down.latency)
+        self.assertGreater(down.score(), up.score())
+
+        # Alone, it is retried until its breaker opens
+        router = LLMRouter([down])
+        with self.assertRaises(NoProviderAvailable):
+            router.create(messages=self.messages)
+        self.assertEqual(down.state, 'open')
+        self.assertEqual(down.failures, 2)
+
+
+    @override_settings(
+        OPENAI_TIMEOUT=0.05, LLM_MAX_ATTEMPTS=2, LLM_BACKOFF_BASE=0.01
+    )
+    def test_client_timeout_bounds_attempts(self):
+        clients.close()
+        self.server.latency = 1.0
+        router = LLMRouter([self.provider('slow')])
+        with self.assertRaises(openai.APITimeoutError):
+            router.create(messages=self.messages)
+        # One request per attempt: the clients do not retry on their own
+        self.assertEqual(self.server.requests, 2)
+
+    def test_half_open_trial(self):
+        provider = self.provider('flaky')
+        provider.state = 'open'
+        provider.opened_at = time.monotonic() - 61
+        router = LLMRouter([provider])
+        router.create(messages=self.messages)
+        self.assertEqual(provider.state, 'closed')
+        self.assertEqual(provider.failures, 0)
+
+    def test_bad_requests_do_not_count(self):
+        router = LLMRouter([self.provider('main')])
+        with mock.patch.object(
+            router.providers[0].client.chat.completions, 'create',
+            side_effect=openai.BadRequestError(
+                'Bad request',
+                response=httpx.Response(
+                    400, request=httpx.Request('POST', self.server.base_url)
+                ),
+                body=None,
+            ),
+        ), self.assertRaises(openai.BadRequestError):
+            router.create(messages=self.messages)
+        self.assertEqual(router.providers[0].failures, 0)
+        self.assertEqual(router.providers[0].error_rate, 0)
+
+    def test_only_successes_measure_latency(self):
+        provider = self.provider('main')
+        router = LLMRouter([provider])
+        router._record(provider, 1.0, ok=True)
+        router._record(provider, 120.0, ok=False)
+        self.assertEqual(provider.latency, 1.0)
+        self.assertGreater(provider.error_rate, 0)
+
+    def test_async_create(self):
+        router = LLMRouter([
+            self.provider('down', unused_base_url()), self.provider('up'),
+        ])
+
+        async def run():
+            response = await router.acreate(messages=self.messages)
+            return response.model
+
+        self.assertEqual(asyncio.run(run()), 'up-model')
+
+
+class ThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='throttle@example.com',
+            password='throttle',
+            first_name='Blog',
+            last_name='Throttle',
+        )
+
+    def setUp(self):
+        rates = {**GCRAThrottle.THROTTLE_RATES, 'generation': '3/minute'}
+        self.enterContext(
+            mock.patch.object(GCRAThrottle, 'THROTTLE_RATES', rates)
+        )
+
+    def allow(self, urls=None):
+        """Run a fresh throttle, as another worker process would"""
+        request = SimpleNamespace(
+            user=self.user,
+            data={'urls': urls} if urls else {},
+            _request=SimpleNamespace(),
+        )
+        throttle = GenerationRateThrottle()
+        return throttle.allow_request(request, SimpleNamespace()), throttle
+
+    def test_burst_then_waits(self):
+        for remaining in (2, 1, 0):
+            allowed, throttle = self.allow()
+            self.assertTrue(allowed)
+            self.assertEqual(throttle.remaining, remaining)
+        allowed, throttle = self.allow()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 20, delta=1)
+        self.assertEqual(ThrottleState.objects.count(), 1)
+
+    def test_batch_larger_than_bucket(self):
+        self.allow()
+        allowed, _ = self.allow(urls=['a'] * 5)
+        self.assertFalse(allowed)
+
+        ThrottleState.objects.all().delete()
+        allowed, throttle = self.allow(urls=['a'] * 5)
+        self.assertTrue(allowed)
+        self.assertEqual(throttle.remaining, 0)
+        # Two tokens of debt, then one for the next request
+        allowed, throttle = self.allow()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 60, delta=1)
+
+    def test_existing_post_is_not_charged(self):
+        save_blog_post(self.user, 'throttled01', 'Video', {
+            'title': 'Existing', 'content': 'Body',
+        })
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for name in ('api:generate-blog', 'api:generate-blog-stream') * 2:
+            response = client.post(
+                reverse(name), {'url': canonical_url('throttled01')},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-RateLimit-Remaining'], '3')
+        tat = ThrottleState.objects.get(key__startswith='throttle_generation')
+        self.assertLessEqual(tat.tat, time.time())
+
+    def test_prunes_full_buckets(self):
+        ThrottleState.objects.create(key='stale', tat=time.time() - 10)
+        with mock.patch('api.throttling.PRUNE_INTERVAL', 1):
+            self.allow()
+        self.assertFalse(ThrottleState.objects.filter(key='stale').exists())
+
+
+@skipUnless(governor.fcntl, "needs fcntl")
+class GovernorTests(SimpleTestCase):
+    messages = [{'role': 'user', 'content': 'Write a post'}]
+
+    def setUp(self):
+        self.state_dir = self.enterContext(tempfile.TemporaryDirectory())
+
+    def governor(self, name='main', **limits):
+        """A governor as another worker process would build it"""
+        return Governor(
+            name, max_wait=0.1, state_dir=self.state_dir, **limits
+        )
+
+    def used_tokens(self, governor):
+        with governor._locked_window(time.time()) as window:
+            return sum(entry[1] for entry in window)
+
+    def test_window_is_shared_between_processes(self):
+        first = self.governor(requests_per_minute=2)
+        second = self.governor(requests_per_minute=2)
+        first.acquire(1)
+        second.acquire(1)
+        with self.assertRaises(CapacityTimeout):
+            first.acquire(1)
+        # Other providers have their own window
+        self.governor('other', requests_per_minute=2).acquire(1)
+
+    def test_settle_frees_tokens_for_other_processes(self):
+        first = self.governor(tokens_per_minute=100)
+        second = self.governor(tokens_per_minute=100)
+        admission = first.acquire(80)
+        with self.assertRaises(CapacityTimeout):
+            second.acquire(50)
+        admission.settle(10)
+        second.acquire(50)
+        self.assertEqual(self.used_tokens(first), 60)
+
+    def test_fails_over_when_out_of_capacity(self):
+        server = self.enterContext(FakeLLMServer(latency=0.01))
+        self.addCleanup(clients.close)
+
+        def provider(name):
+            return Provider.from_config({
+                'name': name,
+                'base_url': server.base_url,
+                'api_key': 'test-key',
+                'model': f'{name}-model',
+                'requests_per_minute': 1,
+            })
+
+        with override_settings(LLM_GOVERNOR_MAX_WAIT=0.1,
+                               LLM_GOVERNOR_DIR=self.state_dir):
+            busy, free = provider('busy'), provider('free')
+        busy.governor.acquire(1)
+        router = LLMRouter([busy, free])
+        response = router.create(messages=self.messages)
+        self.assertEqual(response.model, 'free-model')
+        self.assertEqual(busy.failures, 0)
+        # With every provider out of capacity the call gives up
+        with self.assertRaises(CapacityTimeout):
+            router.create(messages=self.messages)
+
+    def test_settles_streams(self):
+        server = self.enterContext(
+            FakeLLMServer(latency=0.01, completion_tokens=20)
+        )
+        self.addCleanup(clients.close)
+        with override_settings(LLM_GOVERNOR_DIR=self.state_dir):
+            provider = Provider.from_config({
+                'name': 'main',
+                'base_url': server.base_url,
+                'api_key': 'test-key',
+                'model': 'main-model',
+                'tokens_per_minute': 100000,
+            })
+        router = LLMRouter([provider])
+
+        stream = router.create(
+            messages=self.messages, max_tokens=5000, stream=True,
+            stream_options={'include_usage': True},
+        )
+        self.assertGreater(self.used_tokens(provider.governor), 5000)
+        usage = [chunk.usage for chunk in stream if chunk.usage]
+        self.assertEqual(
+            self.used_tokens(provider.governor), usage[0].total_tokens
+        )
+
+        # Closed early, a stream is settled to what it received
+        stream = router.create(
+            messages=self.messages, max_tokens=5000, stream=True,
+        )
+        next(iter(stream))
+        stream.close()
+        self.assertLess(
+            self.used_tokens(provider.governor), usage[0].total_tokens + 100
+        )
+
+
+class BenchmarkTests(SimpleTestCase):
+    def run_command(self, *args):
+        """Run a benchmark command in its own process and return its JSON.
+
+        Benchmarks create their own throwaway database, which cannot be
+        nested in the test database.
+        """
+        output = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        output = output / 'results.json'
+        completed = subprocess.run(
+            [sys.executable, 'manage.py', *args, '--output', str(output)],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        return json.loads(output.read_text())
+
+    def test_percentiles(self):
+        samples = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(samples, 50), 0.05)
+        self.assertEqual(percentile(samples, 99), 0.099)
+        self.assertEqual(percentile([], 50), 0.0)
+        summary = summarize(samples)
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['p95_ms'], 95.0)
+        self.assertEqual(summary['max_ms'], 100.0)
+        self.assertEqual(summarize([]), {'count': 0})
+
+    def test_offline_youtube(self):
+        import yt_dlp
+        from youtube_transcript_api import YouTubeTranscriptApi
+
+        with offline_youtube(transcript_chars=700):
+            info = yt_dlp.YoutubeDL().extract_info(
+                canonical_url('benchvid001'), download=False
+            )
+            segments = YouTubeTranscriptApi.get_transcript('benchvid001')
+        self.assertEqual(info['title'], 'Benchmark video benchvid001')
+        self.assertEqual(segments, fake_transcript(100, 11))
+        words = sum(len(segment['text'].split()) for segment in segments)
+        self.assertGreaterEqual(words, 100)
+
+    def test_fake_llm_streams(self):
+        server = self.enterContext(FakeLLMServer(latency=0.01))
+        self.addCleanup(clients.close)
+        client = clients.get_openai_client('test-key', server.base_url)
+        stream = client.chat.completions.create(
+            model='fake', messages=[{'role': 'user', 'content': 'Hi'}],
+            max_tokens=20, stream=True,
+            stream_options={'include_usage': True},
+        )
+        chunks = list(stream)
+        content = ''.join(
+            chunk.choices[0].delta.content for chunk in chunks
+            if chunk.choices
+        )
+        self.assertEqual(json.loads(content)['title'], 'Benchmark post')
+        self.assertEqual(chunks[-1].usage.completion_tokens, 20)
+        self.assertEqual(server.requests, 1)
+
+    def test_generate_harness(self):
+        results = self.run_command(
+            'bench_generate', '--requests', '4', '--concurrency', '2',
+            '--users', '2', '--llm-latency', '0.01', '--youtube-latency',
+            '0', '--completion-tokens', '40', '--transcript-chars', '700',
+        )
+        self.assertEqual(results['config']['requests'], 4)
+        self.assertEqual(
+            set(results['endpoints']), {'generate', 'list', 'detail'}
+        )
+        for result in results['endpoints'].values():
+            self.assertEqual(result['errors'], 0)
+            self.assertEqual(result['latency']['count'], 4)
+        # Every generation reached the fake LLM server
+        self.assertEqual(results['llm_requests'], 4)
+
+
+async def inline_blocking(func, *args, **kwargs):
+    """run_blocking on the test thread, which sees the test transaction"""
+    return await sync_to_async(func)(*args, **kwargs)
+
+
+class AsyncGenerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='async@example.com',
+            password='async',
+            first_name='Blog',
+            last_name='Async',
+        )
+
+    def setUp(self):
+        self.server = self.enterContext(
+            FakeLLMServer(latency=0.01, completion_tokens=40)
+        )
+        self.enterContext(offline_youtube(transcript_chars=700))
+        self.enterContext(override_settings(
+            LLM_PROVIDERS=[{
+                'name': 'fake',
+                'base_url': self.server.base_url,
+                'api_key': 'test-key',
+                'model': 'fake-model',
+            }],
+            SINGLE_FLIGHT_LOCK_DIR=self.enterContext(
+                tempfile.TemporaryDirectory()
+            ),
+        ))
+        for module in ('api.views', 'api.services'):
+            self.enterContext(
+                mock.patch(f'{module}.run_blocking', inline_blocking)
+            )
+        # Async clients belong to the event loop of the request that made
+        # them, and the test client runs each request on a new loop
+        for reset in (clients.close, reset_router):
+            reset()
+            self.addCleanup(reset)
+
+    def post(self, authenticated=True, **data):
+        client = APIClient()
+        if authenticated:
+            token = RefreshToken.for_user(self.user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client.post(
+            reverse('api:generate-blog-async'),
+            {'url': canonical_url('asyncvid001'), **data},
+            format='json',
+        )
+
+    def test_generates_post(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['blog_title'], 'Benchmark post')
+        self.assertEqual(self.server.requests, 1)
+        post = BlogPost.objects.get(user=self.user, video_id='asyncvid001')
+        self.assertEqual(post.youtube_title, 'Benchmark video asyncvid001')
+        usage = GenerationUsage.objects.get(blog_post=post)
+        self.assertEqual(usage.model, 'fake-model')
+        self.assertEqual(response['X-RateLimit-Remaining'], '9')
+
+    def test_returns_existing_post(self):
+        save_blog_post(self.user, 'asyncvid001', 'Video', {
+            'title': 'Existing', 'content': 'Body',
+        })
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['blog_title'], 'Existing')
+        self.assertEqual(self.server.requests, 0)
+
+        response = self.post(regen='true')
+        self.assertEqual(response.json()['blog_title'], 'Benchmark post')
+        self.assertEqual(self.server.requests, 1)
+
+    def test_background_queues_job(self):
+        response = self.post(background='true')
+        self.assertEqual(response.status_code, 202)
+        job = GenerationJob.objects.get(pk=response.json()['id'])
+        self.assertEqual(job.youtube_url, canonical_url('asyncvid001'))
+        self.assertEqual(self.server.requests, 0)
+
+    def test_errors(self):
+        response = self.post(authenticated=False)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+        self.assertEqual(self.post(url='not a url').status_code, 400)
+
+        with mock.patch('api.services.check_quota',
+                        side_effect=QuotaExceeded):
+            self.assertEqual(self.post().status_code, 429)
+
+        rates = {**GCRAThrottle.THROTTLE_RATES, 'generation': '1/hour'}
+        with mock.patch.object(GCRAThrottle, 'THROTTLE_RATES', rates):
+            ThrottleState.objects.all().delete()
+            self.assertEqual(self.post().status_code, 200)
+            response = self.post(url=canonical_url('asyncvid002'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3600')
+
+    def test_agenerate_blog_post(self):
+        post = async_to_sync(agenerate_blog_post)(
+            self.user, canonical_url('asyncvid002'), 'brief'
+        )
+        self.assertEqual(post.video_id, 'asyncvid002')
+        self.assertEqual(post.body.content.split('\n')[0], '# Benchmark')
+        self.assertEqual(self.server.requests, 1)
+
+
+@override_settings(
+    BLOG_REFERENCE_MAX_TOKENS=300,
+    EXTRACTIVE_MAX_RATIO=2,
+    TRANSCRIPT_CHUNK_CHARS=3000,
+    SUMMARY_CONCURRENCY=1,
+    MONTHLY_TOKEN_QUOTA=1000000,
+)
+class UsageRecordingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='usage@example.com',
+            password='usage',
+            first_name='Blog',
+            last_name='Usage',
+        )
+
+    def setUp(self):
+        self.enterContext(override_settings(
+            SINGLE_FLIGHT_LOCK_DIR=self.enterContext(
+                tempfile.TemporaryDirectory()
+            ),
+        ))
+        self.router = mock.Mock()
+        self.enterContext(
+            mock.patch('api.services.get_router', return_value=self.router)
+        )
+        self.enterContext(mock.patch.object(
+            BlogGenerator, 'get_transcript_segments',
+            return_value=transcript_segments(400),
+        ))
+        self.enterContext(mock.patch.object(
+            BlogGenerator, 'get_video_info', return_value={'title': 'Video'}
+        ))
+
+    def answer(self, blog):
+        """Summaries succeed, the blog call returns or raises blog"""
+        def create(role='blog', **kwargs):
+            if role == 'summary':
+                return completion('A short summary.')
+            if isinstance(blog, Exception):
+                raise blog
+            return blog
+        self.router.create.side_effect = create
+
+    def assertBilled(self, tokens, generations=0):
+        usage = GenerationUsage.objects.get(user=self.user)
+        self.assertIsNone(usage.blog_post)
+        self.assertEqual(usage.prompt_tokens + usage.completion_tokens, tokens)
+        month = MonthlyTokenUsage.objects.get(user=self.user)
+        self.assertEqual(month.prompt_tokens + month.completion_tokens, tokens)
+        self.assertEqual(month.generations, generations)
+
+    def test_unparseable_completion_is_billed(self):
+        self.answer(completion('not json'))
+        with self.assertRaises(ValueError), \
+                self.assertLogs('api.services', 'ERROR'):
+            generate_blog_post(self.user, canonical_url('usagevid001'))
+        # Every call, the blog call included, reported 15 tokens
+        self.assertBilled(15 * self.router.create.call_count)
+
+    def test_summaries_are_billed_when_the_blog_call_fails(self):
+        self.answer(RuntimeError('Provider down'))
+        with self.assertRaises(ValueError), \
+                self.assertLogs('api.services', 'ERROR'):
+            generate_blog_post(self.user, canonical_url('usagevid001'))
+        self.assertBilled(15 * (self.router.create.call_count - 1))
+
+    def test_failed_stream_is_billed(self):
+        chunks = [
+            SimpleNamespace(model='test-model', usage=None, choices=[
+                SimpleNamespace(delta=SimpleNamespace(content='not json')),
+            ]),
+            SimpleNamespace(
+                model='test-model',
+                usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+                choices=[],
+            ),
+        ]
+        stream = mock.MagicMock()
+        stream.__iter__.return_value = iter(chunks)
+        self.answer(stream)
+        events = stream_blog_post(self.user, canonical_url('usagevid001'))
+        with self.assertRaises(ValueError), \
+                self.assertLogs('api.services', 'ERROR'):
+            list(events)
+        stream.close.assert_called_once()
+        self.assertBilled(15 * self.router.create.call_count)
+
+    def test_nothing_billed_without_calls(self):
+        self.answer(completion('unused'))
+        with mock.patch.object(
+            BlogGenerator, 'get_transcript_segments',
+            side_effect=ValueError('No transcript'),
+        ), self.assertRaises(ValueError):
+            generate_blog_post(self.user, canonical_url('usagevid001'))
+        self.assertFalse(GenerationUsage.objects.exists())
+        self.assertFalse(MonthlyTokenUsage.objects.exists())
+
+    def test_stream_checks_quota_before_streaming(self):
+        MonthlyTokenUsage.objects.create(
+            user=self.user, month=timezone.now().date().replace(day=1),
+            prompt_tokens=settings.MONTHLY_TOKEN_QUOTA,
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            reverse('api:generate-blog-stream'),
+            {'url': canonical_url('usagevid001')},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.streaming)
+        self.assertEqual(
+            response.json(), {'error': 'Monthly token quota exceeded'}
+        )
+        self.router.create.assert_not_called()
+
+
+class PolicyTests(SimpleTestCase):
+    def reference(self, tokens):
+        """Distinct sentences of just over tokens tokens in all"""
+        sentences = []
+        for segment in transcript_segments(tokens):
+            sentences.append(segment['text'])
+            if count_tokens(' '.join(sentences)) > tokens:
+                return ' '.join(sentences)
+
+    def test_tier_by_reference_tokens(self):
+        for tokens, tier, role in [
+            (100, 'short', 'fast'),
+            (1000, 'medium', 'blog'),
+            (3000, 'long', 'blog'),
+        ]:
+            reference = self.reference(tokens)
+            policy = choose_policy(reference)
+            self.assertEqual(policy.tier, tier)
+            self.assertEqual(policy.role, role)
+            self.assertEqual(policy.input_tokens, count_tokens(reference))
+
+    @override_settings(BLOG_MAX_OUTPUT_TOKENS=5000)
+    def test_depth_scales_output_budget(self):
+        reference = self.reference(100)
+        self.assertEqual(choose_policy(reference, 'brief').max_tokens, 1000)
+        self.assertEqual(choose_policy(reference).max_tokens, 2000)
+        self.assertEqual(choose_policy(reference, 'detailed').max_tokens, 3000)
+        long_reference = self.reference(3000)
+        self.assertEqual(
+            choose_policy(long_reference, 'detailed').max_tokens, 5000
+        )
+        with override_settings(BLOG_DEPTH_FACTORS={'brief': 0.01}):
+            self.assertEqual(choose_policy(reference, 'brief').max_tokens, 256)
+
+    def test_encoding_is_loaded_once(self):
+        self.addCleanup(load_encoding)
+        encoding = mock.Mock(**{'encode.return_value': [1, 2, 3]})
+        with mock.patch('api.policy.tiktoken') as tiktoken_module:
+            tiktoken_module.get_encoding.return_value = encoding
+            self.assertIs(load_encoding(), encoding)
+            for _ in range(3):
+                self.assertEqual(count_tokens('Hello there, world'), 3)
+        tiktoken_module.get_encoding.assert_called_once()
+
+    def test_unloadable_encoding_falls_back_to_estimate(self):
+        self.addCleanup(load_encoding)
+        with mock.patch('api.policy.tiktoken') as tiktoken_module, \
+                self.assertLogs('api.policy', 'WARNING'):
+            tiktoken_module.get_encoding.side_effect = OSError('Offline')
+            self.assertIsNone(load_encoding())
+        # Hello, there, the comma and world
+        self.assertEqual(count_tokens('Hello there, world'), 4)
+
+    def test_blog_request_measures_whole_reference(self):
+        reference = self.reference(3000)
+        self.assertGreater(len(reference), 8000)
+        generator = BlogGenerator(router=mock.Mock())
+        request = generator.blog_request(reference, 'Title', 'standard')
+        self.assertEqual(request['role'], 'blog')
+        self.assertEqual(request['max_tokens'], 6000)
+        self.assertIn(reference, request['messages'][1]['content'])
+
+    def test_depth_field(self):
+        for serializer_class, data in [
+            (BlogRequestSerializer, {'url': canonical_url('policyvid01')}),
+            (BatchBlogRequestSerializer,
+             {'urls': [canonical_url('policyvid01')]}),
+            (PlaylistRequestSerializer,
+             {'url': 'https://www.youtube.com/playlist?list=PL123'}),
+        ]:
+            serializer = serializer_class(data=data)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            self.assertEqual(serializer.validated_data['depth'], 'standard')
+            serializer = serializer_class(data={**data, 'depth': 'huge'})
+            self.assertFalse(serializer.is_valid())
+            self.assertIn('depth', serializer.errors)
+
+
+class CompressionTests(SimpleTestCase):
+    def sentences(self):
+        return compress_segments(fake_transcript(3000, seed=5))
+
+    @skipUnless(compression.np, "needs numpy")
+    def test_numpy_ranking_matches_python(self):
+        documents = [_terms(sentence) for sentence in self.sentences()]
+        # A sentence without terms scores 0 either way
+        documents.append([])
+        fast = _centrality_numpy(documents)
+        slow = _centrality_python(documents)
+        self.assertEqual(len(fast), len(slow))
+        for fast_score, slow_score in zip(fast, slow):
+            self.assertAlmostEqual(fast_score, slow_score, places=9)
+
+        def ranking(scores):
+            return sorted(
+                range(len(scores)), key=lambda i: -round(scores[i], 9)
+            )
+
+        self.assertEqual(ranking(fast), ranking(slow))
+
+    @skipUnless(compression.np, "needs numpy")
+    def test_selection_does_not_depend_on_numpy(self):
+        sentences = self.sentences()
+        selected = select_sentences(sentences, 500)
+        with mock.patch.object(compression, 'np', None):
+            self.assertEqual(select_sentences(sentences, 500), selected)
+        self.assertLessEqual(count_tokens(' '.join(selected)), 500)
+
+    def test_compress_harness(self):
+        output = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        output = output / 'results.json'
+        call_command(
+            'bench_compress', words=3000, iterations=1, max_tokens=500,
+            output=str(output), stdout=io.StringIO(),
+        )
+        results = json.loads(output.read_text())
+        self.assertEqual(results['numpy'], compression.np is not None)
+        self.assertLessEqual(results['tokens']['selected'], 500)
+        self.assertLess(
+            results['tokens']['compressed'], results['tokens']['original']
+        )
+
+
+@override_settings(PREFETCH_MAX_PENDING=3, PREFETCH_MAX_PENDING_PER_USER=2)
+class PrefetchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='prefetch@example.com',
+            password='prefetch',
+            first_name='Blog',
+            last_name='Prefetch',
+        )
+
+    def setUp(self):
+        # Nothing runs, so every queued video stays pending
+        self.executor = mock.Mock()
+        self.enterContext(mock.patch.object(
+            prefetch, '_get_executor', return_value=self.executor
+        ))
+        prefetch.reset()
+        self.addCleanup(prefetch.reset)
+
+    def test_caps_each_user(self):
+        self.assertEqual(prefetch.prefetch('prefetch001', 1), prefetch.QUEUED)
+        self.assertEqual(prefetch.prefetch('prefetch001', 2), prefetch.PENDING)
+        self.assertEqual(prefetch.prefetch('prefetch002', 1), prefetch.QUEUED)
+        self.assertEqual(prefetch.prefetch('prefetch003', 1), prefetch.DROPPED)
+        # Other users keep their share until the whole queue is full
+        self.assertEqual(prefetch.prefetch('prefetch003', 2), prefetch.QUEUED)
+        self.assertEqual(prefetch.prefetch('prefetch004', 3), prefetch.DROPPED)
+        self.assertEqual(self.executor.submit.call_count, 3)
+
+    def test_finished_prefetch_frees_the_slot(self):
+        prefetch.prefetch('prefetch001', 1)
+        prefetch.prefetch('prefetch002', 1)
+        with mock.patch.object(prefetch, 'BlogGenerator'):
+            prefetch._warm('prefetch001')
+        self.assertEqual(prefetch.prefetch('prefetch003', 1), prefetch.QUEUED)
+
+    def test_view(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for video_id, expected in [
+            ('prefetch001', 'queued'),
+            ('prefetch002', 'queued'),
+            ('prefetch003', 'dropped'),
+        ]:
+            response = client.post(
+                reverse('api:prefetch'),
+                {'url': f'https://youtu.be/{video_id}?t=10'},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['status'], expected)
+        self.executor.submit.assert_called_with(
+            prefetch._warm, 'prefetch002'
+        )
+
+
+def stream_chunks(*deltas):
+    """A completion stream as the OpenAI client returns it, usage last"""
+    chunks = [
+        SimpleNamespace(model='test-model', usage=None, choices=[
+            SimpleNamespace(delta=SimpleNamespace(content=delta)),
+        ])
+        for delta in deltas
+    ]
+    chunks.append(SimpleNamespace(
+        model='test-model',
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        choices=[],
+    ))
+    stream = mock.MagicMock()
+    stream.__iter__.return_value = iter(chunks)
+    return stream
+
+
+def parse_events(body):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class StreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='stream@example.com',
+            password='stream',
+            first_name='Blog',
+            last_name='Stream',
+        )
+
+    def setUp(self):
+        self.enterContext(override_settings(
+            SINGLE_FLIGHT_LOCK_DIR=self.enterContext(
+                tempfile.TemporaryDirectory()
+            ),
+        ))
+        self.router = mock.Mock()
+        self.enterContext(
+            mock.patch('api.services.get_router', return_value=self.router)
+        )
+        # Short enough to be sent as it is, without summary calls
+        self.enterContext(mock.patch.object(
+            BlogGenerator, 'get_transcript_segments',
+            return_value=transcript_segments(20),
+        ))
+        self.enterContext(mock.patch.object(
+            BlogGenerator, 'get_video_info', return_value={'title': 'Video'}
+        ))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self):
+        return self.client.post(
+            reverse('api:generate-blog-stream'),
+            {'url': canonical_url('streamvid01')},
+            format='json',
+        )
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return parse_events(b''.join(response.streaming_content).decode())
+
+    def test_relays_deltas_then_done(self):
+        self.router.create.return_value = stream_chunks(
+            '{"title": "Streamed", ', '"content": "# Heading\\n\\nBody"}'
+        )
+        response = self.post()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+
+        events = self.read(response)
+        self.assertEqual(events[:2], [
+            ('delta', {'content': '{"title": "Streamed", '}),
+            ('delta', {'content': '"content": "# Heading\\n\\nBody"}'}),
+        ])
+        self.assertEqual(len(events), 3)
+        event, post = events[2]
+        self.assertEqual(event, 'done')
+        self.assertEqual(post['blog_title'], 'Streamed')
+        self.assertEqual(post['content'], '# Heading\n\nBody')
+        self.assertTrue(BlogPost.objects.filter(
+            user=self.user, video_id='streamvid01', blog_title='Streamed'
+        ).exists())
+        self.router.create.return_value.close.assert_called_once()
+
+    def test_existing_post_is_done_at_once(self):
+        self.router.create.return_value = stream_chunks(
+            '{"title": "Streamed", "content": "Body"}'
+        )
+        self.read(self.post())
+        events = self.read(self.post())
+        self.assertEqual([event for event, _ in events], ['done'])
+        self.assertEqual(self.router.create.call_count, 1)
+
+    def test_unparseable_answer_ends_with_error(self):
+        self.router.create.return_value = stream_chunks('not json')
+        with self.assertLogs('api', 'ERROR'):
+            events = self.read(self.post())
+        self.assertEqual(events, [
+            ('delta', {'content': 'not json'}),
+            ('error', {'error': 'Error generating blog post'}),
+        ])
+        self.assertFalse(BlogPost.objects.exists())
+
+    def test_crash_ends_with_error(self):
+        with mock.patch.object(
+            BlogGenerator, 'get_transcript_segments',
+            side_effect=RuntimeError('Boom'),
+        ), self.assertLogs('api.views', 'ERROR'):
+            events = self.read(self.post())
+        self.assertEqual(events, [
+            ('error', {'error': 'An unexpected error occurred'}),
+        ])
+
+    def test_disconnect_closes_upstream(self):
+        stream = stream_chunks('{"title": ', '"Never", ', '"content": ""}')
+        self.router.create.return_value = stream
+        response = self.post()
+        content = iter(response.streaming_content)
+        self.assertEqual(
+            parse_events(next(content).decode()),
+            [('delta', {'content': '{"title": '})],
+        )
+        # What the server does when the client goes away
+        response.close()
+        stream.close.assert_called_once()
+        self.assertFalse(BlogPost.objects.exists())
+
+    def test_closing_generator_closes_upstream(self):
+        stream = stream_chunks('{"title": ', '"Never", ', '"content": ""}')
+        self.router.create.return_value = stream
+        events = stream_blog_post(self.user, canonical_url('streamvid01'))
+        self.assertEqual(next(events), ('delta', '{"title": '))
+        events.close()
+        stream.close.assert_called_once()
+        self.assertFalse(BlogPost.objects.exists())
@@ -0,0 +1,217 @@
+"""Per-user rate limits shared by every worker process.
+
+Limits are enforced with GCRA, the token bucket expressed as a single
+timestamp: each client key stores the theoretical arrival time (TAT) of
+its next request in a ``ThrottleState`` row. A request is admitted by one
+conditional UPDATE that moves the TAT only if it is still within the
+burst, so concurrent requests in any process can never overdraw a bucket.
+A rate of "10/hour" allows a burst of 10 requests, then one more every 6
+minutes. A request costing more than the whole burst, such as a large
+batch, is admitted only with a full bucket and leaves it in debt, so the
+next requests wait until it is paid off.
+
+Every throttle records its state on the request, and
+``RateLimitHeadersMiddleware`` reports the most restrictive one in
+``X-RateLimit-*`` headers. Rejected requests get DRF's 429 response with
+``Retry-After``. Views that end up doing no work give the tokens back with
+``refund()``.
+"""
+import math
+import time
+from itertools import count
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import ThrottleState
+
+# Rows of full buckets are deleted once every this many admitted requests
+PRUNE_INTERVAL = 1000
+_admitted = count(1)
+
+
+class GCRAThrottle(SimpleRateThrottle):
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        # Rates are resolved per request in allow_request, as the scope
+        # may depend on the view
+        pass
+
+    def get_scope(self, request, view) -> str:
+        return self.scope
+
+    def get_cost(self, request, view) -> int:
+        """Tokens taken by this request"""
+        return 1
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(request, view)
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.interval = self.duration / self.num_requests
+        burst = self.duration
+        self.cost = self.interval * self.get_cost(request, view)
+        # How far the TAT may be ahead of now for this request to pass
+        slack = max(0.0, burst - self.cost)
+
+        now = time.time()
+        allowed, tat = self._take(now, slack)
+        if allowed:
+            self.wait_seconds = 0.0
+            if next(_admitted) % PRUNE_INTERVAL == 0:
+                ThrottleState.objects.filter(tat__lt=now).delete()
+        else:
+            self.wait_seconds = tat - slack - now
+        self.reset_seconds = tat - now
+        self.remaining = max(0, int((burst - (tat - now)) // self.interval))
+        self._record(request, charged=allowed)
+        return allowed
+
+    def _take(self, now: float, slack: float):
+        """Charge the key if its TAT is within slack of now.
+
+        Returns whether the request was admitted and the key's TAT after.
+        """
+        states = ThrottleState.objects.filter(key=self.key)
+        charge = Greatest(F('tat'), Value(now)) + self.cost
+        allowed = bool(
+            states.filter(tat__lte=now + slack).update(tat=charge)
+        )
+        tat = states.values_list('tat', flat=True).first()
+        if tat is None:
+            try:
+                with transaction.atomic():
+                    ThrottleState.objects.create(
+                        key=self.key, tat=now + self.cost
+                    )
+                return True, now + self.cost
+            except IntegrityError:
+                # Created by a concurrent request
+                allowed = bool(
+                    states.filter(tat__lte=now + slack).update(tat=charge)
+                )
+                tat = states.values_list('tat', flat=True).get()
+        return allowed, max(tat, now)
+
+    def refund(self, request):
+        """Give back the tokens this request took"""
+        ThrottleState.objects.filter(key=self.key).update(
+            tat=F('tat') - self.cost
+        )
+        self.reset_seconds = max(0.0, self.reset_seconds - self.cost)
+        self.remaining = min(
+            self.num_requests,
+            self.remaining + round(self.cost / self.interval),
+        )
+        self._record(request, charged=False)
+
+    def _record(self, request, charged: bool):
+        """Keep this throttle's state, and itself if charged, on the request"""
+        request = getattr(request, '_request', request)
+        if not hasattr(request, 'rate_limits'):
+            request.rate_limits = {}
+            request.throttles = {}
+        request.rate_limits[self.scope] = {
+            'limit': self.num_requests,
+            'remaining': self.remaining,
+            'reset': math.ceil(self.reset_seconds),
+        }
+        if charged:
+            request.throttles[self.scope] = self
+        else:
+            request.throttles.pop(self.scope, None)
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserRateThrottle(GCRAThrottle):
+    """Overall request limit per user, or per IP address when anonymous.
+
+    Views with ``throttle_scope = 'admin'`` draw from the separate, larger
+    admin bucket instead.
+    """
+    scope = 'user'
+
+    def get_scope(self, request, view):
+        if getattr(view, 'throttle_scope', None) == 'admin':
+            return 'admin'
+        return 'user'
+
+
+class GenerationRateThrottle(GCRAThrottle):
+    """Blog generations per user; a batch costs one token per URL.
+
+    Requests answered with a post the user already has get their token back
+    through refund_generation().
+    """
+    scope = 'generation'
+
+    def get_cost(self, request, view):
+        urls = request.data.get('urls') if hasattr(request.data, 'get') else None
+        if isinstance(urls, list) and urls:
+            return len(urls)
+        return 1
+
+
+class PrefetchRateThrottle(GCRAThrottle):
+    """Transcript prefetches per user"""
+    scope = 'prefetch'
+
+
+def refund_generation(request):
+    """Give back the generation tokens of a request that generated nothing"""
+    request = getattr(request, '_request', request)
+    throttle = getattr(request, 'throttles', {}).get('generation')
+    if throttle is not None:
+        throttle.refund(request)
+
+
+class RateLimitHeadersMiddleware:
+    """Add X-RateLimit-* headers for the tightest throttle of the request.
+
+    Works in both sync and async stacks, so ASGI requests to async views
+    are not pushed onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        states = getattr(request, 'rate_limits', None)
+        if states:
+            state = min(states.values(), key=lambda state: state['remaining'])
+            response['X-RateLimit-Limit'] = str(state['limit'])
+            response['X-RateLimit-Remaining'] = str(state['remaining'])
+            response['X-RateLimit-Reset'] = str(state['reset'])
+        return response
@@ -1,9 +1,16 @@
 from django.urls import path
 from .views import (
+    AsyncGenerateBlogView,
+    BatchGenerateBlogView,
     GenerateBlogView,
     BlogListView,
     BlogDeleteView,
-    BlogDetailView
+    BlogDetailView,
+    BlogSearchView,
+    GenerationJobDetailView,
+    PlaylistGenerateBlogView,
+    PrefetchView,
+    StreamBlogView,
 )
 
 app_name = 'api'
@@ -14,11 +21,46 @@ urlpatterns = [
         GenerateBlogView.as_view(),
         name='generate-blog'
     ),
+    path(
+        'generate-from-youtube/async/',
+        AsyncGenerateBlogView.as_view(),
+        name='generate-blog-async'
+    ),
+    path(
+        'generate-from-youtube/batch/',
+        BatchGenerateBlogView.as_view(),
+        name='generate-blog-batch'
+    ),
+    path(
+        'generate-from-youtube/playlist/',
+        PlaylistGenerateBlogView.as_view(),
+        name='generate-blog-playlist'
+    ),
+    path(
+        'generate-from-youtube/stream/',
+        StreamBlogView.as_view(),
+        name='generate-blog-stream'
+    ),
+    path(
+        'prefetch/',
+        PrefetchView.as_view(),
+        name='prefetch'
+    ),
+    path(
+        'jobs/<int:pk>/',
+        GenerationJobDetailView.as_view(),
+        name='generation-job-detail'
+    ),
     path(
         'my-blogs/',
         BlogListView.as_view(),
         name='blog-list'
     ),
+    path(
+        'my-blogs/search/',
+        BlogSearchView.as_view(),
+        name='blog-search'
+    ),
     path(
         'my-blogs/<int:pk>/',
         BlogDetailView.as_view(),
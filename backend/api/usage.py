@@ -0,0 +1,151 @@
+"""Token accounting and monthly quotas per user.
+
+Every generation stores its tokens and latency in a ``GenerationUsage`` row
+(failed ones too, without a post, for the calls they made),
+and adds them to the user's ``MonthlyTokenUsage`` counters with a single
+UPDATE, so totals are never recomputed from the history. The quota check
+before a generation is one indexed lookup of the current month's counters.
+"""
+import threading
+import time
+from datetime import date
+from typing import Iterable, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import GenerationUsage, MonthlyTokenUsage
+
+
+class QuotaExceeded(Exception):
+    """The user has used up this month's token quota"""
+
+
+class Usage:
+    """Tokens used by one generation, summed over all of its LLM calls"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.model = ''
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, model: str, usage):
+        """Add an API response's usage block; chunk summaries run on threads"""
+        if usage is None:
+            return
+        with self._lock:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+            self.model = model or self.model
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def latency_ms(self) -> int:
+        return round((time.perf_counter() - self.started) * 1000)
+
+
+def current_month() -> date:
+    return timezone.now().date().replace(day=1)
+
+
+def check_quota(user):
+    """Raise QuotaExceeded when the user may not start another generation"""
+    quota = settings.MONTHLY_TOKEN_QUOTA
+    if not quota or user.is_superuser:
+        return
+    used = MonthlyTokenUsage.objects.filter(
+        user=user,
+        month=current_month(),
+    ).values_list(F('prompt_tokens') + F('completion_tokens'), flat=True)
+    used = next(iter(used), 0)
+    if used >= quota:
+        raise QuotaExceeded(
+            f"Monthly token quota of {quota} exhausted ({used} used)"
+        )
+
+
+def charge(user, usage: Usage, generations: int = 1):
+    """Add a generation's tokens to the user's counters for this month"""
+    month = current_month()
+    increments = {
+        'prompt_tokens': F('prompt_tokens') + usage.prompt_tokens,
+        'completion_tokens': F('completion_tokens') + usage.completion_tokens,
+        'generations': F('generations') + generations,
+    }
+    if MonthlyTokenUsage.objects.filter(user=user, month=month).update(
+        **increments
+    ):
+        return
+    try:
+        with transaction.atomic():
+            MonthlyTokenUsage.objects.create(
+                user=user,
+                month=month,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                generations=generations,
+            )
+    except IntegrityError:
+        # Another request created this month's row first
+        MonthlyTokenUsage.objects.filter(user=user, month=month).update(
+            **increments
+        )
+
+
+def log_generations(user, entries: Iterable[Tuple[str, object, Usage]]):
+    """Store one GenerationUsage row per (video_id, post, usage)"""
+    GenerationUsage.objects.bulk_create([
+        GenerationUsage(
+            user=user,
+            blog_post=post,
+            video_id=video_id,
+            model=usage.model,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            latency_ms=usage.latency_ms,
+        )
+        for video_id, post, usage in entries
+    ])
+
+
+def record_generation(user, video_id: str, post, usage: Usage):
+    """Log a generation and charge its tokens to the user.
+
+    post is None for a generation that failed: the tokens of the calls it
+    made are still logged and charged, but it does not count as a
+    generation. One that failed before any LLM call records nothing.
+    """
+    if post is None and not usage.total_tokens:
+        return
+    log_generations(user, [(video_id, post, usage)])
+    charge(user, usage, generations=int(post is not None))
+
+
+def monthly_totals() -> dict:
+    """Token totals of all users for the current month"""
+    month = current_month()
+    rows = MonthlyTokenUsage.objects.filter(month=month)
+    totals = rows.aggregate(
+        prompt_tokens=Sum('prompt_tokens'),
+        completion_tokens=Sum('completion_tokens'),
+        generations=Sum('generations'),
+    )
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals['total_tokens'] = (
+        totals['prompt_tokens'] + totals['completion_tokens']
+    )
+    quota = settings.MONTHLY_TOKEN_QUOTA
+    totals['quota'] = quota
+    totals['users_over_quota'] = 0
+    if quota:
+        totals['users_over_quota'] = rows.annotate(
+            used=F('prompt_tokens') + F('completion_tokens')
+        ).filter(used__gte=quota).count()
+    return totals
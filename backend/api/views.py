@@ -1,4 +1,13 @@
+import hmac
+import json
+import logging
+import math
+
 from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, Throttled
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
@@ -9,15 +18,54 @@ from rest_framework.generics import (
 )
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, get_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from .models import BlogPost
+from . import jobs, prefetch
+from .clients import run_blocking
+from .conditional import (
+    ConditionalGetMixin,
+    collection_validators,
+    post_validators,
+)
+from .metrics import REGISTRY
+from .models import BlogPost, GenerationJob
+from .pagination import BlogCursorPagination, BlogSearchPagination
+from .rendering import choose_encoding, stored_response
+from .search import search_posts
 from .serializers import (
+    BatchBlogRequestSerializer,
     BlogRequestSerializer,
     BlogResponseSerializer,
-    BlogListSerializer
+    BlogListSerializer,
+    BlogSearchRequestSerializer,
+    BlogSearchResultSerializer,
+    GenerationJobSerializer,
+    PlaylistRequestSerializer,
+    PrefetchRequestSerializer,
+    PrefetchResponseSerializer,
+)
+from .services import (
+    agenerate_blog_post,
+    generate_blog_post,
+    stream_blog_post,
+)
+from .throttling import (
+    GenerationRateThrottle,
+    PrefetchRateThrottle,
+    UserRateThrottle,
+    refund_generation,
 )
-from .services import BlogGenerator
+from .usage import QuotaExceeded, check_quota
+from .youtube import canonical_url, extract_video_id
+
+logger = logging.getLogger(__name__)
+
+QUOTA_EXCEEDED = {"error": "Monthly token quota exceeded"}
 
 
 def api_root_redirect(request):
@@ -25,19 +73,48 @@ def api_root_redirect(request):
     return redirect('swagger-ui')
 
 
+def metrics_view(request):
+    """Expose generation metrics in the Prometheus text format.
+
+    Requires "Authorization: Bearer <METRICS_TOKEN>" unless DEBUG is on and
+    no token is configured.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(),
+            f"Bearer {token}".encode(),
+        )
+    else:
+        allowed = settings.DEBUG
+    if not allowed:
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+
+    return HttpResponse(
+        REGISTRY.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 class GenerateBlogView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserRateThrottle, GenerationRateThrottle]
 
     @extend_schema(
         tags=["Blog Generation"],
         request=BlogRequestSerializer,
         responses={
             200: BlogResponseSerializer,
+            202: GenerationJobSerializer,
             400: OpenApiResponse(
                 description="Invalid input",
                 response={"type": "object"}
             ),
             401: OpenApiResponse(description="Authentication failed"),
+            429: OpenApiResponse(
+                description="Rate limited or monthly token quota exceeded",
+                response={"type": "object"}
+            ),
             500: OpenApiResponse(
                 description="Server error",
                 response={"type": "object"}
@@ -45,7 +122,9 @@ class GenerateBlogView(APIView):
         },
         description=(
             "Generate a blog post from a YouTube video. If a blog post exists "
-            "and regen=true, it will overwrite the existing post."
+            "and regen=true, it will overwrite the existing post. With "
+            "background=true the work is queued and a job is returned with "
+            "status 202; poll the job endpoint for the result."
         ),
         summary="Generate blog post from YouTube video",
     )
@@ -59,45 +138,39 @@ class GenerateBlogView(APIView):
 
         url = serializer.validated_data["url"]
         regen = serializer.validated_data["regen"]
+        background = serializer.validated_data["background"]
 
-        # Check for existing blog post
+        # Check for existing blog post; unordered, so that the lookup uses
+        # the (user, video_id) index rather than walking the user's posts
         existing_post = BlogPost.objects.filter(
-            youtube_url=url,
+            video_id=extract_video_id(url),
             user=request.user
-        ).first()
+        ).select_related('body').order_by().first()
         
         if existing_post and not regen:
+            refund_generation(request)
             return Response(BlogResponseSerializer(existing_post).data)
 
-        try:
-            generator = BlogGenerator(settings.OPENAI_API_KEY)
-            
-            # Get video info and generate blog
-            video_info = generator.get_video_info(url)
-            transcript = generator.get_transcript(video_info['video_id'])
-            blog_data = generator.generate_blog(
-                transcript,
-                video_info['title']
-            )
-
-            # Always use update_or_create
-            blog_post, _ = BlogPost.objects.update_or_create(
-                youtube_url=url,
-                user=request.user,
-                defaults={
-                    'youtube_title': video_info['title'],
-                    'blog_title': blog_data['title'],
-                    'content': blog_data['content'],
-                    'author_name': (
-                        f"{request.user.first_name} "
-                        f"{request.user.last_name}".strip() or
-                        request.user.email
-                    )
-                }
+        if background:
+            job = jobs.enqueue(
+                request.user, url, depth=serializer.validated_data["depth"]
+            )
+            return Response(
+                GenerationJobSerializer(job).data,
+                status=status.HTTP_202_ACCEPTED
             )
 
+        try:
+            blog_post = generate_blog_post(
+                request.user, url, serializer.validated_data["depth"]
+            )
             return Response(BlogResponseSerializer(blog_post).data)
 
+        except QuotaExceeded:
+            return Response(
+                QUOTA_EXCEEDED,
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
         except ValueError as e:
             # Log the detailed error for debugging
             print(f"Blog Generation Error: {str(e)}")
@@ -114,9 +187,392 @@ class GenerateBlogView(APIView):
             )
 
 
-class BlogListView(ListAPIView):
+class AsyncGenerateBlogView(View):
+    """GenerateBlogView for ASGI servers.
+
+    DRF views only run synchronously, so this is a plain async Django view
+    that applies the same authentication, throttles and serializers itself.
+    While the LLM call is awaited the request holds no thread, so one ASGI
+    worker can keep hundreds of generations in flight.
+    """
+    authentication_classes = [JWTAuthentication]
+    throttle_classes = [UserRateThrottle, GenerationRateThrottle]
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Authentication is by bearer token, as on the DRF views
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def initial(self, request) -> Request:
+        """Authenticate, throttle and parse the request; blocking"""
+        drf_request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[
+                authenticator() for authenticator in self.authentication_classes
+            ],
+        )
+        if not drf_request.user or not drf_request.user.is_authenticated:
+            raise NotAuthenticated()
+
+        waits = [
+            throttle.wait()
+            for throttle in (cls() for cls in self.throttle_classes)
+            if not throttle.allow_request(drf_request, self)
+        ]
+        if waits:
+            raise Throttled(max(waits))
+        # Parse the body here as well, so a malformed one is a ParseError
+        drf_request.data
+        return drf_request
+
+    @staticmethod
+    def error_response(exc: APIException) -> JsonResponse:
+        response = JsonResponse(
+            {"detail": str(exc.detail)},
+            status=exc.status_code
+        )
+        if isinstance(exc, Throttled) and exc.wait is not None:
+            response["Retry-After"] = str(math.ceil(exc.wait))
+        if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+            response["WWW-Authenticate"] = 'Bearer realm="api"'
+        return response
+
+    async def post(self, request):
+        try:
+            drf_request = await run_blocking(self.initial, request)
+        except APIException as e:
+            return self.error_response(e)
+
+        serializer = BlogRequestSerializer(data=drf_request.data)
+        if not serializer.is_valid():
+            return JsonResponse(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user = drf_request.user
+        url = serializer.validated_data["url"]
+        regen = serializer.validated_data["regen"]
+        background = serializer.validated_data["background"]
+
+        existing_post = await BlogPost.objects.filter(
+            video_id=extract_video_id(url),
+            user=user
+        ).select_related('body').order_by().afirst()
+
+        if existing_post and not regen:
+            await run_blocking(refund_generation, drf_request)
+            return JsonResponse(BlogResponseSerializer(existing_post).data)
+
+        if background:
+            job = await run_blocking(
+                jobs.enqueue, user, url,
+                depth=serializer.validated_data["depth"],
+            )
+            return JsonResponse(
+                GenerationJobSerializer(job).data,
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        try:
+            blog_post = await agenerate_blog_post(
+                user, url, serializer.validated_data["depth"]
+            )
+            return JsonResponse(BlogResponseSerializer(blog_post).data)
+
+        except QuotaExceeded:
+            return JsonResponse(
+                QUOTA_EXCEEDED,
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        except ValueError:
+            logger.exception("Async generation of %s failed", url)
+            return JsonResponse(
+                {"error": "Error generating blog post"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception:
+            logger.exception("Async generation of %s crashed", url)
+            return JsonResponse(
+                {"error": "An unexpected error occurred"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class BatchGenerateBlogView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserRateThrottle, GenerationRateThrottle]
+
+    @extend_schema(
+        tags=["Blog Generation"],
+        request=BatchBlogRequestSerializer,
+        responses={
+            202: GenerationJobSerializer,
+            400: OpenApiResponse(
+                description="Invalid input",
+                response={"type": "object"}
+            ),
+            401: OpenApiResponse(description="Authentication failed"),
+        },
+        description=(
+            "Queue blog generation for several YouTube videos. Videos are "
+            "fetched and generated as a pipeline with bounded concurrency. "
+            "Poll the returned job for progress; each of its results reports "
+            "whether the post was created, updated, already existed or "
+            "failed."
+        ),
+        summary="Generate blog posts from many YouTube videos",
+    )
+    def post(self, request):
+        serializer = BatchBlogRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job = jobs.enqueue(
+            request.user,
+            kind=GenerationJob.KIND_BATCH,
+            depth=serializer.validated_data["depth"],
+            urls=serializer.validated_data["urls"],
+            regen=serializer.validated_data["regen"],
+        )
+        return Response(
+            GenerationJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class PlaylistGenerateBlogView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserRateThrottle, GenerationRateThrottle]
+
+    @extend_schema(
+        tags=["Blog Generation"],
+        request=PlaylistRequestSerializer,
+        responses={
+            202: GenerationJobSerializer,
+            400: OpenApiResponse(
+                description="Invalid input",
+                response={"type": "object"}
+            ),
+            401: OpenApiResponse(description="Authentication failed"),
+        },
+        description=(
+            "Queue blog generation for every video of a playlist or channel. "
+            "Videos you already have a blog post for are skipped. Poll the "
+            "returned job for progress and per-video results."
+        ),
+        summary="Generate blog posts from a playlist or channel",
+    )
+    def post(self, request):
+        serializer = PlaylistRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job = jobs.enqueue(
+            request.user,
+            serializer.validated_data["url"],
+            kind=GenerationJob.KIND_PLAYLIST,
+            depth=serializer.validated_data["depth"],
+        )
+        return Response(
+            GenerationJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class PrefetchView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserRateThrottle, PrefetchRateThrottle]
+
+    @extend_schema(
+        tags=["Blog Generation"],
+        request=PrefetchRequestSerializer,
+        responses={
+            202: PrefetchResponseSerializer,
+            400: OpenApiResponse(
+                description="Invalid input",
+                response={"type": "object"}
+            ),
+            401: OpenApiResponse(description="Authentication failed"),
+            429: OpenApiResponse(description="Rate limited"),
+        },
+        description=(
+            "Fetch a video's title and transcript in the background so that "
+            "a following generate request only waits for the LLM. Returns "
+            "immediately. Prefetches are deduplicated per video and dropped "
+            "when the server is busy; generation works the same either way."
+        ),
+        summary="Prefetch a YouTube video's transcript",
+    )
+    def post(self, request):
+        serializer = PrefetchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        video_id = serializer.validated_data["url"]
+        return Response(
+            {
+                "video_id": video_id,
+                "url": canonical_url(video_id),
+                "status": prefetch.prefetch(video_id, request.user.pk),
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+class StreamBlogView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserRateThrottle, GenerationRateThrottle]
+
+    @extend_schema(
+        tags=["Blog Generation"],
+        request=BlogRequestSerializer,
+        responses={
+            (200, "text/event-stream"): OpenApiResponse(
+                description=(
+                    "Server-Sent Events: 'delta' events carry content "
+                    "fragments as {\"content\": ...}, followed by one "
+                    "'done' event with the stored blog post or an 'error' "
+                    "event"
+                )
+            ),
+            400: OpenApiResponse(
+                description="Invalid input",
+                response={"type": "object"}
+            ),
+            401: OpenApiResponse(description="Authentication failed"),
+            429: OpenApiResponse(
+                description="Rate limited or monthly token quota exceeded",
+                response={"type": "object"}
+            ),
+        },
+        description=(
+            "Generate a blog post from a YouTube video and stream the "
+            "model output as it is produced. The post is stored once the "
+            "stream completes. Disconnecting cancels the generation."
+        ),
+        summary="Stream blog post generation",
+    )
+    def post(self, request):
+        serializer = BlogRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        url = serializer.validated_data["url"]
+        regen = serializer.validated_data["regen"]
+        depth = serializer.validated_data["depth"]
+        user = request.user
+
+        existing_post = BlogPost.objects.filter(
+            video_id=extract_video_id(url),
+            user=user
+        ).select_related('body').order_by().first()
+        if existing_post and not regen:
+            refund_generation(request)
+        else:
+            # Once the stream has started the status is 200, so refuse
+            # here rather than with an error event
+            try:
+                check_quota(user)
+            except QuotaExceeded:
+                return Response(
+                    QUOTA_EXCEEDED,
+                    status=status.HTTP_429_TOO_MANY_REQUESTS
+                )
+
+        def event_stream():
+            if existing_post and not regen:
+                yield sse_event(
+                    "done", BlogResponseSerializer(existing_post).data
+                )
+                return
+
+            # Closing this generator on client disconnect closes
+            # stream_blog_post, which in turn closes the upstream stream
+            events = stream_blog_post(user, url, depth)
+            try:
+                for event, payload in events:
+                    if event == "delta":
+                        yield sse_event("delta", {"content": payload})
+                    else:
+                        yield sse_event(
+                            "done", BlogResponseSerializer(payload).data
+                        )
+            except QuotaExceeded:
+                yield sse_event("error", QUOTA_EXCEEDED)
+            except ValueError:
+                logger.exception("Streamed generation of %s failed", url)
+                yield sse_event(
+                    "error", {"error": "Error generating blog post"}
+                )
+            except Exception:
+                logger.exception("Streamed generation of %s crashed", url)
+                yield sse_event(
+                    "error", {"error": "An unexpected error occurred"}
+                )
+            finally:
+                events.close()
+
+        response = StreamingHttpResponse(
+            event_stream(),
+            content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class GenerationJobDetailView(RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = GenerationJobSerializer
+    lookup_field = 'pk'
+
+    @extend_schema(
+        tags=["Blog Generation"],
+        responses={
+            200: GenerationJobSerializer,
+            401: OpenApiResponse(description="Authentication failed"),
+            404: OpenApiResponse(description="Job not found"),
+        },
+        description=(
+            "Get the state of a background generation job. Once the job has "
+            "succeeded the generated blog post is included."
+        ),
+        summary="Get generation job status",
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """Only allow users to view their own jobs"""
+        return GenerationJob.objects.filter(
+            user=self.request.user
+        ).select_related('blog_post__body')
+
+
+class BlogListView(ConditionalGetMixin, ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = BlogListSerializer
+    pagination_class = BlogCursorPagination
 
     @extend_schema(
         tags=["Blog Posts"],
@@ -125,18 +581,85 @@ class BlogListView(ListAPIView):
             401: OpenApiResponse(description="Authentication failed"),
         },
         description="""
-        List all your blog posts.
+        List your blog posts, newest first.
         
-        Returns a collection of blog posts that you have generated, including:
+        Returns a page of blog posts that you have generated, including:
         - Blog titles
         - Original YouTube video titles
         - Author information
         - Creation and update timestamps
+
+        Follow the `next` link for older posts. `page_size` sets the number
+        of posts per page, up to the server's maximum.
+
+        Responses carry an `ETag` and `Last-Modified`; send them back in
+        `If-None-Match` or `If-Modified-Since` to get a 304 when none of
+        your posts changed.
         """,
         summary="Your Blog Collection",
     )
     def get_queryset(self):
-        return BlogPost.objects.filter(user=self.request.user)
+        # Only the listed columns; bodies live in another table anyway
+        return BlogPost.objects.filter(
+            user=self.request.user
+        ).values(*BlogListSerializer.Meta.fields)
+
+    def get_validators(self, request):
+        return collection_validators(request.user)
+
+    def list(self, request, *args, **kwargs):
+        # The rows are already plain dicts, and the JSON renderer formats
+        # them exactly as BlogListSerializer would, so skip the serializer
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(page)
+
+
+class BlogSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+    pagination_class = BlogSearchPagination
+
+    @extend_schema(
+        tags=["Blog Posts"],
+        parameters=[BlogSearchRequestSerializer],
+        responses={
+            200: BlogSearchResultSerializer(many=True),
+            400: OpenApiResponse(
+                description="Invalid input",
+                response={"type": "object"}
+            ),
+            401: OpenApiResponse(description="Authentication failed"),
+        },
+        description="""
+        Search your blog posts by words in the blog title, the video title
+        or the post itself.
+
+        Posts with every word in the blog title come first, then posts
+        with every word in the video title, then the rest, newest first
+        within each. Each result has the blog list fields plus the
+        highlighted title and the best matching passage of the post.
+
+        Follow the `next` link for more results; `page_size` sets the
+        number of results per page, up to the server's maximum.
+        """,
+        summary="Search Your Blogs",
+    )
+    def get(self, request):
+        serializer = BlogSearchRequestSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        query = serializer.validated_data["q"]
+        paginator = self.pagination_class()
+        page = paginator.paginate_search(
+            lambda limit, offset: search_posts(
+                request.user, query, limit, offset
+            ),
+            request,
+        )
+        return paginator.get_paginated_response(page)
 
 
 class BlogDeleteView(DestroyAPIView):
@@ -162,10 +685,11 @@ class BlogDeleteView(DestroyAPIView):
         return BlogPost.objects.filter(user=self.request.user)
 
 
-class BlogDetailView(RetrieveAPIView):
+class BlogDetailView(ConditionalGetMixin, RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = BlogResponseSerializer
     lookup_field = 'pk'
+    vary_headers = ['Authorization', 'Accept-Encoding']
 
     @extend_schema(
         tags=["Blog Posts"],
@@ -180,9 +704,31 @@ class BlogDetailView(RetrieveAPIView):
         
         Returns the full content of a blog post if you are the author.
         Includes the blog content, metadata, and author information.
+
+        Responses carry an `ETag` and `Last-Modified`; send them back in
+        `If-None-Match` or `If-Modified-Since` to get a 304 when the post
+        did not change.
         """,
         summary="View Blog Post",
     )
     def get_queryset(self):
         """Only allow users to view their own blogs"""
-        return BlogPost.objects.filter(user=self.request.user)
+        return BlogPost.objects.filter(
+            user=self.request.user
+        ).select_related('body')
+
+    def get_validators(self, request, pk):
+        return post_validators(request.user, pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Clients that accept an encoding stored at save time get those
+        # bytes, which hold the JSON the serializer would produce
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        body = None
+        if encoding and request.accepted_media_type == JSONRenderer.media_type:
+            body = stored_response(request.user, kwargs['pk'], encoding)
+        if body is None:
+            return super().retrieve(request, *args, **kwargs)
+        response = HttpResponse(body, content_type=JSONRenderer.media_type)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,95 @@
+"""Offline parsing of YouTube URLs.
+
+Every URL form users paste (watch pages, youtu.be links, shorts, embeds,
+with or without timestamps and tracking parameters) is reduced to the
+11-character video id without touching the network. Playlist and channel
+links are normalized to the page yt-dlp should enumerate.
+"""
+import re
+from urllib.parse import parse_qs, urlsplit
+
+# Use fullmatch: "$" would also match before a trailing newline
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+
+YOUTUBE_HOSTS = {
+    'youtube.com',
+    'www.youtube.com',
+    'm.youtube.com',
+    'music.youtube.com',
+    'youtube-nocookie.com',
+    'www.youtube-nocookie.com',
+}
+SHORT_HOSTS = {'youtu.be', 'www.youtu.be'}
+
+# Path prefixes that are followed directly by the video id
+PATH_PREFIXES = ('shorts', 'embed', 'v', 'e', 'live')
+
+# Path prefixes of channel pages, followed by the channel name or id
+CHANNEL_PREFIXES = ('channel', 'c', 'user')
+CHANNEL_TABS = ('videos', 'shorts', 'streams')
+
+
+def extract_video_id(url: str) -> str:
+    """Return the video id for a YouTube video URL.
+
+    Raises ValueError for URLs that do not point at a single video.
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = f'https://{url}'
+
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    segments = [segment for segment in parts.path.split('/') if segment]
+
+    candidate = None
+    if host in SHORT_HOSTS:
+        candidate = segments[0] if segments else None
+    elif host in YOUTUBE_HOSTS:
+        if segments[:1] == ['watch']:
+            candidate = parse_qs(parts.query).get('v', [None])[0]
+        elif len(segments) >= 2 and segments[0] in PATH_PREFIXES:
+            candidate = segments[1]
+
+    if candidate and VIDEO_ID_RE.fullmatch(candidate):
+        return candidate
+    raise ValueError(f"Not a YouTube video URL: {url}")
+
+
+def collection_url(url: str) -> str:
+    """Return the URL to enumerate for a playlist or channel URL.
+
+    Playlist links (including watch links inside a playlist) become the
+    playlist page; channel links without a tab point at their uploads.
+    Raises ValueError for anything else.
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = f'https://{url}'
+
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    segments = [segment for segment in parts.path.split('/') if segment]
+    if host not in YOUTUBE_HOSTS or not segments:
+        raise ValueError(f"Not a YouTube playlist or channel URL: {url}")
+
+    playlist_id = parse_qs(parts.query).get('list', [None])[0]
+    if playlist_id and segments[0] in ('playlist', 'watch'):
+        return f'https://www.youtube.com/playlist?list={playlist_id}'
+
+    if segments[0].startswith('@'):
+        channel = segments[:1]
+    elif segments[0] in CHANNEL_PREFIXES and len(segments) >= 2:
+        channel = segments[:2]
+    else:
+        raise ValueError(f"Not a YouTube playlist or channel URL: {url}")
+
+    tab = segments[len(channel):len(channel) + 1] or ['videos']
+    if tab[0] not in CHANNEL_TABS:
+        tab = ['videos']
+    return 'https://www.youtube.com/' + '/'.join(channel + tab)
+
+
+def canonical_url(video_id: str) -> str:
+    """Return the canonical watch URL for a video id"""
+    return f'https://www.youtube.com/watch?v={video_id}'
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import json
 from datetime import timedelta
 from os import getenv
 from pathlib import Path
@@ -63,6 +64,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.throttling.RateLimitHeadersMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -93,6 +95,14 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Generation runs on several threads and processes at once; take the
+        # write lock up front and wait for it instead of failing with
+        # "database is locked"
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+            "init_command": "PRAGMA journal_mode=WAL;",
+        },
     }
 }
 
@@ -167,6 +177,30 @@ REST_FRAMEWORK = {
     "DEFAULT_CONTENT_NEGOTIATION_CLASS": (
         "rest_framework.negotiation.DefaultContentNegotiation"
     ),
+    "DEFAULT_THROTTLE_CLASSES": [
+        "api.throttling.UserRateThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "user": getenv("THROTTLE_USER_RATE", "100/hour"),
+        "generation": getenv("THROTTLE_GENERATION_RATE", "10/hour"),
+        "admin": getenv("THROTTLE_ADMIN_RATE", "1000/hour"),
+        "prefetch": getenv("THROTTLE_PREFETCH_RATE", "60/hour"),
+    },
+}
+
+# Video titles live in the database so that they are shared by all worker
+# processes. The migrations create the cache table, as does
+# `manage.py createcachetable` after LOCATION changes. Rate limit state has
+# its own table (ThrottleState), also created by the migrations.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "video_info": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "api_video_info_cache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
 }
 
 SPECTACULAR_SETTINGS = {
@@ -341,6 +375,149 @@ OPENAI_API_KEY = getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = getenv("OPENAI_BASE_URL", "https://api.groq.com/openai/v1")
 OPENAI_MODEL = getenv("OPENAI_MODEL", "mixtral-8x7b-32768")
 
+# Transcripts are cleaned and deduplicated first. Those still longer than
+# BLOG_REFERENCE_MAX_TOKENS but within EXTRACTIVE_MAX_RATIO times that are
+# cut to their most central sentences; longer ones are split into chunks of
+# TRANSCRIPT_CHUNK_CHARS and summarized concurrently, again until the
+# summaries fit, then composed into a blog
+BLOG_REFERENCE_MAX_TOKENS = int(getenv("BLOG_REFERENCE_MAX_TOKENS", "1800"))
+EXTRACTIVE_MAX_RATIO = float(getenv("EXTRACTIVE_MAX_RATIO", "3"))
+TRANSCRIPT_CHUNK_CHARS = int(getenv("TRANSCRIPT_CHUNK_CHARS", "12000"))
+SUMMARY_CONCURRENCY = int(getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_MODEL = getenv("SUMMARY_MODEL", OPENAI_MODEL)
+# Faster, cheaper model for blogs about short videos; see GENERATION_TIERS
+FAST_MODEL = getenv("FAST_MODEL", "")
+
+# Tokens each user may spend per calendar month; 0 disables the quota.
+# Superusers are exempt.
+MONTHLY_TOKEN_QUOTA = int(getenv("MONTHLY_TOKEN_QUOTA", "0"))
+
+# LLM providers, tried in order of measured latency and error rate.
+# LLM_PROVIDERS is a JSON list of objects with "name", "base_url", "model",
+# optional "summary_model" and "fast_model", and either "api_key" or
+# "api_key_env" (the name of an environment variable holding the key).
+# Defaults to the single provider configured by the OPENAI_* settings above.
+LLM_PROVIDERS = json.loads(getenv("LLM_PROVIDERS", "[]")) or [{
+    "name": "default",
+    "base_url": OPENAI_BASE_URL,
+    "api_key": OPENAI_API_KEY,
+    "model": OPENAI_MODEL,
+    "summary_model": SUMMARY_MODEL,
+    "fast_model": FAST_MODEL,
+}]
+# Attempts per completion across all providers, with full-jitter
+# exponential backoff between attempts after transient errors
+LLM_MAX_ATTEMPTS = int(getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE = float(getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(getenv("LLM_BACKOFF_MAX", "8"))
+# A provider failing LLM_BREAKER_THRESHOLD calls in a row is skipped for
+# LLM_BREAKER_COOLDOWN seconds, then gets a single trial call
+LLM_BREAKER_THRESHOLD = int(getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Smoothing of the latency and error rate averages, and how strongly the
+# error rate counts against a provider's latency when ranking them
+LLM_EWMA_ALPHA = float(getenv("LLM_EWMA_ALPHA", "0.2"))
+LLM_ERROR_PENALTY = float(getenv("LLM_ERROR_PENALTY", "4"))
+# Model tier and output budget by size of the blog reference in tokens,
+# smallest tier first; a tier without max_input_tokens takes the rest. The
+# "fast" role uses each provider's fast_model, falling back to its model.
+# The requested depth scales max_tokens by BLOG_DEPTH_FACTORS, up to
+# BLOG_MAX_OUTPUT_TOKENS. Tokens are counted with tiktoken's
+# TOKENIZER_ENCODING, loaded at startup, and estimated if it fails to load.
+GENERATION_TIERS = json.loads(getenv("GENERATION_TIERS", "[]")) or [
+    {"name": "short", "max_input_tokens": 600, "role": "fast",
+     "max_tokens": 2000, "temperature": 0.8},
+    {"name": "medium", "max_input_tokens": 1500, "role": "blog",
+     "max_tokens": 4000, "temperature": 0.9},
+    {"name": "long", "role": "blog", "max_tokens": 6000, "temperature": 0.9},
+]
+BLOG_DEPTH_FACTORS = {"brief": 0.5, "standard": 1.0, "detailed": 1.5}
+BLOG_MAX_OUTPUT_TOKENS = int(getenv("BLOG_MAX_OUTPUT_TOKENS", "8000"))
+TOKENIZER_ENCODING = getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Default rate limits per provider, overridden by "tokens_per_minute" and
+# "requests_per_minute" in LLM_PROVIDERS; 0 means unlimited. The worker
+# processes of a host share them through files in LLM_GOVERNOR_DIR, so
+# divide the provider's limits by the number of hosts only. Calls over the
+# limit wait up to LLM_GOVERNOR_MAX_WAIT seconds, then try another provider.
+LLM_TOKENS_PER_MINUTE = int(getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_REQUESTS_PER_MINUTE = int(getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_GOVERNOR_MAX_WAIT = float(getenv("LLM_GOVERNOR_MAX_WAIT", "60"))
+LLM_GOVERNOR_DIR = getenv(
+    "LLM_GOVERNOR_DIR", str(BASE_DIR / "var" / "governor")
+)
+
+# Batch generation: URLs per request and concurrency of each pipeline stage
+BLOG_BATCH_MAX_URLS = int(getenv("BLOG_BATCH_MAX_URLS", "50"))
+BATCH_FETCH_CONCURRENCY = int(getenv("BATCH_FETCH_CONCURRENCY", "4"))
+BATCH_LLM_CONCURRENCY = int(getenv("BATCH_LLM_CONCURRENCY", "2"))
+PLAYLIST_MAX_VIDEOS = int(getenv("PLAYLIST_MAX_VIDEOS", "500"))
+
+# Concurrent generations of the same video are coalesced using lock files
+# in this directory, which must be shared by every worker process
+SINGLE_FLIGHT_LOCK_DIR = getenv(
+    "SINGLE_FLIGHT_LOCK_DIR", str(BASE_DIR / "var" / "locks")
+)
+
+# Prometheus metrics at /metrics, scraped with "Authorization: Bearer
+# <METRICS_TOKEN>". Set METRICS_DIR to a directory shared by all worker
+# processes to report host-wide totals instead of per-process values.
+# Snapshots of exited processes, and ones older than
+# METRICS_SNAPSHOT_MAX_AGE seconds, are deleted when metrics are scraped.
+METRICS_TOKEN = getenv("METRICS_TOKEN", "")
+METRICS_DIR = getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(getenv("METRICS_FLUSH_INTERVAL", "1"))
+METRICS_SNAPSHOT_MAX_AGE = float(getenv("METRICS_SNAPSHOT_MAX_AGE", "86400"))
+
+# Shared HTTP client settings for the OpenAI-compatible API. Clients do not
+# retry; the LLM router retries up to LLM_MAX_ATTEMPTS times instead.
+OPENAI_TIMEOUT = float(getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_CONNECTIONS = int(getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(
+    getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+OPENAI_KEEPALIVE_EXPIRY = float(getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+YTDL_POOL_SIZE = int(getenv("YTDL_POOL_SIZE", "4"))
+# Threads for blocking calls (yt-dlp, transcripts, ORM) made by async views
+BLOCKING_IO_WORKERS = int(getenv("BLOCKING_IO_WORKERS", "32"))
+
+# Background generation jobs
+# BLOG_JOB_EXECUTOR is "thread" or "process". With autodispatch off, jobs
+# stay queued until `manage.py run_generation_worker` picks them up.
+BLOG_JOB_EXECUTOR = getenv("BLOG_JOB_EXECUTOR", "thread")
+BLOG_JOB_WORKERS = int(getenv("BLOG_JOB_WORKERS", "4"))
+BLOG_JOB_AUTODISPATCH = getenv("BLOG_JOB_AUTODISPATCH", "true").lower() == "true"
+# Running jobs renew a lease every third of BLOG_JOB_LEASE_SECONDS; the
+# worker command requeues jobs whose lease expired, e.g. after a crash, and
+# fails them once they have been started BLOG_JOB_MAX_ATTEMPTS times
+BLOG_JOB_LEASE_SECONDS = int(getenv("BLOG_JOB_LEASE_SECONDS", "300"))
+BLOG_JOB_MAX_ATTEMPTS = int(getenv("BLOG_JOB_MAX_ATTEMPTS", "3"))
+
+# Posts per page of the blog list, and the most a client may ask for
+BLOG_LIST_PAGE_SIZE = int(getenv("BLOG_LIST_PAGE_SIZE", "20"))
+BLOG_LIST_MAX_PAGE_SIZE = int(getenv("BLOG_LIST_MAX_PAGE_SIZE", "100"))
+
+# Transcript cache: an in-process LRU in front of the CachedTranscript table
+TRANSCRIPT_LANGUAGE = getenv("TRANSCRIPT_LANGUAGE", "en")
+TRANSCRIPT_CACHE_TTL = int(getenv("TRANSCRIPT_CACHE_TTL", str(7 * 24 * 3600)))
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "256"))
+TRANSCRIPT_CACHE_MAX_ROWS = int(getenv("TRANSCRIPT_CACHE_MAX_ROWS", "10000"))
+TRANSCRIPT_CACHE_TRIM_INTERVAL = int(
+    getenv("TRANSCRIPT_CACHE_TRIM_INTERVAL", "50")
+)
+VIDEO_INFO_CACHE_TTL = int(getenv("VIDEO_INFO_CACHE_TTL", str(24 * 3600)))
+
+# Transcript prefetches run on PREFETCH_WORKERS threads per process. At most
+# PREFETCH_MAX_PENDING videos are queued or running, and at most
+# PREFETCH_MAX_PENDING_PER_USER of them for one user; further prefetches are
+# dropped until the queue drains.
+PREFETCH_WORKERS = int(getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_MAX_PENDING = int(getenv("PREFETCH_MAX_PENDING", "16"))
+PREFETCH_MAX_PENDING_PER_USER = int(
+    getenv("PREFETCH_MAX_PENDING_PER_USER", "2")
+)
+
 print("Debug: OpenAI Settings")
 print(f"Base URL: {OPENAI_BASE_URL}")
 print(f"Model: {OPENAI_MODEL}")
@@ -358,6 +535,22 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# Generation policy decisions and job failures are logged by the "api"
+# logger
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api": {
+            "handlers": ["console"],
+            "level": getenv("API_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -383,6 +576,8 @@ CORS_ALLOW_HEADERS = [
     "authorization",
     "content-type",
     "dnt",
+    "if-modified-since",
+    "if-none-match",
     "origin",
     "user-agent",
     "x-csrftoken",
@@ -393,6 +588,12 @@ CORS_ALLOW_HEADERS = [
 CORS_EXPOSE_HEADERS = [
     "content-type",
     "authorization",
+    "etag",
+    "last-modified",
+    "retry-after",
+    "x-ratelimit-limit",
+    "x-ratelimit-remaining",
+    "x-ratelimit-reset",
 ]
 
 # Make sure corsheaders middleware is at the top
@@ -405,6 +606,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.throttling.RateLimitHeadersMiddleware",
 ]
 
 # Add CORS_ORIGIN_ALLOW_ALL for development (optional)
@@ -7,6 +7,8 @@ from drf_spectacular.views import (
 )
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
 
+from api.views import metrics_view
+
 # Documentation endpoints
 docs_patterns = [
     path(
@@ -37,6 +39,7 @@ urlpatterns = [
     path("api/blog/", include("api.urls")),  # Blog endpoints
     path("api/auth/", include("accounts.urls")),  # Auth endpoints
     path("api/management/", include("management.urls")),  # Admin endpoints
+    path("metrics", metrics_view, name="metrics"),  # Prometheus scraping
     # Documentation
     *docs_patterns,
 ]
@@ -214,4 +214,15 @@ class StatisticsSerializer(serializers.Serializer):
     active_invites = serializers.IntegerField()
     blogs_this_month = serializers.IntegerField()
     users_this_month = serializers.IntegerField()
-    invite_usage = serializers.DictField() 
\ No newline at end of file
+    invite_usage = serializers.DictField()
+    transcript_cache = serializers.DictField(
+        help_text=(
+            "Transcript cache hit/miss counters for the serving process"
+        ),
+    )
+    token_usage = serializers.DictField(
+        help_text=(
+            "LLM tokens and generations of all users this month, the "
+            "monthly quota per user and how many users have reached it"
+        ),
+    )
@@ -15,7 +15,9 @@ from django.db.models import Count, F
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+from api.cache import transcript_cache
 from api.models import BlogPost
+from api.usage import monthly_totals
 from .models import InviteCode, UserBan, InviteCodeUsage
 from .serializers import (
     AdminUserSerializer,
@@ -31,6 +33,7 @@ User = get_user_model()
 
 class UserListView(ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
+    throttle_scope = 'admin'
     serializer_class = AdminUserSerializer
     queryset = User.objects.all()
 
@@ -71,6 +74,7 @@ class UserListView(ListCreateAPIView):
 
 class UserDetailView(RetrieveDestroyAPIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
+    throttle_scope = 'admin'
     serializer_class = AdminUserSerializer
     queryset = User.objects.all()
     lookup_field = "username"
@@ -106,6 +110,7 @@ class UserDetailView(RetrieveDestroyAPIView):
 
 class InviteCodeView(ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
+    throttle_scope = 'admin'
     serializer_class = InviteCodeSerializer
     queryset = InviteCode.objects.all()
 
@@ -146,6 +151,7 @@ class InviteCodeView(ListCreateAPIView):
 
 class UserBanView(CreateAPIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
+    throttle_scope = 'admin'
     serializer_class = UserBanSerializer
 
     @extend_schema(
@@ -170,6 +176,7 @@ class UserBanView(CreateAPIView):
 
 class InviteCodeDetailView(RetrieveDestroyAPIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
+    throttle_scope = 'admin'
     serializer_class = InviteCodeDetailSerializer
     queryset = InviteCode.objects.all()
     lookup_field = 'code'
@@ -220,6 +227,7 @@ class IsSuperUser(IsAuthenticated):
 
 class StatisticsView(APIView):
     permission_classes = [IsSuperUser]
+    throttle_scope = 'admin'
 
     @extend_schema(
         tags=["Admin"],
@@ -253,7 +261,9 @@ class StatisticsView(APIView):
             'users_this_month': User.objects.filter(
                 date_joined__gte=month_start
             ).count(),
-            'invite_usage': self._get_invite_usage()
+            'invite_usage': self._get_invite_usage(),
+            'transcript_cache': transcript_cache.stats(),
+            'token_usage': monthly_totals(),
         }
 
         return Response(StatisticsSerializer(stats).data)
@@ -195,9 +195,23 @@ export const blogApi = {
     }
   },
 
-  getMyBlogs: async () => {
+  // Warm the server's caches for a video the user is about to generate
+  // from. Best effort: failures only mean generation does the fetch itself.
+  prefetchVideo: async (url) => {
     try {
-      const response = await api.get('/blog/my-blogs/')
+      const response = await api.post('/blog/prefetch/', { url })
+      return response.data
+    } catch (error) {
+      console.debug('Prefetch skipped:', error.response?.status || error.message)
+      return null
+    }
+  },
+
+  getMyBlogs: async ({ pageParam = null } = {}) => {
+    try {
+      const response = await api.get('/blog/my-blogs/', {
+        params: pageParam ? { cursor: pageParam } : {},
+      })
       return response.data
     } catch (error) {
       console.error('Get blogs error:', error.response?.data || error.message)
@@ -205,6 +219,19 @@ export const blogApi = {
     }
   },
 
+  searchBlogs: async ({ queryKey, pageParam = 0 }) => {
+    const [, , q] = queryKey
+    try {
+      const response = await api.get('/blog/my-blogs/search/', {
+        params: pageParam ? { q, offset: pageParam } : { q },
+      })
+      return response.data
+    } catch (error) {
+      console.error('Search blogs error:', error.response?.data || error.message)
+      throw error
+    }
+  },
+
   deleteBlog: async (id) => {
     try {
       await api.delete(`/blog/my-blogs/${id}/`)
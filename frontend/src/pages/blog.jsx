@@ -116,38 +116,57 @@ function BlogPage() {
       {/* Blog Content */}
       <div className="prose prose-lg dark:prose-invert max-w-none">
         <div className="rounded-2xl border bg-card/50 p-8 backdrop-blur-sm">
-          <ReactMarkdown 
-            remarkPlugins={[remarkGfm]}
-            className="prose dark:prose-invert max-w-none"
-            components={{
-              h1: ({node, ...props}) => <h1 className="text-3xl font-bold mt-8 mb-4" {...props} />,
-              h2: ({node, ...props}) => <h2 className="text-2xl font-bold mt-6 mb-3" {...props} />,
-              h3: ({node, ...props}) => <h3 className="text-xl font-semibold mt-4 mb-2" {...props} />,
-              a: ({node, ...props}) => (
-                <a 
-                  className="text-primary hover:underline" 
-                  target="_blank" 
-                  rel="noopener noreferrer" 
-                  {...props} 
-                />
-              ),
-              code: ({node, inline, ...props}) => (
-                inline ? 
-                  <code className="bg-muted px-1.5 py-0.5 rounded text-sm" {...props} /> :
-                  <code className="block bg-muted p-4 rounded-lg text-sm" {...props} />
-              ),
-              blockquote: ({node, ...props}) => (
-                <blockquote 
-                  className="border-l-4 border-primary pl-4 italic my-4" 
-                  {...props} 
-                />
-              ),
-              ul: ({node, ...props}) => <ul className="list-disc pl-6 my-4" {...props} />,
-              ol: ({node, ...props}) => <ol className="list-decimal pl-6 my-4" {...props} />,
-            }}
-          >
-            {blog.content}
-          </ReactMarkdown>
+          {blog.html ? (
+            // Rendered and sanitized by the server when the post was saved
+            <div
+              className={[
+                'prose dark:prose-invert max-w-none',
+                '[&_h1]:text-3xl [&_h1]:font-bold [&_h1]:mt-8 [&_h1]:mb-4',
+                '[&_h2]:text-2xl [&_h2]:font-bold [&_h2]:mt-6 [&_h2]:mb-3',
+                '[&_h3]:text-xl [&_h3]:font-semibold [&_h3]:mt-4 [&_h3]:mb-2',
+                '[&_a]:text-primary [&_a:hover]:underline',
+                '[&_code]:bg-muted [&_code]:px-1.5 [&_code]:py-0.5 [&_code]:rounded [&_code]:text-sm',
+                '[&_pre_code]:block [&_pre_code]:p-4 [&_pre_code]:rounded-lg',
+                '[&_blockquote]:border-l-4 [&_blockquote]:border-primary [&_blockquote]:pl-4 [&_blockquote]:italic [&_blockquote]:my-4',
+                '[&_ul]:list-disc [&_ul]:pl-6 [&_ul]:my-4',
+                '[&_ol]:list-decimal [&_ol]:pl-6 [&_ol]:my-4',
+              ].join(' ')}
+              dangerouslySetInnerHTML={{ __html: blog.html }}
+            />
+          ) : (
+            <ReactMarkdown 
+              remarkPlugins={[remarkGfm]}
+              className="prose dark:prose-invert max-w-none"
+              components={{
+                h1: ({node, ...props}) => <h1 className="text-3xl font-bold mt-8 mb-4" {...props} />,
+                h2: ({node, ...props}) => <h2 className="text-2xl font-bold mt-6 mb-3" {...props} />,
+                h3: ({node, ...props}) => <h3 className="text-xl font-semibold mt-4 mb-2" {...props} />,
+                a: ({node, ...props}) => (
+                  <a 
+                    className="text-primary hover:underline" 
+                    target="_blank" 
+                    rel="noopener noreferrer" 
+                    {...props} 
+                  />
+                ),
+                code: ({node, inline, ...props}) => (
+                  inline ? 
+                    <code className="bg-muted px-1.5 py-0.5 rounded text-sm" {...props} /> :
+                    <code className="block bg-muted p-4 rounded-lg text-sm" {...props} />
+                ),
+                blockquote: ({node, ...props}) => (
+                  <blockquote 
+                    className="border-l-4 border-primary pl-4 italic my-4" 
+                    {...props} 
+                  />
+                ),
+                ul: ({node, ...props}) => <ul className="list-disc pl-6 my-4" {...props} />,
+                ol: ({node, ...props}) => <ol className="list-decimal pl-6 my-4" {...props} />,
+              }}
+            >
+              {blog.content}
+            </ReactMarkdown>
+          )}
         </div>
       </div>
 
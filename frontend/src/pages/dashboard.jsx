@@ -1,20 +1,47 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Youtube, Search, Filter, LayoutGrid, LayoutList, Loader2, ArrowRight } from 'lucide-react'
 import { Button } from '@/components/ui/button'
 import { blogApi } from '@/lib/api'
 import { toast } from 'react-hot-toast'
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
+import { useInfiniteQuery, useMutation, useQueryClient } from '@tanstack/react-query'
 import { format } from 'date-fns'
 import { useNavigate } from 'react-router-dom'
 import { useAuth } from '@/providers/auth-provider'
 
+// Watch, short, shorts and embed URLs with an 11 character video id
+const YOUTUBE_VIDEO_RE =
+  /^(?:https?:\/\/)?(?:(?:www|m|music)\.)?(?:youtube\.com\/(?:watch\?(?:.*&)?v=|shorts\/|embed\/|live\/)|youtu\.be\/)[\w-]{11}(?:[?&#/].*)?$/
+
 function DashboardPage() {
   const { user } = useAuth()
   const [url, setUrl] = useState('')
   const [isGridView, setIsGridView] = useState(true)
   const [searchTerm, setSearchTerm] = useState('')
+  const [query, setQuery] = useState('')
   const queryClient = useQueryClient()
 
+  // Search once the user stops typing
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(searchTerm.trim()), 300)
+    return () => clearTimeout(timer)
+  }, [searchTerm])
+  const isSearching = /\w/.test(query)
+
+  // Prefetch the video's transcript once a URL has been pasted or typed, so
+  // that generating only waits for the LLM
+  const prefetchedUrl = useRef('')
+  useEffect(() => {
+    const candidate = url.trim()
+    if (!YOUTUBE_VIDEO_RE.test(candidate) || candidate === prefetchedUrl.current) {
+      return
+    }
+    const timer = setTimeout(() => {
+      prefetchedUrl.current = candidate
+      blogApi.prefetchVideo(candidate)
+    }, 400)
+    return () => clearTimeout(timer)
+  }, [url])
+
   // Debug function to check admin status
   useEffect(() => {
     console.group('🔒 User Authorization Debug')
@@ -25,12 +52,36 @@ function DashboardPage() {
     console.groupEnd()
   }, [user])
 
-  // Fetch blogs
-  const { data: blogs = [], isLoading: isLoadingBlogs } = useQuery({
+  // Fetch blogs, newest first, one cursor page at a time
+  const {
+    data,
+    isLoading: isLoadingBlogs,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
     queryKey: ['blogs'],
     queryFn: blogApi.getMyBlogs,
+    initialPageParam: null,
+    getNextPageParam: (lastPage) =>
+      lastPage.next ? new URL(lastPage.next).searchParams.get('cursor') : undefined,
   })
 
+  // Search results, best matches first, one page at a time
+  const search = useInfiniteQuery({
+    queryKey: ['blogs', 'search', query],
+    queryFn: blogApi.searchBlogs,
+    enabled: isSearching,
+    initialPageParam: 0,
+    getNextPageParam: (lastPage) =>
+      lastPage.next ? new URL(lastPage.next).searchParams.get('offset') : undefined,
+  })
+
+  const active = isSearching
+    ? search
+    : { data, isLoading: isLoadingBlogs, fetchNextPage, hasNextPage, isFetchingNextPage }
+  const blogs = active.data?.pages.flatMap((page) => page.results) ?? []
+
   // Generate blog mutation
   const generateMutation = useMutation({
     mutationFn: blogApi.generateBlog,
@@ -86,12 +137,6 @@ function DashboardPage() {
     }
   }
 
-  // Filter blogs based on search term
-  const filteredBlogs = blogs.filter(blog => 
-    blog.blog_title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    blog.youtube_title.toLowerCase().includes(searchTerm.toLowerCase())
-  )
-
   return (
     <div className="container py-24 space-y-8">
       {/* Page Header */}
@@ -180,14 +225,14 @@ function DashboardPage() {
       </div>
 
       {/* Loading State */}
-      {isLoadingBlogs && (
+      {active.isLoading && (
         <div className="flex justify-center items-center py-12">
           <Loader2 className="h-8 w-8 animate-spin text-primary" />
         </div>
       )}
 
       {/* Empty State */}
-      {!isLoadingBlogs && filteredBlogs.length === 0 && (
+      {!active.isLoading && blogs.length === 0 && (
         <div className="text-center py-12">
           <p className="text-muted-foreground">No blog posts found.</p>
         </div>
@@ -195,7 +240,7 @@ function DashboardPage() {
 
       {/* Blog Posts Grid */}
       <div className={`grid gap-6 ${isGridView ? 'sm:grid-cols-2 lg:grid-cols-3' : 'grid-cols-1'}`}>
-        {filteredBlogs.map((blog) => (
+        {blogs.map((blog) => (
           <BlogPostCard 
             key={blog.id} 
             blog={blog} 
@@ -204,6 +249,26 @@ function DashboardPage() {
           />
         ))}
       </div>
+
+      {active.hasNextPage && (
+        <div className="flex justify-center">
+          <Button
+            variant="outline"
+            className="rounded-full px-6"
+            onClick={() => active.fetchNextPage()}
+            disabled={active.isFetchingNextPage}
+          >
+            {active.isFetchingNextPage ? (
+              <>
+                <Loader2 className="mr-2 h-4 w-4 animate-spin" />
+                Loading...
+              </>
+            ) : (
+              'Load more'
+            )}
+          </Button>
+        </div>
+      )}
     </div>
   )
 }
@@ -231,12 +296,26 @@ function BlogPostCard({ blog, isGridView, onDelete }) {
           </div>
 
           <div>
-            <h3 className="font-semibold line-clamp-2 text-lg mb-2">
-              {blog.blog_title}
-            </h3>
+            {/* Search results come HTML-escaped, with matches in <mark> tags */}
+            {blog.title_highlight ? (
+              <h3
+                className="font-semibold line-clamp-2 text-lg mb-2"
+                dangerouslySetInnerHTML={{ __html: blog.title_highlight }}
+              />
+            ) : (
+              <h3 className="font-semibold line-clamp-2 text-lg mb-2">
+                {blog.blog_title}
+              </h3>
+            )}
             <p className="text-sm text-muted-foreground line-clamp-3 mb-4">
               Original Video: {blog.youtube_title}
             </p>
+            {blog.snippet && (
+              <p
+                className="text-sm text-muted-foreground line-clamp-3 mb-4"
+                dangerouslySetInnerHTML={{ __html: blog.snippet }}
+              />
+            )}
           </div>
         </div>
 